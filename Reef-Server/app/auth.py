@@ -1,23 +1,41 @@
-import httpx
+"""Supabase JWT verification.
+
+Verified tokens are cached: clients send the same access token on every
+request until it expires (about an hour), so after the first request a
+token costs one SHA-256 and a dict lookup instead of an ES256/RS256
+signature check. The cache is keyed by the token's hash, bounded to
+``TOKEN_CACHE_SIZE`` entries (least recently used evicted first), and an
+entry is dropped once its ``exp`` has passed.
+
+Signing keys come from the Supabase JWKS endpoint, fetched with the
+shared async httpx client — never a blocking fetch on the event loop.
+``start_jwks_refresh`` (app lifespan) re-fetches them every
+``JWKS_REFRESH_SECONDS``; a token signed with an unknown ``kid`` (key
+rotation) triggers an immediate refresh, at most once per
+``JWKS_MIN_REFETCH_SECONDS`` so garbage tokens can't hammer Supabase.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
 import jwt
 from fastapi import Depends, HTTPException, WebSocket, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jwt import PyJWKClient
 
 from app.config import settings
+from app.services.http_pool import get_client as get_http
 
-security = HTTPBearer()
-
-# JWKS client — caches keys automatically
-_jwks_client: PyJWKClient | None = None
+logger = logging.getLogger(__name__)
 
+security = HTTPBearer()
 
-def _get_jwks_client() -> PyJWKClient:
-    global _jwks_client
-    if _jwks_client is None:
-        jwks_url = f"{settings.supabase_url}/auth/v1/.well-known/jwks.json"
-        _jwks_client = PyJWKClient(jwks_url, cache_keys=True, lifespan=3600)
-    return _jwks_client
+ALGORITHMS = ["RS256", "ES256"]
+TOKEN_CACHE_SIZE = 4096
+JWKS_REFRESH_SECONDS = 3600
+JWKS_MIN_REFETCH_SECONDS = 10
 
 
 class AuthenticatedUser:
@@ -27,21 +45,121 @@ class AuthenticatedUser:
         self.role = role
 
 
-def verify_token(token: str) -> AuthenticatedUser:
+# ---------------------------------------------------------------------------
+# JWKS
+# ---------------------------------------------------------------------------
+
+_signing_keys: dict[str, object] = {}
+_jwks_fetched_at: float | None = None
+_jwks_lock: asyncio.Lock | None = None
+_refresh_task: asyncio.Task | None = None
+
+
+async def refresh_jwks(force: bool = True) -> None:
+    """Fetch the JWKS and replace the signing keys. Failures keep the old keys.
+
+    Concurrent callers share one fetch; without ``force`` a fetch within
+    ``JWKS_MIN_REFETCH_SECONDS`` of the last one is skipped.
+    """
+    global _jwks_fetched_at, _jwks_lock, _signing_keys
+    if _jwks_lock is None:
+        _jwks_lock = asyncio.Lock()
+    async with _jwks_lock:
+        if (
+            not force
+            and _jwks_fetched_at is not None
+            and time.monotonic() - _jwks_fetched_at < JWKS_MIN_REFETCH_SECONDS
+        ):
+            return
+        try:
+            resp = await get_http().get(
+                f"{settings.supabase_url}/auth/v1/.well-known/jwks.json", timeout=10,
+            )
+            resp.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(resp.json())
+        except Exception as e:
+            logger.warning(f"  [auth] JWKS refresh failed: {e}")
+            return
+        finally:
+            _jwks_fetched_at = time.monotonic()
+        _signing_keys = {k.key_id: k.key for k in jwk_set.keys if k.key_id}
+
+
+async def _signing_key(kid: str | None):
+    key = _signing_keys.get(kid)
+    if key is None:
+        await refresh_jwks(force=False)
+        key = _signing_keys.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError(f"Unable to find a signing key that matches: {kid!r}")
+    return key
+
+
+async def _refresh_forever() -> None:
+    if _jwks_fetched_at is None:  # not pre-warmed
+        await refresh_jwks()
+    while True:
+        await asyncio.sleep(JWKS_REFRESH_SECONDS)
+        await refresh_jwks()
+
+
+def start_jwks_refresh() -> None:
+    """Keep the JWKS fresh in the background (app lifespan).
+
+    Fetches immediately unless the startup pre-warm already did.
+    """
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh_forever())
+
+
+async def stop_jwks_refresh() -> None:
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
+
+
+# ---------------------------------------------------------------------------
+# Verified-token cache
+# ---------------------------------------------------------------------------
+
+_verified: OrderedDict[bytes, tuple[float, AuthenticatedUser]] = OrderedDict()
+
+
+def _cached_user(digest: bytes) -> AuthenticatedUser | None:
+    entry = _verified.get(digest)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        del _verified[digest]
+        return None
+    _verified.move_to_end(digest)
+    return user
+
+
+def _remember(digest: bytes, expires_at: float, user: AuthenticatedUser) -> None:
+    _verified[digest] = (expires_at, user)
+    _verified.move_to_end(digest)
+    while len(_verified) > TOKEN_CACHE_SIZE:
+        _verified.popitem(last=False)
+
+
+async def verify_token(token: str) -> AuthenticatedUser:
+    digest = hashlib.sha256(token.encode()).digest()
+    user = _cached_user(digest)
+    if user is not None:
+        return user
     try:
-        client = _get_jwks_client()
-        signing_key = client.get_signing_key_from_jwt(token)
+        kid = jwt.get_unverified_header(token).get("kid")
         payload = jwt.decode(
             token,
-            signing_key.key,
-            algorithms=["RS256", "ES256"],
+            await _signing_key(kid),
+            algorithms=ALGORITHMS,
             audience="authenticated",
         )
-        return AuthenticatedUser(
-            sub=payload["sub"],
-            email=payload.get("email"),
-            role=payload.get("role"),
-        )
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired"
@@ -50,6 +168,14 @@ def verify_token(token: str) -> AuthenticatedUser:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid token: {e}"
         )
+    user = AuthenticatedUser(
+        sub=payload["sub"],
+        email=payload.get("email"),
+        role=payload.get("role"),
+    )
+    if "exp" in payload:
+        _remember(digest, float(payload["exp"]), user)
+    return user
 
 
 async def get_current_user(
@@ -62,7 +188,7 @@ async def get_current_user(
         and credentials.credentials == "dev"
     ):
         return AuthenticatedUser(sub="a24e261a-313b-450a-88c5-7653e2ece357", email="dev@localhost", role="authenticated")
-    return verify_token(credentials.credentials)
+    return await verify_token(credentials.credentials)
 
 
 async def ws_authenticate(websocket: WebSocket) -> AuthenticatedUser | None:
@@ -71,7 +197,7 @@ async def ws_authenticate(websocket: WebSocket) -> AuthenticatedUser | None:
         await websocket.close(code=4001, reason="Missing token")
         return None
     try:
-        return verify_token(token)
+        return await verify_token(token)
     except HTTPException:
         await websocket.close(code=4003, reason="Invalid token")
         return None
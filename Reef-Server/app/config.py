@@ -11,11 +11,49 @@ class Settings(BaseSettings):
     supabase_url: str = ""
     supabase_anon_key: str = ""
     supabase_service_role_key: str = ""
+    status_flush_interval: float = 0.5  # min seconds between non-critical documents PATCHes
 
     # External Services
     openrouter_api_key: str = ""
     mathpix_app_id: str = ""
     mathpix_app_key: str = ""
+    mathpix_api_base: str = "https://api.mathpix.com"
+    mathpix_cdn_base: str = "https://cdn.mathpix.com"
+
+    # Interchangeable models for Stage 3 parse and the LaTeX fix loop, in
+    # preference order (app/services/llm_router.py hedges/fails over along it)
+    llm_fast_models: list[str] = ["google/gemini-3-flash-preview", "google/gemini-2.5-flash"]
+    # Client-side per-model limits; adapted from rate-limit headers and 429s
+    llm_requests_per_minute: int = 300
+    llm_tokens_per_minute: int = 1_000_000
+    # Stage 3 splits MMD above this many estimated tokens at problem
+    # boundaries and parses the chunks concurrently (app/services/mmd_chunker.py)
+    parse_chunk_tokens: int = 6000
+    # Reconstruction jobs wait for admission while their projected peak
+    # would push the total past this budget (app/services/memory_budget.py)
+    job_memory_budget_mb: int = 600
+    job_memory_estimate_mb: int = 120
+
+    # Mathpix strokes sessions (app/services/strokes_sessions.py)
+    strokes_session_seconds: int = 300  # app token lifetime requested from Mathpix
+    strokes_session_spares: int = 2  # pre-created sessions ready for new users
+
+    # Per-canvas transcription coalescing (app/services/transcription_coordinator.py)
+    transcription_debounce_seconds: float = 0.15
+    transcription_max_wait_seconds: float = 1.0
+
+    # Near-duplicate reuse (app/services/question_index.py)
+    near_duplicate_threshold: float = 0.9  # estimated Jaccard similarity; > 1 disables reuse
+    near_duplicate_index_size: int = 4096  # questions kept; documents keep 1/8 of this
+
+    # Startup: one-time work awaited before serving (app/services/prewarm.py)
+    prewarm_timeout_seconds: float = 20.0
+
+    # Observability
+    otel_enabled: bool = False
+    log_format: str = "json"  # "json" (one object per line) or "text"
+    log_level: str = "INFO"
+    metrics_token: str = ""  # if set, /metrics requires "Authorization: Bearer <token>"
 
     model_config = {"env_file": ".env", "extra": "ignore"}
 
@@ -5,15 +5,24 @@ import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import health
+from app.routers import answer_keys
 from app.routers import reconstruct_v2
 from app.routers import fit_shape
 from app.routers import bug_report
+from app.routers import metrics
+from app.routers import transcribe
+from app.auth import start_jwks_refresh, stop_jwks_refresh
 from app.config import settings
+from app.services import cost_ledger, strokes_sessions
 from app.services.cancellation import get_in_flight_ids
 from app.services.http_pool import init_pool
-from app.services.progress import update_document_status
+from app.services.metrics import RequestMetricsMiddleware
+from app.services.prewarm import prewarm
+from app.services.progress import flush_all, update_document_status
+from app.services.structured_logging import configure_logging
+from app.services.tracing import init_tracing
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+configure_logging()
 log = logging.getLogger(__name__)
 
 # Strong references to background tasks (prevent GC)
@@ -51,15 +60,18 @@ async def _recover_stale_documents():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("Reef server starting")
-    await _recover_stale_documents()
+    init_tracing()
     app.state.http = httpx.AsyncClient(
         timeout=httpx.Timeout(30.0, connect=5.0),
         limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
     )
     init_pool(app.state.http)
+    # Serving (and so the health check) starts once this returns
+    await asyncio.gather(_recover_stale_documents(), prewarm())
+    cost_ledger.start()
+    start_jwks_refresh()
     yield
     log.info("Reef server shutting down")
-    await app.state.http.aclose()
     # Mark in-flight documents as failed
     for doc_id in get_in_flight_ids():
         try:
@@ -70,6 +82,11 @@ async def lifespan(app: FastAPI):
             )
         except Exception:
             pass
+    await flush_all()
+    await cost_ledger.stop()
+    await strokes_sessions.pool.stop()
+    await stop_jwks_refresh()
+    await app.state.http.aclose()
 
 
 # TODO: Add slowapi rate limiting before production launch
@@ -83,7 +100,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestMetricsMiddleware)
+
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(bug_report.router)
 app.include_router(reconstruct_v2.router)
+app.include_router(answer_keys.router)
 app.include_router(fit_shape.router)
+app.include_router(transcribe.router)
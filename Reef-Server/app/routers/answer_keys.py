@@ -0,0 +1,111 @@
+"""Answer-key readiness stream and focus control.
+
+GET  /ai/answer-keys/{document_id}/events — server-sent events
+POST /ai/answer-keys/{document_id}/focus  — prioritize a question (404 without a channel)
+
+The stream starts with a ``snapshot`` of every question's state, then
+sends ``question`` events (``{"question_number", "status"}``) as answer
+keys become ready, and ends with ``done``. Clients fetch the row from
+``answer_keys`` when its question reports ``ready`` instead of polling.
+
+Both endpoints answer 404 unless the document belongs to the caller.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.auth import AuthenticatedUser, get_current_user
+from app.config import settings
+from app.services import answer_key_events
+from app.services.http_pool import get_client as get_http
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ai/answer-keys", tags=["answer-keys"])
+
+KEEPALIVE_SECONDS = 15
+MAX_STREAM_SECONDS = 900
+
+
+class FocusRequest(BaseModel):
+    question_number: int | None = None
+
+
+async def _require_owner(document_id: str, user: AuthenticatedUser) -> None:
+    """404 unless ``documents.user_id`` of ``document_id`` is the caller."""
+    try:
+        resp = await get_http().get(
+            f"{settings.supabase_url}/rest/v1/documents",
+            params={"select": "id", "id": f"eq.{document_id}", "user_id": f"eq.{user.id}"},
+            headers={
+                "apikey": settings.supabase_service_role_key,
+                "Authorization": f"Bearer {settings.supabase_service_role_key}",
+            },
+            timeout=10,
+        )
+        resp.raise_for_status()
+        rows = resp.json()
+    except Exception as e:
+        log.warning(f"  [answer-keys] {document_id}: ownership check failed - {e}")
+        raise HTTPException(status_code=503, detail="Could not verify document")
+    if not rows:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+
+async def _event_stream(document_id: str, request: Request, focus: int | None):
+    events = answer_key_events.subscribe(document_id, focus)
+    deadline = time.monotonic() + MAX_STREAM_SECONDS
+    next_event = asyncio.ensure_future(anext(events))
+    try:
+        while time.monotonic() < deadline:
+            done, _ = await asyncio.wait({next_event}, timeout=KEEPALIVE_SECONDS)
+            if not done:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            try:
+                event, data = next_event.result()
+            except StopAsyncIteration:
+                break
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            next_event = asyncio.ensure_future(anext(events))
+    finally:
+        next_event.cancel()
+        await asyncio.gather(next_event, return_exceptions=True)
+        await events.aclose()
+
+
+@router.get("/{document_id}/events")
+async def answer_key_stream(
+    document_id: str,
+    request: Request,
+    focus: int | None = None,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Stream per-question answer-key readiness as server-sent events."""
+    await _require_owner(document_id, user)
+    return StreamingResponse(
+        _event_stream(document_id, request, focus),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{document_id}/focus")
+async def set_answer_key_focus(
+    document_id: str,
+    body: FocusRequest,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Move the question the user is viewing to the front of the queue."""
+    await _require_owner(document_id, user)
+    if not answer_key_events.set_focus(document_id, body.question_number):
+        raise HTTPException(status_code=404, detail="No answer-key generation for this document")
+    return {"document_id": document_id, "focus": body.question_number}
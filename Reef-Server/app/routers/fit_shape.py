@@ -1,13 +1,18 @@
 """Shape fitting endpoint — uses RDP simplification + circle-fit for geometric shape detection."""
 
+from __future__ import annotations
+
 import logging
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel, Field
-import numpy as np
-from rdp import rdp
-from circle_fit import taubinSVD
 
 from app.auth import AuthenticatedUser, get_current_user
+from app.services.lazy_imports import lazy_module
+
+# circle_fit pulls in matplotlib/scipy (~0.35s); load on first request
+np = lazy_module("numpy")
+rdp = lazy_module("rdp")
+circle_fit = lazy_module("circle_fit")
 
 log = logging.getLogger(__name__)
 
@@ -68,7 +73,7 @@ def detect_shape(points: np.ndarray) -> dict:
 
     for eps_frac in [0.04, 0.06, 0.08, 0.10, 0.12]:
         eps = bbox_diag * eps_frac
-        simplified = rdp(points, epsilon=eps)
+        simplified = rdp.rdp(points, epsilon=eps)
         n = len(simplified)
 
         # 4 points = 3 vertices + close → triangle
@@ -123,7 +128,7 @@ def _try_line(points: np.ndarray, perimeter: float) -> dict | None:
 
 def _try_circle(points: np.ndarray, threshold: float = 0.15) -> dict | None:
     try:
-        xc, yc, r, sigma = taubinSVD(points)
+        xc, yc, r, sigma = circle_fit.taubinSVD(points)
     except Exception:
         return None
 
@@ -138,7 +143,7 @@ def _try_circle(points: np.ndarray, threshold: float = 0.15) -> dict | None:
 
     # RDP check: circles stay complex after simplification, polygons don't
     bbox_diag = _bbox_diagonal(points)
-    simplified = rdp(points, epsilon=bbox_diag * 0.06)
+    simplified = rdp.rdp(points, epsilon=bbox_diag * 0.06)
     if len(simplified) <= 6:
         return None
 
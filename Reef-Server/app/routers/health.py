@@ -1,8 +1,14 @@
 from fastapi import APIRouter
 
+from app.services.latex_compiler import compiler_health
+
 router = APIRouter(tags=["health"])
 
 
 @router.get("/health")
 async def health():
-    return {"status": "ok", "service": "reef-server"}
+    # A broken compiler fails reconstructions but not the rest of the API,
+    # so it is reported here without failing the machine's health check
+    compiler = compiler_health()
+    status = "degraded" if compiler["status"] == "failed" else "ok"
+    return {"status": status, "service": "reef-server", "compiler": compiler}
@@ -0,0 +1,45 @@
+"""GET /metrics — Prometheus scrape endpoint."""
+
+import asyncio
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.routers import reconstruct_v2
+from app.services import memory_budget, metrics, rate_limiter
+from app.services.cancellation import get_in_flight_ids
+
+router = APIRouter(tags=["metrics"])
+
+
+def _executor_queue_depth() -> int:
+    """Calls waiting for a default-executor thread (``asyncio.to_thread``).
+
+    There is no public API for this; it reads CPython's
+    ``ThreadPoolExecutor._work_queue``. No executor yet means nothing is
+    queued. If those internals change, this raises and the gauge is left
+    out of the scrape (``Gauge`` skips a failing callback) rather than
+    reporting a misleading 0.
+    """
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    if executor is None:
+        return 0
+    return executor._work_queue.qsize()
+
+
+metrics.documents_in_flight.set_function(lambda: len(get_in_flight_ids()))
+metrics.background_tasks.set_function(lambda: len(reconstruct_v2._background_tasks))
+metrics.executor_queue_depth.set_function(_executor_queue_depth)
+metrics.llm_queued_calls.set_function(rate_limiter.queued_calls)
+metrics.job_memory_reserved_bytes.set_function(lambda: memory_budget.budget.reserved)
+metrics.jobs_waiting_for_memory.set_function(lambda: memory_budget.budget.waiting)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def scrape(authorization: str | None = Header(default=None)):
+    if settings.metrics_token and authorization != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -6,14 +6,16 @@ accurate math recognition and structured output.
 
 import asyncio
 import base64
-import json
+import functools
 import logging
 import math
 import re
+import shutil
+import tempfile
 import time
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from pathlib import Path
 
-import fitz  # PyMuPDF
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -28,14 +30,22 @@ from app.services.cancellation import (
     is_cancelled,
     register as cancel_register,
 )
-from app.services.latex_compiler import LaTeXCompiler
-from app.services.llm_client import LLMClient, LLMResult
+from app.services.latex_compiler import get_compiler
+from app.services.lazy_imports import lazy_module
+from app.services.llm_client import LLMResult, json_schema, schema_instruction
+from app.services.llm_router import LLMRouter
 from app.services.mathpix import MathpixClient, replace_urls_with_filenames
+from app.services.mmd_chunker import merge_batches, split_mmd
+from app.services import cost_ledger, memory_budget, question_index
 from app.services.progress import update_document_status, update_progress
 from app.services.prompts import LATEX_FIX_PROMPT, PARSE_MMD_PROMPT
 from app.services.question_to_latex import question_to_latex, _sanitize_text
 from app.services.region_extractor import extract_question_regions
-from app.services.storage import download_document_pdf, upload_document_pdf
+from app.services.storage import download_document_pdf_file, upload_document_pdf_file
+from app.services.structured_logging import bind_fields
+from app.services.tracing import span, start_trace
+
+fitz = lazy_module("fitz")  # PyMuPDF
 
 logger = logging.getLogger(__name__)
 
@@ -61,27 +71,19 @@ class PipelineCosts:
     """Accumulated cost metrics for a v2 pipeline run."""
     input_tokens: int = 0
     output_tokens: int = 0
+    cached_tokens: int = 0
     llm_calls: int = 0
     mathpix_pages: int = 0
     pipeline_seconds: float = 0.0
     _llm_cost_dollars: float = 0.0
 
-    MODEL_RATES: dict = field(default_factory=lambda: {
-        "deepseek/deepseek-r1": (0.55 / 1_000_000, 2.19 / 1_000_000),
-        "deepseek/deepseek-v3.2": (0.25 / 1_000_000, 0.40 / 1_000_000),
-        "google/gemini-2.5-flash": (0.15 / 1_000_000, 0.60 / 1_000_000),
-        "google/gemini-3-flash-preview": (0.50 / 1_000_000, 3.00 / 1_000_000),
-        "google/gemini-3.1-pro-preview": (1.25 / 1_000_000, 10.00 / 1_000_000),
-    })
-    _DEFAULT_RATE: tuple = (0.25 / 1_000_000, 0.40 / 1_000_000)
-
     def add(self, result: LLMResult, model: str = "") -> None:
         self.input_tokens += result.input_tokens
         self.output_tokens += result.output_tokens
+        self.cached_tokens += result.cached_tokens
         self.llm_calls += 1
-        in_rate, out_rate = self.MODEL_RATES.get(model, self._DEFAULT_RATE)
-        self._llm_cost_dollars += (
-            result.input_tokens * in_rate + result.output_tokens * out_rate
+        self._llm_cost_dollars += cost_ledger.llm_cost_dollars(
+            model, result.input_tokens, result.output_tokens,
         )
 
     @property
@@ -94,6 +96,24 @@ class PipelineCosts:
 # ---------------------------------------------------------------------------
 
 
+def _is_question_batch(result: LLMResult) -> bool:
+    """Stage 3 response check — a malformed batch fails over to the next model."""
+    try:
+        QuestionBatch.model_validate_json(result.content)
+        return True
+    except Exception:
+        return False
+
+
+@functools.cache
+def _parse_system_prompt() -> str:
+    """Stage 3 instructions plus schema — a stable, provider-cacheable prefix.
+
+    The MMD goes in the user message after it.
+    """
+    return PARSE_MMD_PROMPT + schema_instruction(QuestionBatch)
+
+
 def _strip_invalid_figures(latex: str, valid_figures: set[str]) -> str:
     """Remove \\includegraphics lines referencing files not in valid_figures."""
     lines = latex.split('\n')
@@ -111,7 +131,9 @@ def _strip_invalid_figures(latex: str, valid_figures: set[str]) -> str:
 # ---------------------------------------------------------------------------
 
 
-async def _run_pipeline(*, document_id: str, user_id: str) -> None:
+async def _run_pipeline(
+    *, document_id: str, user_id: str, job: memory_budget.JobMemory | None = None,
+) -> None:
     """Mathpix-based reconstruction pipeline.
 
     Stages:
@@ -121,8 +143,17 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
     4. Compile LaTeX for each question
     5. Merge PDFs and upload result
     6. Generate answer keys
+
+    ``job`` accounts the large buffers the pipeline holds; the background
+    wrapper passes the one it was admitted with.
     """
     costs = PipelineCosts()
+    trace = start_trace()
+    job = job or memory_budget.JobMemory(document_id)
+    trace.memory = job
+    work_dir = Path(tempfile.mkdtemp(prefix="reef-"))
+    cost_ledger.set_context(user_id, "reconstruct", document_id=document_id)
+    bind_fields(document_id=document_id, user_id=user_id)
     pipeline_start = time.monotonic()
 
     try:
@@ -132,14 +163,19 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
         # ---------------------------------------------------------------
         # Stage 1: Download source PDF
         # ---------------------------------------------------------------
-        pdf_bytes = await download_document_pdf(user_id, document_id)
-        if not pdf_bytes:
-            raise RuntimeError("Could not download source PDF")
-
-        # Count pages and enforce limit
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        num_pages = len(doc)
-        doc.close()
+        # The source and merged PDFs live on disk and are streamed to and
+        # from storage, so neither is ever held in memory whole
+        source_pdf = work_dir / "original.pdf"
+        with span("download") as download_span:
+            pdf_size = await download_document_pdf_file(user_id, document_id, source_pdf)
+            if not pdf_size:
+                raise RuntimeError("Could not download source PDF")
+
+            # Count pages and enforce limit
+            with fitz.open(source_pdf) as doc:
+                num_pages = len(doc)
+            download_span.set_attribute("bytes", pdf_size)
+            download_span.set_attribute("pages", num_pages)
         if num_pages > 20:
             raise RuntimeError(f"Document has {num_pages} pages (max 20). Upload a shorter document.")
         costs.mathpix_pages = num_pages
@@ -152,8 +188,11 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
         mathpix = MathpixClient(
             app_id=settings.mathpix_app_id,
             app_key=settings.mathpix_app_key,
+            api_base=settings.mathpix_api_base,
         )
-        mmd_text, mathpix_images, url_map = await mathpix.process_pdf(pdf_bytes)
+        mmd_text, mathpix_images, url_map = await mathpix.process_pdf(source_pdf)
+        job.hold("mmd", len(mmd_text))
+        job.hold("figures", sum(len(b) for b in mathpix_images.values()))
 
         if is_cancelled(document_id):
             return
@@ -166,7 +205,8 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
                 upload_question_figure(document_id, fname, img_bytes)
                 for fname, img_bytes in mathpix_images.items()
             ]
-            results = await asyncio.gather(*upload_tasks, return_exceptions=True)
+            with span("figures.upload", count=len(upload_tasks)):
+                results = await asyncio.gather(*upload_tasks, return_exceptions=True)
             for fname, result in zip(mathpix_images.keys(), results):
                 if isinstance(result, str):
                     figure_url_map[fname] = result
@@ -182,36 +222,57 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
         # Replace CDN URLs with local filenames so the LLM sees them inline
         cleaned_mmd = replace_urls_with_filenames(mmd_text, url_map)
 
-        schema_json = json.dumps(QuestionBatch.model_json_schema(), indent=2)
-        parse_prompt = PARSE_MMD_PROMPT
-        parse_prompt += (
-            f"\n\n## Output JSON Schema\n"
-            f"Return ONLY a valid JSON object matching this schema. No markdown, no explanation, no code fences.\n"
-            f"```json\n{schema_json}\n```\n"
-            f"\n\n## MMD Content\n```\n{cleaned_mmd}\n```"
-        )
-
-        parse_llm = LLMClient(
-            api_key=settings.openrouter_api_key,
-            model="google/gemini-3-flash-preview",
-            base_url="https://openrouter.ai/api/v1",
-        )
-        parse_result = await parse_llm.generate(
-            prompt=parse_prompt,
-            response_schema=QuestionBatch.model_json_schema(),
-            timeout=120.0,
-        )
-        costs.add(parse_result, model=parse_llm.model)
-        logger.info(f"  [v2] {document_id}: question extraction via Gemini Flash")
-
-        # LLM client for LaTeX fix loop (use inference API if available)
-        llm_client = LLMClient(
+        # A near-identical document parsed earlier (re-upload, shared
+        # assignment) skips the parse call entirely
+        reused_batch = question_index.find_similar_document(cleaned_mmd, mathpix_images, document_id)
+        if reused_batch is not None:
+            with span("parse.reuse", mmd_chars=len(cleaned_mmd)):
+                batch = QuestionBatch.model_validate(reused_batch)
+            logger.info("  [v2] %s: reused parse of a near-identical document", document_id)
+        else:
+            parse_llm = LLMRouter(
+                "parse",
+                settings.llm_fast_models,
+                api_key=settings.openrouter_api_key,
+                base_url="https://openrouter.ai/api/v1",
+            )
+            # Long documents are parsed as concurrent problem-aligned chunks
+            # so no single call hits the timeout or the output-length limit
+            chunks = split_mmd(cleaned_mmd, settings.parse_chunk_tokens)
+            with span("parse", mmd_chars=len(cleaned_mmd), chunks=len(chunks)) as parse_span:
+                parse_results = await asyncio.gather(*[
+                    parse_llm.generate(
+                        prompt=f"## MMD Content\n```\n{chunk}\n```",
+                        system_prompt=_parse_system_prompt(),
+                        response_schema=json_schema(QuestionBatch),
+                        timeout=120.0,
+                        validate=_is_question_batch,
+                    )
+                    for chunk in chunks
+                ])
+                parse_span.set_attribute("model", parse_results[0].model)
+                parse_span.set_attribute("input_tokens", sum(r.input_tokens for r in parse_results))
+                parse_span.set_attribute("output_tokens", sum(r.output_tokens for r in parse_results))
+                parse_span.set_attribute("cached_tokens", sum(r.cached_tokens for r in parse_results))
+            for parse_result in parse_results:
+                costs.add(parse_result, model=parse_result.model)
+            models_used = ", ".join(sorted({r.model for r in parse_results}))
+            logger.info(
+                "  [v2] %s: question extraction via %s (%d chunk%s)",
+                document_id, models_used, len(chunks), "s" if len(chunks) != 1 else "",
+            )
+            batch = merge_batches([
+                QuestionBatch.model_validate_json(r.content) for r in parse_results
+            ])
+
+        # LLM router for the LaTeX fix loop
+        llm_client = LLMRouter(
+            "latex_fix",
+            settings.llm_fast_models,
             api_key=settings.openrouter_api_key,
-            model="google/gemini-3-flash-preview",
             base_url="https://openrouter.ai/api/v1",
         )
 
-        batch = QuestionBatch.model_validate_json(parse_result.content)
         questions = batch.questions
 
         if not questions:
@@ -225,10 +286,12 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
                 part.figures = [f for f in part.figures if f in valid_figures]
                 for sub in part.parts:
                     sub.figures = [f for f in sub.figures if f in valid_figures]
+        if reused_batch is None:
+            question_index.add_document(cleaned_mmd, mathpix_images, batch.model_dump())
 
         logger.info(
-            f"  [v2] {document_id}: parsed {len(questions)} questions "
-            f"from {len(mmd_text)} chars MMD"
+            "  [v2] %s: parsed %d questions from %d chars MMD",
+            document_id, len(questions), len(mmd_text),
         )
 
         if is_cancelled(document_id):
@@ -239,12 +302,14 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
         # ---------------------------------------------------------------
         # Stage 4: Compile LaTeX for each question (parallelized)
         # ---------------------------------------------------------------
-        compiler = LaTeXCompiler()
+        compiler = get_compiler()
+        await asyncio.to_thread(compiler.validate)  # no-op once pre-warmed
 
         # Encode images as base64 for the LaTeX compiler
         image_data: dict[str, str] = {}
         for fname, img_bytes in mathpix_images.items():
             image_data[fname] = base64.b64encode(img_bytes).decode()
+        job.hold("figures_base64", sum(len(v) for v in image_data.values()))
 
         async def _compile_question(
             idx: int, question: Question
@@ -276,19 +341,21 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
             q_image_data = {k: v for k, v in image_data.items() if k in q_figures} or None
 
             logger.info(
-                f"  [v2-compile] {label}: {len(latex)} chars, "
-                f"images={list(q_figures) or 'none'}"
+                "  [v2-compile] %s: %d chars, images=%s",
+                label, len(latex), q_figures or "none",
+                extra={"sample": 10},  # one line per question
             )
 
             pdf_result = None
             for attempt in range(1, MAX_FIX_ATTEMPTS + 1):
                 try:
                     content = f"\\textbf{{\\large {label}}}\n\n{latex}"
-                    pdf_result = await asyncio.to_thread(
-                        compiler.compile_latex, content, image_data=q_image_data
-                    )
+                    with span("compile.attempt", question=label, attempt=attempt):
+                        pdf_result = await asyncio.to_thread(
+                            compiler.compile_latex, content, image_data=q_image_data
+                        )
                     if attempt > 1:
-                        logger.info(f"  [v2-compile] {label}: FIXED on attempt {attempt}")
+                        logger.info("  [v2-compile] %s: FIXED on attempt %d", label, attempt)
                     break
                 except Exception as e:
                     if attempt < MAX_FIX_ATTEMPTS:
@@ -299,8 +366,9 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
                             fix_prompt = LATEX_FIX_PROMPT.format(
                                 latex_body=latex, error_message=str(e)[:2000]
                             )
-                            fix_llm = await llm_client.generate(prompt=fix_prompt)
-                            costs.add(fix_llm, model=llm_client.model)
+                            with span("compile.fix", question=label, attempt=attempt):
+                                fix_llm = await llm_client.generate(prompt=fix_prompt)
+                            costs.add(fix_llm, model=fix_llm.model)
                             fix_content = fix_llm.content
                             # Strip code fences if present
                             fix_content = re.sub(r"^```(?:latex|tex)?\s*\n?", "", fix_content.strip())
@@ -324,7 +392,8 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
                     f"\\textbf{{\\large {label}}}\n\n"
                     f"\\textit{{LaTeX compilation failed for this problem.}}"
                 )
-                pdf_result = await asyncio.to_thread(compiler.compile_latex, fallback)
+                with span("compile.fallback", question=label):
+                    pdf_result = await asyncio.to_thread(compiler.compile_latex, fallback)
                 return label, pdf_result, None
 
             return label, pdf_result, question_dict
@@ -333,6 +402,9 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
             _compile_question(i, q) for i, q in enumerate(questions)
         ]
         compiled = await asyncio.gather(*compile_tasks)
+        del image_data
+        job.release("figures_base64")
+        job.hold("question_pdfs", sum(len(pdf) for _, pdf, _ in compiled))
 
         if is_cancelled(document_id):
             return
@@ -342,32 +414,42 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
         # ---------------------------------------------------------------
         await update_progress(document_id, "Almost there, wrapping up...")
 
-        merged = fitz.open()
-        question_pages: list[list[int]] = []
-        question_regions: list[dict | None] = []
-        running_page = 0
-        for label, problem_pdf_bytes, q_dict in compiled:
-            sub_doc = fitz.open(stream=problem_pdf_bytes, filetype="pdf")
-            question_pages.append([running_page, running_page + sub_doc.page_count - 1])
-            running_page += sub_doc.page_count
-            merged.insert_pdf(sub_doc)
-            sub_doc.close()
-
-            # Extract part regions from the compiled question PDF
-            if q_dict is not None:
-                try:
-                    regions = extract_question_regions(problem_pdf_bytes, q_dict)
-                    question_regions.append(regions)
-                except Exception as e:
-                    logger.warning(f"  [v2] Region extraction failed for {label}: {e}")
+        with span("merge", questions=len(compiled)):
+            # The merged document grows to about the size of the question
+            # PDFs while they are released one by one; account the overlap
+            job.hold("merged", job.held.get("question_pdfs", 0))
+            merged = fitz.open()
+            question_pages: list[list[int]] = []
+            question_regions: list[dict | None] = []
+            running_page = 0
+            for i, (label, problem_pdf_bytes, q_dict) in enumerate(compiled):
+                compiled[i] = (label, None, q_dict)  # release each question PDF once merged
+                sub_doc = fitz.open(stream=problem_pdf_bytes, filetype="pdf")
+                question_pages.append([running_page, running_page + sub_doc.page_count - 1])
+                running_page += sub_doc.page_count
+                merged.insert_pdf(sub_doc)
+                sub_doc.close()
+
+                # Extract part regions from the compiled question PDF
+                if q_dict is not None:
+                    try:
+                        with span("merge.regions", question=label):
+                            regions = extract_question_regions(problem_pdf_bytes, q_dict)
+                        question_regions.append(regions)
+                    except Exception as e:
+                        logger.warning(f"  [v2] Region extraction failed for {label}: {e}")
+                        question_regions.append(None)
+                else:
                     question_regions.append(None)
-            else:
-                question_regions.append(None)
 
-        merged_bytes = merged.tobytes()
-        merged.close()
+            output_pdf = work_dir / "output.pdf"
+            merged.save(output_pdf)
+            merged.close()
+            job.release("merged")
+            job.release("question_pdfs")
 
-        await upload_document_pdf(user_id, document_id, merged_bytes)
+        with span("upload", bytes=output_pdf.stat().st_size):
+            await upload_document_pdf_file(user_id, document_id, output_pdf)
 
         costs.pipeline_seconds = time.monotonic() - pipeline_start
 
@@ -397,16 +479,19 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
             status_message=None,
             input_tokens=costs.input_tokens,
             output_tokens=costs.output_tokens,
+            cached_tokens=costs.cached_tokens,
             llm_calls=costs.llm_calls,
             pipeline_seconds=round(costs.pipeline_seconds, 2),
             cost_cents=costs.cost_cents,
+            **trace.columns(),
         )
 
         logger.info(
-            f"  [v2] {document_id} completed: {len(compiled)} problems, "
-            f"{costs.llm_calls} LLM calls, "
-            f"{costs.input_tokens}in/{costs.output_tokens}out tokens, "
-            f"{costs.pipeline_seconds:.1f}s total, ~{costs.cost_cents}c"
+            "  [v2] %s completed: %d problems, %d LLM calls, %din/%dout tokens, "
+            "%.1fs total, ~%dc, peak RSS %.0f MB (%s)",
+            document_id, len(compiled), costs.llm_calls, costs.input_tokens,
+            costs.output_tokens, costs.pipeline_seconds, costs.cost_cents,
+            trace.peak_rss_bytes / 2**20, trace.peak_rss_stage,
         )
 
     except asyncio.TimeoutError:
@@ -419,12 +504,14 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
             status_message=None,
             input_tokens=costs.input_tokens,
             output_tokens=costs.output_tokens,
+            cached_tokens=costs.cached_tokens,
             llm_calls=costs.llm_calls,
             pipeline_seconds=round(costs.pipeline_seconds, 2),
             cost_cents=costs.cost_cents,
+            **trace.columns(),
         )
     except asyncio.CancelledError:
-        logger.info(f"  [v2] {document_id} cancelled")
+        logger.info("  [v2] %s cancelled", document_id)
         await update_document_status(
             document_id,
             status="failed",
@@ -433,7 +520,7 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
     except Exception as e:
         costs.pipeline_seconds = time.monotonic() - pipeline_start
         if is_cancelled(document_id):
-            logger.info(f"  [v2] {document_id} cancelled (during error)")
+            logger.info("  [v2] %s cancelled (during error)", document_id)
             return
         logger.exception(f"  [v2] {document_id} failed: {e}")
         await update_document_status(
@@ -443,10 +530,14 @@ async def _run_pipeline(*, document_id: str, user_id: str) -> None:
             status_message=None,
             input_tokens=costs.input_tokens,
             output_tokens=costs.output_tokens,
+            cached_tokens=costs.cached_tokens,
             llm_calls=costs.llm_calls,
             pipeline_seconds=round(costs.pipeline_seconds, 2),
             cost_cents=costs.cost_cents,
+            **trace.columns(),
         )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 async def _generate_answer_keys_safe(
@@ -456,10 +547,16 @@ async def _generate_answer_keys_safe(
     user_id: str | None = None,
 ) -> None:
     """Wrapper that catches all exceptions so fire-and-forget never leaks."""
+    trace = start_trace()
     try:
-        await generate_answer_keys(document_id, questions, image_data=mathpix_images, user_id=user_id)
+        with span("answer_keys", questions=len(questions)):
+            await generate_answer_keys(document_id, questions, image_data=mathpix_images, user_id=user_id)
     except Exception as e:
         logger.error(f"  [v2-answer-key] Top-level failure for {document_id}: {e}")
+    await update_document_status(
+        document_id,
+        answer_key_seconds=trace.stage_seconds().get("answer_keys", 0.0),
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -468,15 +565,33 @@ async def _generate_answer_keys_safe(
 
 
 async def _process_document_background(user_id: str, document_id: str) -> None:
-    """Run pipeline with timeout and cancellation support."""
+    """Run pipeline with memory admission, timeout and cancellation support.
+
+    Admission comes first so the timeout only covers the pipeline itself;
+    a job deferred by the memory budget shows a waiting message until a
+    running job finishes.
+    """
     cancel_event = cancel_register(document_id)
+    job = memory_budget.JobMemory(document_id)
+
+    async def _admitted_pipeline():
+        if memory_budget.budget.would_defer():
+            await update_progress(document_id, "Waiting in line...")
+        try:
+            async with memory_budget.admit(job):
+                await asyncio.wait_for(
+                    _run_pipeline(document_id=document_id, user_id=user_id, job=job),
+                    timeout=PIPELINE_TIMEOUT_SECONDS,
+                )
+        except asyncio.CancelledError:
+            if not job.reserved:  # cancelled while waiting for admission
+                logger.info("  [v2] %s cancelled before admission", document_id)
+                await update_document_status(
+                    document_id, status="failed", error_message="Processing was cancelled",
+                )
+            raise
 
-    pipeline_task = asyncio.create_task(
-        asyncio.wait_for(
-            _run_pipeline(document_id=document_id, user_id=user_id),
-            timeout=PIPELINE_TIMEOUT_SECONDS,
-        )
-    )
+    pipeline_task = asyncio.create_task(_admitted_pipeline())
 
     async def _watchdog():
         await cancel_event.wait()
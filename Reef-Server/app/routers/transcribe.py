@@ -0,0 +1,217 @@
+"""Handwriting transcription — Mathpix strokes sessions and stroke-to-LaTeX.
+
+POST /ai/strokes-session     — the caller's pooled Mathpix strokes session
+POST /ai/transcribe-strokes  — transcribe a canvas's strokes to LaTeX
+
+When ``document_id`` and ``question_label`` are given the canvas is
+transcribed incrementally (``chunk_manager``): only lines whose strokes
+changed since the last call are sent to Mathpix. The previous chunk list
+comes from ``chunk_manager``'s in-memory copy, or from
+``canvas_strokes.transcription_chunks`` after a restart; the new one is
+saved there in the background.
+Requests for the same canvas go through ``transcription_coordinator``,
+which debounces them and cancels superseded ones.
+"""
+
+import asyncio
+import logging
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from app.auth import AuthenticatedUser, get_current_user
+from app.config import settings
+from app.services import chunk_manager, cost_ledger
+from app.services.http_pool import get_client as get_http
+from app.services.katex_sanitizer import sanitize_for_katex
+from app.services.strokes_sessions import StrokesSession, mathpix_client, pool
+from app.services.transcription_coordinator import coordinator
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ai", tags=["ai"])
+
+# Strong references to in-flight chunk saves (prevent GC)
+_background_tasks: set[asyncio.Task] = set()
+
+
+class Stroke(BaseModel):
+    x: list[float]
+    y: list[float]
+
+
+class TranscribeStrokesRequest(BaseModel):
+    strokes: list[Stroke] = Field(..., max_length=5000)
+    # A session from /ai/strokes-session; the pooled one is used if omitted
+    app_token: str | None = None
+    session_id: str | None = None
+    document_id: str | None = None
+    question_label: str | None = None
+
+
+# ---------------------------------------------------------------------------
+# canvas_strokes persistence
+# ---------------------------------------------------------------------------
+
+
+def _canvas_params(user_id: str, document_id: str, question_label: str) -> dict[str, str]:
+    return {
+        "user_id": f"eq.{user_id}",
+        "document_id": f"eq.{document_id}",
+        "question_label": f"eq.{question_label}",
+    }
+
+
+def _headers() -> dict[str, str]:
+    return {
+        "apikey": settings.supabase_service_role_key,
+        "Authorization": f"Bearer {settings.supabase_service_role_key}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal",
+    }
+
+
+async def _load_chunks(user_id: str, document_id: str, question_label: str) -> list[dict] | None:
+    if not settings.supabase_service_role_key:
+        return None
+    try:
+        resp = await get_http().get(
+            f"{settings.supabase_url}/rest/v1/canvas_strokes",
+            params={"select": "transcription_chunks", **_canvas_params(user_id, document_id, question_label)},
+            headers=_headers(),
+            timeout=10,
+        )
+        resp.raise_for_status()
+        rows = resp.json()
+    except Exception as e:
+        log.warning(f"  [transcribe] {document_id}/{question_label}: loading chunks failed - {e}")
+        return None
+    return rows[0].get("transcription_chunks") if rows else None
+
+
+async def _save_chunks(
+    user_id: str, document_id: str, question_label: str, latex: str, chunks: list[dict],
+) -> None:
+    if not settings.supabase_service_role_key:
+        return
+    try:
+        resp = await get_http().patch(
+            f"{settings.supabase_url}/rest/v1/canvas_strokes",
+            params=_canvas_params(user_id, document_id, question_label),
+            json={"transcription_chunks": chunks, "latex": latex},
+            headers=_headers(),
+            timeout=10,
+        )
+        resp.raise_for_status()
+    except Exception as e:
+        log.warning(f"  [transcribe] {document_id}/{question_label}: saving chunks failed - {e}")
+
+
+# ---------------------------------------------------------------------------
+# Mathpix
+# ---------------------------------------------------------------------------
+
+
+def _rejected(e: Exception) -> bool:
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (401, 403)
+
+
+async def _transcribe(user_id: str, strokes: list[dict], client_session: StrokesSession | None) -> str:
+    """One Mathpix strokes call, on the client's session or the user's pooled one.
+
+    A pooled session Mathpix rejects (expired early, revoked) is dropped and
+    the call retried once on a fresh session.
+    """
+    mathpix = mathpix_client()
+    if client_session is not None:
+        return await mathpix.transcribe_strokes(
+            strokes, app_token=client_session.app_token, session_id=client_session.session_id,
+        )
+    session = await pool.acquire(user_id)
+    try:
+        return await mathpix.transcribe_strokes(
+            strokes, app_token=session.app_token, session_id=session.session_id,
+        )
+    except Exception as e:
+        if not _rejected(e):
+            raise
+        log.warning(f"  [transcribe] {user_id}: pooled strokes session rejected, replacing")
+        pool.invalidate(user_id, session)
+        session = await pool.acquire(user_id)
+        return await mathpix.transcribe_strokes(
+            strokes, app_token=session.app_token, session_id=session.session_id,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+
+@router.post("/strokes-session")
+async def strokes_session(user: AuthenticatedUser = Depends(get_current_user)):
+    if not settings.mathpix_app_key:
+        raise HTTPException(status_code=503, detail="Mathpix not configured")
+    cost_ledger.set_context(user.id, "transcription")
+    try:
+        session = await pool.acquire(user.id)
+    except Exception as e:
+        log.warning(f"  [transcribe] {user.id}: strokes session creation failed - {e}")
+        raise HTTPException(status_code=502, detail="Failed to create strokes session")
+    return {
+        "app_token": session.app_token,
+        "strokes_session_id": session.session_id,
+        "expires_in": int(session.remaining()),
+    }
+
+
+@router.post("/transcribe-strokes")
+async def transcribe_strokes(
+    body: TranscribeStrokesRequest,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    if not settings.mathpix_app_key:
+        raise HTTPException(status_code=503, detail="Mathpix not configured")
+    cost_ledger.set_context(
+        user.id, "transcription", document_id=body.document_id, question_label=body.question_label,
+    )
+
+    strokes = [s.model_dump() for s in body.strokes if s.x and len(s.x) == len(s.y)]
+    if not strokes:
+        return {"latex": "", "raw_latex": ""}
+    client_session = None
+    if body.app_token and body.session_id:
+        client_session = StrokesSession(body.app_token, body.session_id, expires_at=0.0)
+
+    async def transcribe(chunk_strokes: list[dict]) -> str:
+        return await _transcribe(user.id, chunk_strokes, client_session)
+
+    async def transcribe_canvas() -> str:
+        previous = chunk_manager.latest_chunks((user.id, body.document_id, body.question_label))
+        if previous is None:
+            previous = await _load_chunks(user.id, body.document_id, body.question_label)
+        raw, chunks = await chunk_manager.transcribe_with_chunks(
+            strokes, user.id, body.document_id, body.question_label, previous, transcribe,
+        )
+        task = asyncio.create_task(
+            _save_chunks(user.id, body.document_id, body.question_label, raw, chunks)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        return raw
+
+    try:
+        if body.document_id and body.question_label:
+            # Requests for one canvas are coalesced; this may return the
+            # transcription of a newer request's strokes
+            raw = await coordinator.submit(
+                (user.id, body.document_id, body.question_label), transcribe_canvas,
+            )
+        else:
+            raw = await transcribe(strokes)
+    except Exception as e:
+        log.warning(f"  [transcribe] {user.id}: Mathpix strokes transcription failed - {e}")
+        raise HTTPException(status_code=502, detail="Transcription failed")
+
+    return {"latex": sanitize_for_katex(raw), "raw_latex": raw}
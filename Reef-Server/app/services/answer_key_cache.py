@@ -0,0 +1,142 @@
+"""Content-addressed cache of generated answer keys.
+
+The key is a SHA-256 over a canonical form of the question: text with
+whitespace collapsed, figure filenames replaced by the hash of the figure
+bytes, and per-document fields (``number``, ``answer_space_cm``,
+``figure_storage_urls``) dropped. The answer model and a hash of
+the answer-key prompts are part of the key, so changing either starts a
+fresh cache.
+
+Lookups go to an in-process LRU first, then the Supabase
+``answer_key_cache`` table (see ``sql/create_answer_key_cache.sql``).
+Cache failures are logged and treated as misses.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+
+from app.config import settings
+from app.services import metrics
+from app.services.http_pool import get_client as get_http
+from app.services.prompts import ANSWER_KEY_PROMPT, ANSWER_KEY_QUESTION_PROMPT
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENTRIES = 1024
+
+# Fields that differ between documents for the same problem
+_IGNORED_FIELDS = {"number", "answer_space_cm", "figure_storage_urls"}
+
+_PROMPT_HASH = hashlib.sha256((ANSWER_KEY_PROMPT + ANSWER_KEY_QUESTION_PROMPT).encode()).hexdigest()[:16]
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_memory: OrderedDict[str, dict] = OrderedDict()
+
+
+def _canonical(node, figure_hashes: dict[str, str]):
+    if isinstance(node, dict):
+        out = {}
+        for key, value in node.items():
+            if key in _IGNORED_FIELDS:
+                continue
+            if key == "figures":
+                out[key] = [figure_hashes.get(name, name) for name in value]
+            else:
+                out[key] = _canonical(value, figure_hashes)
+        return out
+    if isinstance(node, list):
+        return [_canonical(item, figure_hashes) for item in node]
+    if isinstance(node, str):
+        return _WHITESPACE_RE.sub(" ", node).strip()
+    return node
+
+
+def question_cache_key(
+    question_dict: dict,
+    figure_hashes: dict[str, str],
+    model: str,
+) -> str:
+    """Hash of the question content, its figure bytes, the model and the prompt.
+
+    ``figure_hashes`` maps figure filenames to the SHA-256 of their bytes
+    (``question_index.figure_hashes``).
+    """
+    canonical = json.dumps(
+        {
+            "question": _canonical(question_dict, figure_hashes),
+            "model": model,
+            "prompt": _PROMPT_HASH,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _remember(key: str, entry: dict) -> None:
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _headers() -> dict:
+    return {
+        "apikey": settings.supabase_service_role_key,
+        "Authorization": f"Bearer {settings.supabase_service_role_key}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal",
+    }
+
+
+async def lookup(key: str) -> dict | None:
+    """Return ``{"answer_text", "model"}`` for a cached answer, or None."""
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        metrics.answer_key_cache_lookups.labels("memory").inc()
+        return entry
+
+    try:
+        client = get_http()
+        resp = await client.get(
+            f"{settings.supabase_url}/rest/v1/answer_key_cache",
+            params={"content_hash": f"eq.{key}", "select": "answer_text,model"},
+            headers=_headers(),
+            timeout=5,
+        )
+        resp.raise_for_status()
+        rows = resp.json()
+    except Exception as e:
+        logger.warning(f"  [answer-key-cache] lookup failed: {e}")
+        rows = []
+
+    if not rows:
+        metrics.answer_key_cache_lookups.labels("miss").inc()
+        return None
+    entry = {"answer_text": rows[0]["answer_text"], "model": rows[0].get("model")}
+    _remember(key, entry)
+    metrics.answer_key_cache_lookups.labels("db").inc()
+    return entry
+
+
+async def store(key: str, answer_text: str, model: str) -> None:
+    """Save a freshly generated answer. Best-effort — never raises."""
+    entry = {"answer_text": answer_text, "model": model}
+    _remember(key, entry)
+    try:
+        client = get_http()
+        resp = await client.post(
+            f"{settings.supabase_url}/rest/v1/answer_key_cache?on_conflict=content_hash",
+            json={"content_hash": key, **entry},
+            headers=_headers(),
+            timeout=10,
+        )
+        resp.raise_for_status()
+    except Exception as e:
+        logger.warning(f"  [answer-key-cache] store failed: {e}")
@@ -0,0 +1,162 @@
+"""In-process answer-key readiness channels, one per document.
+
+``generate_answer_keys`` publishes a ``question`` event every time a
+question changes state (queued → generating → ready/failed) and a final
+``done`` event. Subscribers (the SSE endpoint) get a ``snapshot`` of the
+current states first, then live events, so a client that connects late
+never misses a question that is already ready.
+
+The channel also carries the question the user is looking at
+(``focus``); the answer-key workers read it to pick what to solve next.
+Finished channels linger for ``FINISHED_RETENTION_SECONDS`` so a client
+that connects just after generation ended still gets the final states.
+"""
+
+import asyncio
+from typing import AsyncIterator
+
+FINISHED_RETENTION_SECONDS = 300
+
+QUEUED = "queued"
+GENERATING = "generating"
+READY = "ready"
+FAILED = "failed"
+
+
+class AnswerKeyChannel:
+    """Question states, focus and subscriber queues for one document."""
+
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self.states: dict[int, str] = {}
+        self.focus: int | None = None
+        self.active = False
+        self.finished = False
+        self.expired = False
+        self.subscribers: set[asyncio.Queue] = set()
+
+    def snapshot(self) -> dict:
+        return {
+            "questions": {str(q): s for q, s in sorted(self.states.items())},
+            "focus": self.focus,
+            "finished": self.finished,
+        }
+
+    def _broadcast(self, event: str, data: dict) -> None:
+        for queue in self.subscribers:
+            queue.put_nowait((event, data))
+
+
+_channels: dict[str, AnswerKeyChannel] = {}
+
+
+def _channel(document_id: str) -> AnswerKeyChannel:
+    channel = _channels.get(document_id)
+    if channel is None:
+        channel = _channels[document_id] = AnswerKeyChannel(document_id)
+    return channel
+
+
+def _drop_if_unused(document_id: str) -> None:
+    channel = _channels.get(document_id)
+    if channel is not None and not channel.active and not channel.subscribers:
+        del _channels[document_id]
+
+
+def _expire(channel: AnswerKeyChannel) -> None:
+    channel.expired = True
+    if _channels.get(channel.document_id) is channel:
+        _drop_if_unused(channel.document_id)
+
+
+# ---------------------------------------------------------------------------
+# Producer side (answer_keys.py)
+# ---------------------------------------------------------------------------
+
+
+def start(document_id: str, question_numbers: list[int]) -> AnswerKeyChannel:
+    """Open (or reopen) the channel for a generation run, all questions queued."""
+    channel = _channel(document_id)
+    channel.active = True
+    channel.finished = False
+    channel.expired = False
+    channel.states = {q: QUEUED for q in question_numbers}
+    channel._broadcast("snapshot", channel.snapshot())
+    return channel
+
+
+def publish(document_id: str, question_number: int, status: str) -> None:
+    """Record a question's new state and push it to every subscriber."""
+    channel = _channels.get(document_id)
+    if channel is None:
+        return
+    channel.states[question_number] = status
+    channel._broadcast("question", {"question_number": question_number, "status": status})
+
+
+def finish(document_id: str) -> None:
+    """Send ``done`` and schedule the channel for removal."""
+    channel = _channels.get(document_id)
+    if channel is None:
+        return
+    channel.active = False
+    channel.finished = True
+    counts = {READY: 0, FAILED: 0}
+    for status in channel.states.values():
+        if status in counts:
+            counts[status] += 1
+    channel._broadcast("done", counts)
+    asyncio.get_running_loop().call_later(FINISHED_RETENTION_SECONDS, _expire, channel)
+
+
+def get_focus(document_id: str) -> int | None:
+    channel = _channels.get(document_id)
+    return channel.focus if channel is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Consumer side (SSE endpoint)
+# ---------------------------------------------------------------------------
+
+
+def set_focus(document_id: str, question_number: int | None) -> bool:
+    """Move ``question_number`` to the front of the answer-key queue.
+
+    Only an existing channel (generating, recently finished or subscribed
+    to) takes a focus; returns False if there is none, so focus requests
+    can't create channels that are never dropped.
+    """
+    channel = _channels.get(document_id)
+    if channel is None:
+        return False
+    channel.focus = question_number
+    channel._broadcast("focus", {"question_number": question_number})
+    return True
+
+
+async def subscribe(document_id: str, focus: int | None = None) -> AsyncIterator[tuple[str, dict]]:
+    """Yield ``(event, data)`` pairs: a snapshot first, then live updates.
+
+    Ends after ``done``. Subscribing before generation starts is allowed —
+    the channel is created empty and fills in when ``start`` is called.
+    ``focus``, if given, is set on the channel before the snapshot.
+    """
+    channel = _channel(document_id)
+    queue: asyncio.Queue = asyncio.Queue()
+    channel.subscribers.add(queue)
+    if focus is not None:
+        set_focus(document_id, focus)
+    try:
+        yield "snapshot", channel.snapshot()
+        if channel.finished:
+            return
+        while True:
+            event, data = await queue.get()
+            yield event, data
+            if event == "done":
+                return
+    finally:
+        channel.subscribers.discard(queue)
+        # Keep finished channels until they expire so late clients see the final states
+        if not channel.active and (channel.expired or not channel.finished):
+            _drop_if_unused(document_id)
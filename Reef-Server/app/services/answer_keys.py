@@ -8,20 +8,32 @@ blocks the rest.
 """
 
 import asyncio
+import functools
 import json
 import logging
+from typing import Callable
 
 from app.config import settings
+from app.services import answer_key_cache, answer_key_events, cost_ledger, question_index
 from app.services.http_pool import get_client as get_http
 from app.models.answer_key import PartAnswer, QuestionAnswer
 from app.services.inference_client import extract_json
-from app.services.llm_client import LLMClient
-from app.services.prompts import ANSWER_KEY_PROMPT
+from app.services.llm_client import LLMResult, get_llm_client, json_schema, schema_instruction
+from app.services.prompts import ANSWER_KEY_PROMPT, ANSWER_KEY_QUESTION_PROMPT
+from app.services.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from app.services.tracing import span
 
 logger = logging.getLogger(__name__)
 
 ANSWER_KEY_MODEL = "google/gemini-2.5-flash"
 
+# Batched upserts: flush at this many rows, or this long after the first one
+ANSWER_KEY_BATCH_SIZE = 10
+ANSWER_KEY_FLUSH_SECONDS = 2.0
+
+# Questions solved at once; the rest wait in focus-first order
+ANSWER_KEY_CONCURRENCY = 6
+
 
 # ---------------------------------------------------------------------------
 # Supabase helpers (same pattern as progress.py)
@@ -37,7 +49,7 @@ def _supabase_headers() -> dict:
     }
 
 
-async def _upsert_answer_key(
+def _answer_key_row(
     document_id: str,
     question_number: int,
     question_json: dict,
@@ -45,10 +57,8 @@ async def _upsert_answer_key(
     model: str,
     input_tokens: int,
     output_tokens: int,
-) -> None:
-    """Insert or update an answer key row in Supabase."""
-    url = f"{settings.supabase_url}/rest/v1/answer_keys"
-    payload = {
+) -> dict:
+    return {
         "document_id": document_id,
         "question_number": question_number,
         "question_json": question_json,
@@ -57,91 +67,239 @@ async def _upsert_answer_key(
         "input_tokens": input_tokens,
         "output_tokens": output_tokens,
     }
+
+
+async def _upsert_answer_keys(rows: list[dict]) -> None:
+    """Insert or update answer key rows in one PostgREST request."""
+    url = f"{settings.supabase_url}/rest/v1/answer_keys?on_conflict=document_id,question_number"
     client = get_http()
-    resp = await client.post(
-        url, json=payload, headers=_supabase_headers(),
-    )
+    resp = await client.post(url, json=rows, headers=_supabase_headers(), timeout=30)
     resp.raise_for_status()
 
 
+class AnswerKeyWriter:
+    """Collects finished answer-key rows and upserts them in batches.
+
+    Rows are flushed as soon as ``batch_size`` are buffered, or
+    ``flush_seconds`` after the first buffered row, whichever comes first.
+    A failed batch is retried row by row so one bad row only loses itself.
+    ``on_result(row, stored)`` is called once per row after its upsert.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ANSWER_KEY_BATCH_SIZE,
+        flush_seconds: float = ANSWER_KEY_FLUSH_SECONDS,
+        on_result: Callable[[dict, bool], None] | None = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.on_result = on_result
+        # Keyed by (document_id, question_number) — PostgREST rejects an
+        # upsert that touches the same row twice.
+        self._pending: dict[tuple[str, int], dict] = {}
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+        self.written = 0
+        self.failed = 0
+
+    async def add(self, row: dict, urgent: bool = False) -> None:
+        """Buffer ``row``; ``urgent`` flushes it (and anything buffered) now."""
+        self._pending[(row["document_id"], row["question_number"])] = row
+        if urgent or len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_seconds)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            rows = list(self._pending.values())
+            self._pending.clear()
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+                self._timer = None
+            with span("answer_keys.upsert", rows=len(rows)):
+                try:
+                    await _upsert_answer_keys(rows)
+                    self.written += len(rows)
+                    for row in rows:
+                        self._notify(row, True)
+                    return
+                except Exception as e:
+                    if len(rows) == 1:
+                        self._row_failed(rows[0], e)
+                        return
+                    logger.warning(
+                        f"  [answer-key] Batch upsert of {len(rows)} rows failed ({e}); retrying per row"
+                    )
+                for row in rows:
+                    try:
+                        await _upsert_answer_keys([row])
+                        self.written += 1
+                        self._notify(row, True)
+                    except Exception as row_err:
+                        self._row_failed(row, row_err)
+
+    def _row_failed(self, row: dict, error: Exception) -> None:
+        self.failed += 1
+        logger.error(
+            f"  [answer-key] Q{row['question_number']} for {row['document_id']}: "
+            f"upsert failed: {type(error).__name__}: {error}"
+        )
+        self._notify(row, False)
+
+    def _notify(self, row: dict, stored: bool) -> None:
+        if self.on_result is None:
+            return
+        try:
+            self.on_result(row, stored)
+        except Exception as e:
+            logger.warning(f"  [answer-key] on_result callback failed: {e}")
+
+    async def close(self) -> None:
+        """Flush whatever is still buffered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+
 # ---------------------------------------------------------------------------
 # Per-question generation
 # ---------------------------------------------------------------------------
 
 
-async def _generate_single_answer(
-    document_id: str,
+@functools.cache
+def _answer_key_system_prompt() -> str:
+    """Instructions plus schema for every answer-key call.
+
+    Identical across calls, so it leads the request and the provider can
+    serve it from its prompt cache.
+    """
+    return ANSWER_KEY_PROMPT + schema_instruction(QuestionAnswer)
+
+
+async def _solve_question(
     question_number: int,
     question_dict: dict,
-    figure_images: list[bytes] | None = None,
-    user_id: str | None = None,
-) -> None:
-    """Generate and store the answer for one question. Never raises."""
-    try:
-        prompt = ANSWER_KEY_PROMPT.replace(
-            "{question_json}", json.dumps(question_dict, indent=2),
-        )
+    figure_images: list[bytes] | None,
+    priority: int = PRIORITY_BACKGROUND,
+) -> tuple[QuestionAnswer, LLMResult]:
+    """Ask the answer-key model for a solution and normalize it.
 
-        if figure_images:
-            prompt += (
-                "\n\n## Attached Figures\n"
-                f"{len(figure_images)} figure image(s) are attached. These are the diagrams "
-                "referenced in the question (e.g. free body diagrams, circuits, beam layouts, "
-                "geometric configurations). Examine them carefully — the values, angles, "
-                "dimensions, and labels in the figures are critical for generating correct solutions."
-            )
+    Answer keys are fire-and-forget, so they queue behind interactive
+    calls in the rate limiter unless the user is looking at the question.
+    """
+    prompt = ANSWER_KEY_QUESTION_PROMPT.replace(
+        "{question_json}", json.dumps(question_dict, indent=2),
+    )
 
-        # Add JSON schema instructions for non-structured-output APIs
-        schema_instruction = (
-            "\n\n## CRITICAL: Output Format\n"
-            "Return ONLY a valid JSON object matching this schema. No markdown, no explanation, no code fences.\n"
-            f"```json\n{json.dumps(QuestionAnswer.model_json_schema(), indent=2)}\n```"
+    if figure_images:
+        prompt += (
+            "\n\n## Attached Figures\n"
+            f"{len(figure_images)} figure image(s) are attached. These are the diagrams "
+            "referenced in the question (e.g. free body diagrams, circuits, beam layouts, "
+            "geometric configurations). Examine them carefully — the values, angles, "
+            "dimensions, and labels in the figures are critical for generating correct solutions."
         )
 
-        model_used = ANSWER_KEY_MODEL
-        input_tokens = 0
-        output_tokens = 0
-
-        llm_client = LLMClient(
-            api_key=settings.openrouter_api_key,
-            model=ANSWER_KEY_MODEL,
-            base_url="https://openrouter.ai/api/v1",
-        )
+    llm_client = get_llm_client(
+        ANSWER_KEY_MODEL, settings.openrouter_api_key, "https://openrouter.ai/api/v1",
+    )
+    with span("answer_keys.llm", question=question_number, model=ANSWER_KEY_MODEL) as llm_span:
         result = await llm_client.generate(
-            prompt=prompt + schema_instruction,
+            prompt=prompt,
+            system_prompt=_answer_key_system_prompt(),
             images=figure_images,
-            response_schema=QuestionAnswer.model_json_schema(),
+            response_schema=json_schema(QuestionAnswer),
             timeout=180.0,
+            priority=priority,
         )
-        content = extract_json(result.content)
-        try:
-            answer = QuestionAnswer.model_validate_json(content)
-        except Exception as parse_err:
-            logger.warning(f"  [answer-key] Q{question_number}: JSON parse failed: {parse_err}")
-            logger.warning(f"  [answer-key] Q{question_number}: raw content (first 500 chars): {content[:500]}")
-            raise
-        input_tokens = result.input_tokens
-        output_tokens = result.output_tokens
-
-        # Normalize: every question must have parts. If the LLM put steps
-        # at the top level (no parts), wrap them into a single part "a".
-        if answer.steps and not answer.parts:
-            answer = QuestionAnswer(
-                question_number=answer.question_number,
-                steps=[],
-                final_answer="",
-                parts=[PartAnswer(
-                    label="a",
-                    steps=answer.steps,
-                    final_answer=answer.final_answer,
-                )],
+        llm_span.set_attribute("cached_tokens", result.cached_tokens)
+    content = extract_json(result.content)
+    try:
+        answer = QuestionAnswer.model_validate_json(content)
+    except Exception as parse_err:
+        logger.warning(f"  [answer-key] Q{question_number}: JSON parse failed: {parse_err}")
+        logger.warning(f"  [answer-key] Q{question_number}: raw content (first 500 chars): {content[:500]}")
+        raise
+
+    # Normalize: every question must have parts. If the LLM put steps
+    # at the top level (no parts), wrap them into a single part "a".
+    if answer.steps and not answer.parts:
+        answer = QuestionAnswer(
+            question_number=answer.question_number,
+            steps=[],
+            final_answer="",
+            parts=[PartAnswer(
+                label="a",
+                steps=answer.steps,
+                final_answer=answer.final_answer,
+            )],
+        )
+    return answer, result
+
+
+async def _generate_single_answer(
+    document_id: str,
+    question_number: int,
+    question_dict: dict,
+    writer: AnswerKeyWriter,
+    figure_images: list[bytes] | None = None,
+    user_id: str | None = None,
+    cache_key: str | None = None,
+    figure_hashes: dict[str, str] | None = None,
+) -> bool:
+    """Generate (or reuse a cached) answer and hand its row to ``writer``.
+
+    Reuse order: exact ``cache_key`` hit, then the cached answer of a
+    near-identical question from ``question_index``.
+    Returns False if generation failed. Never raises.
+    """
+    try:
+        cached = None
+        if cache_key is not None:
+            with span("answer_keys.cache", question=question_number) as cache_span:
+                cached = await answer_key_cache.lookup(cache_key)
+                near = False
+                if cached is None:
+                    similar_key = question_index.find_similar_question(
+                        question_dict, figure_hashes or {}, f"{document_id} Q{question_number}",
+                    )
+                    if similar_key is not None and similar_key != cache_key:
+                        cached = await answer_key_cache.lookup(similar_key)
+                        near = cached is not None
+                cache_span.set_attribute("hit", cached is not None)
+                cache_span.set_attribute("near_duplicate", near)
+
+        if cached is not None:
+            answer = QuestionAnswer.model_validate_json(cached["answer_text"])
+            answer.question_number = question_number
+            model_used = cached["model"] or ANSWER_KEY_MODEL
+            input_tokens = output_tokens = 0
+        else:
+            focused = answer_key_events.get_focus(document_id) == question_number
+            answer, result = await _solve_question(
+                question_number, question_dict, figure_images,
+                priority=PRIORITY_INTERACTIVE if focused else PRIORITY_BACKGROUND,
             )
+            model_used = ANSWER_KEY_MODEL
+            input_tokens = result.input_tokens
+            output_tokens = result.output_tokens
 
         # Skip KaTeX validation — adds ~60s per document and Gemini 2.5 Flash
         # rarely produces invalid LaTeX. If a rare expression fails, KaTeX on
         # the client will just show the raw text.
 
-        await _upsert_answer_key(
+        # The question the user is looking at skips the batch wait
+        await writer.add(_answer_key_row(
             document_id=document_id,
             question_number=question_number,
             question_json=question_dict,
@@ -149,18 +307,31 @@ async def _generate_single_answer(
             model=model_used,
             input_tokens=input_tokens,
             output_tokens=output_tokens,
-        )
+        ), urgent=answer_key_events.get_focus(document_id) == question_number)
+        if cached is None and cache_key is not None:
+            await answer_key_cache.store(cache_key, answer.model_dump_json(), model_used)
+            question_index.add_question(question_dict, figure_hashes or {}, cache_key)
 
         logger.info(
-            f"  [answer-key] Q{question_number} for {document_id}: "
-            f"model={model_used} {input_tokens}in/{output_tokens}out tokens"
+            "  [answer-key] Q%d for %s: model=%s %din/%dout tokens%s",
+            question_number, document_id, model_used, input_tokens, output_tokens,
+            " (cached)" if cached is not None else "",
         )
+        return True
     except Exception as e:
         import traceback
         logger.error(
             f"  [answer-key] Q{question_number} for {document_id} failed: {type(e).__name__}: {e!r}\n"
             + traceback.format_exc()
         )
+        return False
+
+
+def _next_question(remaining: list[int], focus: int | None) -> int:
+    """Focused question first, then the ones after it, then the ones before."""
+    if focus is None:
+        return min(remaining)
+    return min(remaining, key=lambda q: (q != focus, q < focus, q))
 
 
 # ---------------------------------------------------------------------------
@@ -174,7 +345,11 @@ async def generate_answer_keys(
     image_data: dict[str, bytes] | None = None,
     user_id: str | None = None,
 ) -> None:
-    """Generate answer keys for all questions in parallel. Fire-and-forget.
+    """Generate answer keys for all questions. Fire-and-forget.
+
+    ``ANSWER_KEY_CONCURRENCY`` workers pull questions focus-first (see
+    ``_next_question``) and readiness is published per question on the
+    document's ``answer_key_events`` channel.
 
     Args:
         document_id: Supabase document ID.
@@ -184,6 +359,7 @@ async def generate_answer_keys(
     """
     if not questions or not settings.supabase_service_role_key:
         return
+    cost_ledger.set_context(user_id, "answer_key", document_id=document_id)
 
     def _get_question_images(q_dict: dict) -> list[bytes] | None:
         """Collect figure image bytes for a question and its parts."""
@@ -197,13 +373,38 @@ async def generate_answer_keys(
         imgs = [image_data[f] for f in figures if f in image_data]
         return imgs if imgs else None
 
-    # Run answer key generation in parallel (inference API supports concurrent agents)
-    tasks = [
-        _generate_single_answer(document_id, q_num, q_dict, figure_images=_get_question_images(q_dict), user_id=user_id)
-        for q_num, q_dict in questions
-    ]
+    by_number = dict(questions)
+    hashes = question_index.figure_hashes(image_data)
+    remaining = [q_num for q_num, _ in questions]
+    answer_key_events.start(document_id, remaining)
+
+    def _on_result(row: dict, stored: bool) -> None:
+        status = answer_key_events.READY if stored else answer_key_events.FAILED
+        answer_key_events.publish(document_id, row["question_number"], status)
+
+    writer = AnswerKeyWriter(on_result=_on_result)
 
-    await asyncio.gather(*tasks)
+    async def _worker() -> None:
+        while remaining:
+            q_num = _next_question(remaining, answer_key_events.get_focus(document_id))
+            remaining.remove(q_num)
+            answer_key_events.publish(document_id, q_num, answer_key_events.GENERATING)
+            q_dict = by_number[q_num]
+            ok = await _generate_single_answer(
+                document_id, q_num, q_dict, writer,
+                figure_images=_get_question_images(q_dict), user_id=user_id,
+                cache_key=answer_key_cache.question_cache_key(q_dict, hashes, ANSWER_KEY_MODEL),
+                figure_hashes=hashes,
+            )
+            if not ok:
+                answer_key_events.publish(document_id, q_num, answer_key_events.FAILED)
+
+    try:
+        await asyncio.gather(*(_worker() for _ in range(min(ANSWER_KEY_CONCURRENCY, len(remaining)))))
+    finally:
+        await writer.close()
+        answer_key_events.finish(document_id)
     logger.info(
-        f"  [answer-key] Completed {len(tasks)} answer keys for {document_id}"
+        "  [answer-key] Completed %d answer keys for %s (%d stored, %d failed to store)",
+        len(questions), document_id, writer.written, writer.failed,
     )
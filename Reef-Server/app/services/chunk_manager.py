@@ -0,0 +1,392 @@
+"""Incremental stroke transcription — re-transcribe only the lines that changed.
+
+A canvas is transcribed after every pen stroke. Sending the whole page to
+Mathpix each time makes an edit cost O(page). Instead, strokes are
+clustered into line-level chunks: a stroke joins a cluster whose bounding
+box it overlaps, continues on the same line (horizontal gap of at most
+``max(1.5 * h, 20)`` while the vertical ranges overlap), or sits just
+above/below it like a sub/superscript (vertical gap of at most
+``max(0.3 * h, 5)`` while the horizontal ranges overlap), where ``h`` is
+the taller of the two boxes. A stroke that joins several clusters bridges
+them into one. ``StrokeClusterer`` keeps clusters in a uniform grid so a
+stroke is compared only with nearby clusters, and one clusterer per canvas
+is kept between calls so an edit updates it instead of rebuilding it.
+
+Each chunk is fingerprinted by the content of its strokes. The previous
+chunk list (``canvas_strokes.transcription_chunks``) maps fingerprints to
+LaTeX, so only chunks whose strokes changed are sent to Mathpix. The page
+LaTeX is the chunks' LaTeX in reading order, joined by newlines. The
+latest chunk list of each canvas is also kept in memory
+(``latest_chunks``), so the next call doesn't depend on the database
+write of the previous one having landed; a stale list only costs Mathpix
+calls, since chunks are matched by fingerprint.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+BBox = tuple[float, float, float, float]  # (min_x, min_y, max_x, max_y)
+
+LINE_GAP_FACTOR = 1.5
+MIN_LINE_GAP = 20.0
+SCRIPT_GAP_FACTOR = 0.3
+MIN_SCRIPT_GAP = 5.0
+# Grid cell edge for the clustering index, about one handwritten line
+CELL_SIZE = 64.0
+# Canvases whose clusterer and chunks are kept between calls (least recently used evicted)
+CANVAS_CACHE_SIZE = 256
+# Coordinates are rounded before hashing so JSON round-trips don't
+# change a fingerprint
+FINGERPRINT_DECIMALS = 2
+
+
+# ---------------------------------------------------------------------------
+# Clustering
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class StrokeCluster:
+    stroke_indices: list[int]
+    bbox: BBox
+
+
+def _stroke_bbox(stroke: dict) -> BBox:
+    xs, ys = stroke.get("x") or [], stroke.get("y") or []
+    if not xs or not ys:
+        return (0, 0, 0, 0)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _union(a: BBox, b: BBox) -> BBox:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _bboxes_join(a: BBox, b: BBox) -> bool:
+    """Whether two boxes belong to the same chunk (see module docstring)."""
+    h = max(a[3] - a[1], b[3] - b[1])
+    x_gap = max(a[0], b[0]) - min(a[2], b[2])  # <= 0 when x ranges overlap
+    y_gap = max(a[1], b[1]) - min(a[3], b[3])
+    if x_gap <= 0 and y_gap <= 0:
+        return True
+    if y_gap <= 0:
+        return x_gap <= max(LINE_GAP_FACTOR * h, MIN_LINE_GAP)
+    if x_gap <= 0:
+        return y_gap <= max(SCRIPT_GAP_FACTOR * h, MIN_SCRIPT_GAP)
+    return False
+
+
+def _should_join(stroke: dict, cluster_bbox: BBox) -> bool:
+    return _bboxes_join(_stroke_bbox(stroke), cluster_bbox)
+
+
+def _reach(bbox: BBox) -> BBox:
+    """``bbox`` grown by the farthest distance at which it can join anything.
+
+    Join thresholds use the taller of the two boxes, so two boxes that join
+    always have overlapping reaches — the grid only needs to find those.
+    """
+    h = bbox[3] - bbox[1]
+    dx = max(LINE_GAP_FACTOR * h, MIN_LINE_GAP)
+    dy = max(SCRIPT_GAP_FACTOR * h, MIN_SCRIPT_GAP)
+    return (bbox[0] - dx, bbox[1] - dy, bbox[2] + dx, bbox[3] + dy)
+
+
+Rect = tuple[int, int, int, int]  # inclusive grid cell range (x0, y0, x1, y1)
+
+
+@dataclass
+class _Cluster:
+    keys: list
+    bbox: BBox
+    rect: Rect  # cells the cluster is registered in
+
+
+def _rect_cells(rect: Rect, skip: Rect | None = None):
+    """Cells of ``rect``, leaving out those of ``skip`` (a sub-rectangle)."""
+    x0, y0, x1, y1 = rect
+    for cx in range(x0, x1 + 1):
+        if skip is not None and skip[0] <= cx <= skip[2]:
+            rows = (range(y0, skip[1]), range(skip[3] + 1, y1 + 1))
+        else:
+            rows = (range(y0, y1 + 1),)
+        for ys in rows:
+            for cy in ys:
+                yield cx, cy
+
+
+class StrokeClusterer:
+    """Incremental clustering backed by a uniform grid.
+
+    Each cluster is registered in every ``CELL_SIZE`` cell its reach covers,
+    so a new stroke is only tested against clusters in the cells its own
+    reach covers instead of every cluster on the page. When clusters merge,
+    the smaller ones are folded into the largest, which only registers the
+    cells its grown reach adds. Strokes are added and removed by key;
+    removing a stroke re-clusters only the strokes of its cluster, which
+    may split it.
+    """
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self._bboxes: dict = {}  # key -> bbox
+        self._order: dict = {}  # key -> insertion sequence
+        self._cluster_of: dict = {}  # key -> cluster id
+        self._clusters: dict[int, _Cluster] = {}
+        self._cells: dict[tuple[int, int], set[int]] = {}
+        self._next_id = 0
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._bboxes)
+
+    def __contains__(self, key) -> bool:
+        return key in self._bboxes
+
+    def keys(self) -> list:
+        return list(self._bboxes)
+
+    def _rect(self, bbox: BBox) -> Rect:
+        x0, y0, x1, y1 = _reach(bbox)
+        size = self.cell_size
+        return (int(x0 // size), int(y0 // size), int(x1 // size), int(y1 // size))
+
+    def _candidates(self, bbox: BBox) -> set[int]:
+        rect = self._rect(bbox)
+        # A reach wider than there are clusters (one huge cluster) is
+        # cheaper to check cluster by cluster
+        if (rect[2] - rect[0] + 1) * (rect[3] - rect[1] + 1) > len(self._clusters):
+            return set(self._clusters)
+        found: set[int] = set()
+        for cell in _rect_cells(rect):
+            found |= self._cells.get(cell, set())
+        return found
+
+    def _register(self, cid: int, rect: Rect, old: Rect | None = None) -> None:
+        for cell in _rect_cells(rect, skip=old):
+            self._cells.setdefault(cell, set()).add(cid)
+
+    def _unindex(self, cid: int) -> _Cluster:
+        cluster = self._clusters.pop(cid)
+        for cell in _rect_cells(cluster.rect):
+            ids = self._cells[cell]
+            ids.discard(cid)
+            if not ids:
+                del self._cells[cell]
+        return cluster
+
+    def _insert(self, keys: list, bbox: BBox) -> None:
+        joined = [cid for cid in self._candidates(bbox) if _bboxes_join(bbox, self._clusters[cid].bbox)]
+        if not joined:
+            cid = self._next_id
+            self._next_id += 1
+            rect = self._rect(bbox)
+            self._clusters[cid] = _Cluster(keys, bbox, rect)
+            self._register(cid, rect)
+            for key in keys:
+                self._cluster_of[key] = cid
+            return
+
+        base_id = max(joined, key=lambda cid: len(self._clusters[cid].keys))
+        base = self._clusters[base_id]
+        absorbed = keys
+        # A grown cluster may now reach clusters it didn't before; repeat
+        # until nothing else joins
+        while True:
+            for cid in joined:
+                if cid != base_id:
+                    cluster = self._unindex(cid)
+                    absorbed.extend(cluster.keys)
+                    bbox = _union(bbox, cluster.bbox)
+            base.bbox = _union(base.bbox, bbox)
+            rect = self._rect(base.bbox)
+            if rect != base.rect:
+                grown = (min(rect[0], base.rect[0]), min(rect[1], base.rect[1]),
+                         max(rect[2], base.rect[2]), max(rect[3], base.rect[3]))
+                self._register(base_id, grown, old=base.rect)
+                base.rect = grown
+            joined = [
+                cid for cid in self._candidates(base.bbox)
+                if cid != base_id and _bboxes_join(base.bbox, self._clusters[cid].bbox)
+            ]
+            if not joined:
+                break
+        base.keys.extend(absorbed)
+        for key in absorbed:
+            self._cluster_of[key] = base_id
+
+    def add(self, key, bbox: BBox) -> None:
+        self._bboxes[key] = bbox
+        self._order[key] = self._next_seq
+        self._next_seq += 1
+        self._insert([key], bbox)
+
+    def remove(self, key) -> None:
+        del self._bboxes[key]
+        del self._order[key]
+        cluster = self._unindex(self._cluster_of.pop(key))
+        rest = sorted((k for k in cluster.keys if k != key), key=self._order.__getitem__)
+        for k in rest:
+            self._insert([k], self._bboxes[k])
+
+    def clusters(self) -> list[tuple[list, BBox]]:
+        """``(keys, bbox)`` per cluster, in reading order."""
+        ordered = sorted(self._clusters.values(), key=lambda c: (c.bbox[1], c.bbox[0]))
+        return [(c.keys, c.bbox) for c in ordered]
+
+
+def _cluster_strokes(strokes: list[dict]) -> list[StrokeCluster]:
+    """Group strokes into line-level clusters, returned in reading order."""
+    clusterer = StrokeClusterer()
+    for i, stroke in enumerate(strokes):
+        clusterer.add(i, _stroke_bbox(stroke))
+    return [StrokeCluster(sorted(keys), bbox) for keys, bbox in clusterer.clusters()]
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+
+
+def _fingerprint_strokes(strokes: list[dict]) -> str:
+    """Content hash of an ordered list of strokes."""
+    rounded = [
+        [[round(v, FINGERPRINT_DECIMALS) for v in s.get("x") or []],
+         [round(v, FINGERPRINT_DECIMALS) for v in s.get("y") or []]]
+        for s in strokes
+    ]
+    payload = json.dumps(rounded, separators=(",", ":")).encode()
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def _stroke_keys(strokes: list[dict]) -> list[tuple[int, int]]:
+    """One in-process key per stroke: a hash of its points plus an occurrence
+    count for duplicates. Cheaper than ``_fingerprint_strokes``; never stored."""
+    seen: dict[int, int] = {}
+    keys = []
+    for stroke in strokes:
+        h = hash((tuple(stroke.get("x") or ()), tuple(stroke.get("y") or ())))
+        seen[h] = seen.get(h, 0) + 1
+        keys.append((h, seen[h]))
+    return keys
+
+
+# ---------------------------------------------------------------------------
+# Per-canvas incremental clustering
+# ---------------------------------------------------------------------------
+
+_canvas_clusterers: OrderedDict[tuple[str, str, str], StrokeClusterer] = OrderedDict()
+_canvas_chunks: OrderedDict[tuple[str, str, str], list[dict]] = OrderedDict()
+
+
+def latest_chunks(canvas: tuple[str, str, str]) -> list[dict] | None:
+    """The chunk list of the canvas's last transcription in this process, if kept."""
+    return _canvas_chunks.get(canvas)
+
+
+def _canvas_clusters(canvas: tuple[str, str, str], strokes: list[dict]) -> list[StrokeCluster]:
+    """``_cluster_strokes(strokes)``, updating the canvas's previous clustering.
+
+    Each call gets the full stroke list; it is diffed against the strokes
+    the canvas's clusterer already holds, so an added or erased stroke
+    costs one grid insert or one cluster re-cluster instead of a rebuild.
+    """
+    keys = _stroke_keys(strokes)
+    current = set(keys)
+    clusterer = _canvas_clusterers.pop(canvas, None)
+    if clusterer is not None:
+        removed = [k for k in clusterer.keys() if k not in current]
+        if len(removed) > len(clusterer) // 2:
+            clusterer = None  # mostly a different page; rebuilding is cheaper
+        else:
+            for key in removed:
+                clusterer.remove(key)
+    if clusterer is None:
+        clusterer = StrokeClusterer()
+    for key, stroke in zip(keys, strokes):
+        if key not in clusterer:
+            clusterer.add(key, _stroke_bbox(stroke))
+
+    _canvas_clusterers[canvas] = clusterer
+    while len(_canvas_clusterers) > CANVAS_CACHE_SIZE:
+        _canvas_clusterers.popitem(last=False)
+
+    index_of = {key: i for i, key in enumerate(keys)}
+    return [
+        StrokeCluster(sorted(index_of[k] for k in cluster_keys), bbox)
+        for cluster_keys, bbox in clusterer.clusters()
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Transcription
+# ---------------------------------------------------------------------------
+
+
+async def transcribe_with_chunks(
+    strokes: list[dict],
+    user_id: str,
+    document_id: str,
+    question_label: str,
+    previous_chunks: list[dict] | None,
+    transcribe: Callable[[list[dict]], Awaitable[str]],
+) -> tuple[str, list[dict]]:
+    """Transcribe ``strokes`` reusing the LaTeX of unchanged chunks.
+
+    ``transcribe`` sends one chunk's strokes to Mathpix. Returns the page
+    LaTeX and the new chunk list to store as ``transcription_chunks``. A
+    chunk whose transcription fails is stored without LaTeX (so the next
+    call retries it) and left out of the page LaTeX.
+    """
+    if not strokes:
+        return "", []
+
+    cached = {
+        c["fingerprint"]: c["latex"]
+        for c in previous_chunks or []
+        if c.get("fingerprint") and c.get("latex") is not None
+    }
+    chunks: list[dict] = []
+    dirty: list[tuple[dict, list[dict]]] = []
+    for cluster in _canvas_clusters((user_id, document_id, question_label), strokes):
+        chunk_strokes = [strokes[i] for i in cluster.stroke_indices]
+        fingerprint = _fingerprint_strokes(chunk_strokes)
+        chunk = {
+            "fingerprint": fingerprint,
+            "bbox": list(cluster.bbox),
+            "stroke_count": len(chunk_strokes),
+            "latex": cached.get(fingerprint),
+        }
+        chunks.append(chunk)
+        if chunk["latex"] is None:
+            dirty.append((chunk, chunk_strokes))
+
+    results = await asyncio.gather(
+        *(transcribe(chunk_strokes) for _, chunk_strokes in dirty),
+        return_exceptions=True,
+    )
+    for (chunk, _), result in zip(dirty, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"  [chunks] {document_id}/{question_label}: chunk transcription failed - {result}")
+            continue
+        chunk["latex"] = result
+
+    logger.info(
+        "  [chunks] %s/%s: %d chunks, %d transcribed, %d cached",
+        document_id, question_label, len(chunks), len(dirty), len(chunks) - len(dirty),
+        extra={"user_id": user_id},
+    )
+    canvas = (user_id, document_id, question_label)
+    _canvas_chunks.pop(canvas, None)
+    _canvas_chunks[canvas] = chunks
+    while len(_canvas_chunks) > CANVAS_CACHE_SIZE:
+        _canvas_chunks.popitem(last=False)
+    latex = "\n".join(c["latex"] for c in chunks if c["latex"])
+    return latex, chunks
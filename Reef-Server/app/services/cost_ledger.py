@@ -0,0 +1,201 @@
+"""Buffered writer for the ``api_costs`` ledger.
+
+Every paid or timed external call — ``LLMClient.generate``, Mathpix PDF
+and image OCR, tectonic compiles — calls ``record``, which only appends
+a row to an in-process buffer. A background flusher (started in the app
+lifespan) POSTs the buffer to Supabase in batches of up to
+``MAX_BATCH`` rows every ``FLUSH_SECONDS``, so no request waits on a
+ledger round trip.
+
+Who the call is for comes from a task-local context set with
+``set_context`` at the top of a pipeline or answer-key task (like
+``tracing.start_trace``); ``api_costs.user_id`` is required, so calls
+made outside any context are not recorded.
+
+Rows that fail to flush on a transport error or 5xx are put back and
+retried on the next tick; past ``MAX_BUFFERED`` rows the oldest are
+dropped with a warning rather than growing without bound. A batch
+rejected with a 4xx (e.g. a ``user_id`` with no profile row) is retried
+row by row and only the rejected rows are dropped, so one bad row can't
+hold back the rows queued after it.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from contextvars import ContextVar
+
+import httpx
+
+from app.config import settings
+from app.services.http_pool import get_client as get_http
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 2.0
+MAX_BATCH = 200
+MAX_BUFFERED = 10_000
+
+# Dollars per input / output token on OpenRouter
+MODEL_RATES: dict[str, tuple[float, float]] = {
+    "deepseek/deepseek-r1": (0.55 / 1_000_000, 2.19 / 1_000_000),
+    "deepseek/deepseek-v3.2": (0.25 / 1_000_000, 0.40 / 1_000_000),
+    "google/gemini-2.5-flash": (0.15 / 1_000_000, 0.60 / 1_000_000),
+    "google/gemini-3-flash-preview": (0.50 / 1_000_000, 3.00 / 1_000_000),
+    "google/gemini-3.1-pro-preview": (1.25 / 1_000_000, 10.00 / 1_000_000),
+}
+DEFAULT_RATE = (0.25 / 1_000_000, 0.40 / 1_000_000)
+
+# Mathpix list prices
+MATHPIX_PDF_PAGE_DOLLARS = 0.005
+MATHPIX_IMAGE_DOLLARS = 0.002
+MATHPIX_STROKES_SESSION_DOLLARS = 0.01  # billed per session, any number of requests
+
+
+def llm_cost_dollars(model: str, input_tokens: int, output_tokens: int) -> float:
+    in_rate, out_rate = MODEL_RATES.get(model, DEFAULT_RATE)
+    return input_tokens * in_rate + output_tokens * out_rate
+
+
+# ---------------------------------------------------------------------------
+# Context
+# ---------------------------------------------------------------------------
+
+_context: ContextVar[dict | None] = ContextVar("cost_context", default=None)
+
+
+def set_context(user_id: str | None, feature: str, **metadata) -> None:
+    """Attribute calls from the current task (and tasks it spawns) to ``user_id``.
+
+    ``metadata`` (``document_id`` etc.) is stored on every row.
+    """
+    _context.set({"user_id": user_id, "feature": feature, "metadata": metadata})
+
+
+# ---------------------------------------------------------------------------
+# Buffer
+# ---------------------------------------------------------------------------
+
+_buffer: deque[dict] = deque(maxlen=MAX_BUFFERED)
+_flusher: asyncio.Task | None = None
+
+
+def record(
+    provider: str,
+    *,
+    model: str = "",
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cost_dollars: float = 0.0,
+    latency_ms: float | None = None,
+    **metadata,
+) -> None:
+    """Queue one ledger row for the current context. Never blocks or raises.
+
+    Safe to call from ``asyncio.to_thread`` workers: the context is copied
+    into the thread and deque appends/pops are atomic.
+    """
+    ctx = _context.get()
+    if ctx is None or not ctx["user_id"]:
+        return
+    if len(_buffer) == MAX_BUFFERED:
+        logger.warning("  [cost-ledger] buffer full, dropping the oldest row")
+    _buffer.append({
+        "user_id": ctx["user_id"],
+        "feature": ctx["feature"],
+        "provider": provider,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_dollars": round(cost_dollars, 6),
+        "latency_ms": round(latency_ms) if latency_ms is not None else None,
+        "metadata": {**ctx["metadata"], **metadata} or None,
+    })
+
+
+async def _post(client: httpx.AsyncClient, rows: list[dict]) -> None:
+    resp = await client.post(
+        f"{settings.supabase_url}/rest/v1/api_costs",
+        json=rows,
+        headers={
+            "apikey": settings.supabase_service_role_key,
+            "Authorization": f"Bearer {settings.supabase_service_role_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal",
+        },
+        timeout=10,
+    )
+    resp.raise_for_status()
+
+
+def _retryable(e: Exception) -> bool:
+    """Transport errors, 5xx and 408/429 may pass later; other 4xx won't."""
+    if isinstance(e, httpx.HTTPStatusError):
+        status = e.response.status_code
+        return status >= 500 or status in (408, 429)
+    return True
+
+
+def _requeue(rows: list[dict]) -> None:
+    """Put unflushed rows back at the front, dropping the oldest if they don't fit."""
+    room = _buffer.maxlen - len(_buffer)
+    if len(rows) > room:
+        logger.warning(f"  [cost-ledger] buffer full, dropping {len(rows) - room} unflushed rows")
+        rows = rows[len(rows) - room:] if room else []
+    _buffer.extendleft(reversed(rows))
+
+
+async def flush() -> None:
+    """POST buffered rows, ``MAX_BATCH`` at a time.
+
+    A batch that fails with a transport error or 5xx is re-queued; one
+    rejected with a 4xx is retried row by row and the rejected rows dropped.
+    """
+    if not settings.supabase_service_role_key:
+        return
+    client = get_http()
+    while _buffer:
+        batch = [_buffer.popleft() for _ in range(min(MAX_BATCH, len(_buffer)))]
+        try:
+            await _post(client, batch)
+            continue
+        except Exception as e:
+            if _retryable(e):
+                logger.warning(f"  [cost-ledger] flush of {len(batch)} rows failed, will retry: {e}")
+                _requeue(batch)
+                return
+            logger.warning(f"  [cost-ledger] batch of {len(batch)} rows rejected, retrying one by one: {e}")
+        for i, row in enumerate(batch):
+            try:
+                await _post(client, [row])
+            except Exception as e:
+                if _retryable(e):
+                    logger.warning(f"  [cost-ledger] flush of {len(batch) - i} rows failed, will retry: {e}")
+                    _requeue(batch[i:])
+                    return
+                logger.warning(
+                    f"  [cost-ledger] dropping rejected row ({row['provider']}, user {row['user_id']}): {e}"
+                )
+
+
+async def _flush_forever() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_SECONDS)
+        await flush()
+
+
+def start() -> None:
+    """Start the background flusher (app lifespan)."""
+    global _flusher
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.create_task(_flush_forever())
+
+
+async def stop() -> None:
+    """Stop the flusher and write whatever is still buffered."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        await asyncio.gather(_flusher, return_exceptions=True)
+        _flusher = None
+    await flush()
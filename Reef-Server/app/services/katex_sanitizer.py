@@ -2,97 +2,289 @@
 
 Fast, regex-only transforms — no LLM calls, no subprocess.
 Called on every transcription response before returning to the client.
+
+The input is scanned once: a single precompiled pattern finds the
+commands that need rewriting and a dispatch table maps each command name
+to its rewrite. Command arguments are read as balanced brace groups, so
+``\\ensuremath{\\frac{a}{b}}`` keeps its inner braces; an argument whose
+braces don't balance ends at the first ``}``, as a ``\\{[^}]*\\}`` pattern
+would.
 """
 
 import re
+from typing import Callable
 
+# Rewrites nested deeper than this copy their arguments unchanged
+MAX_DEPTH = 64
 
-def sanitize_for_katex(latex: str) -> str:
-    """Convert Mathpix LaTeX quirks to KaTeX-compatible syntax."""
-    s = latex
+_BRACE_TOKEN = re.compile(r"\\.|[{}]", re.DOTALL)
+_FLAT_GROUP = re.compile(r"\{[^{}\\]*\}")
+_COMMAND_NAME = re.compile(r"\\[a-zA-Z]+")
+_SPACE = re.compile(r"\s*")
+_PICTURE = re.compile(r"\{(tikzpicture|pgfpicture)\}")
 
-    # Remove \tag{...} — equation numbering looks bad in sidebar
-    s = re.sub(r"\\tag\{[^}]*\}", "", s)
 
-    # \def and \newcommand not supported in KaTeX — strip them
-    s = re.sub(r"\\def\\[a-zA-Z]+\{[^}]*\}", "", s)
-    s = re.sub(r"\\newcommand\{[^}]*\}\{[^}]*\}", "", s)
+def _group_end(s: str, i: int, end: int) -> int:
+    """End (exclusive) of the brace group opening at ``s[i]``, or -1."""
+    if i >= end or s[i] != "{":
+        return -1
+    if m := _FLAT_GROUP.match(s, i, end):
+        return m.end()
+    depth = 0
+    for m in _BRACE_TOKEN.finditer(s, i, end):
+        token = m.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    # Unbalanced: fall back to the first closing brace
+    close = s.find("}", i, end)
+    return -1 if close < 0 else close + 1
 
-    # \hspace{...} → \kern{...}
-    s = re.sub(r"\\hspace\{([^}]*)\}", r"\\kern{\1}", s)
 
-    # \mathrlap, \mathllap, \mathclap — not in KaTeX, strip wrapper
-    for cmd in ("mathrlap", "mathllap", "mathclap"):
-        s = re.sub(rf"\\{cmd}\{{([^}}]*)\}}", r"\1", s)
+def _is_word_char(s: str, i: int) -> bool:
+    """Whether ``s[i]`` is a regex ``\\w`` character (False past the end)."""
+    return i < len(s) and (s[i].isalnum() or s[i] == "_")
 
-    # \displaystyle at start of expression — KaTeX supports it but
-    # Mathpix sometimes puts it outside math mode
-    s = re.sub(r"^\s*\\displaystyle\s*", "", s)
 
-    # \limits placement: \sum\limits_{...} → \sum_{...}
-    # KaTeX supports \limits but Mathpix sometimes misplaces it
-    s = re.sub(r"\\(sum|prod|int|bigcup|bigcap|coprod|bigoplus|bigotimes)\\limits", r"\\\1", s)
+class _Rewriter:
+    """One sanitize pass: rewritten pieces of ``s`` accumulate in ``out``."""
+
+    __slots__ = ("s", "out", "past_start")
+
+    def __init__(self, s: str):
+        self.s = s
+        self.out: list[str] = []
+        # Set once a rewrite that used to run after the leading-\displaystyle
+        # rule has touched the output (see ``at_start``)
+        self.past_start = False
+
+    def at_start(self) -> bool:
+        """Whether only whitespace has been written so far."""
+        return not self.past_start and all(p.isspace() for p in self.out if p)
+
+    def scan(self, pos: int, end: int, depth: int = 0) -> None:
+        s, append = self.s, self.out.append
+        if depth >= MAX_DEPTH:
+            append(s[pos:end])
+            return
+        for m in _COMMAND.finditer(s, pos, end):
+            start = m.start()
+            if start < pos:  # inside an argument a handler already consumed
+                continue
+            append(s[pos:start])
+            pos = start
+            name = m.group(1)
+            handled = _HANDLERS[name](self, name, m.end(), end, depth)
+            if handled is not None:
+                pos = handled
+        append(s[pos:end])
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+#
+# Each gets the rewriter, the command name, the index just past the name,
+# the end of the range being scanned and the nesting depth. It returns the
+# index to resume scanning at, or None to leave the command unchanged.
+# ---------------------------------------------------------------------------
+
+Handler = Callable[[_Rewriter, str, int, int, int], "int | None"]
+
+
+def _remove(groups: int) -> Handler:
+    """Drop the command and its ``groups`` brace arguments."""
+    def handle(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+        for _ in range(groups):
+            j = _group_end(rw.s, j, end)
+            if j < 0:
+                return None
+        return j
+    return handle
 
-    # Fix unbalanced \left / \right — if one is missing, remove both
-    left_count = len(re.findall(r"\\left[\(\[\{|.]", s))
-    right_count = len(re.findall(r"\\right[\)\]\}|.]", s))
-    if left_count != right_count:
-        s = re.sub(r"\\left([\(\[\{|.])", r"\1", s)
-        s = re.sub(r"\\right([\)\]\}|.])", r"\1", s)
 
-    # --- Expanded: handle more Mathpix outputs that KaTeX doesn't support ---
+def _rename(replacement: str) -> Handler:
+    """``\\name{X}`` → ``\\replacement{X}``."""
+    def handle(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+        k = _group_end(rw.s, j, end)
+        if k < 0:
+            return None
+        inner = rw.s[j + 1:k - 1]
+        if "\\" not in inner:  # no commands inside: skip the nested scan
+            rw.out.append(f"{replacement}{{{inner}}}")
+            return k
+        rw.out.append(replacement + "{")
+        rw.scan(j + 1, k - 1, depth + 1)
+        rw.out.append("}")
+        return k
+    return handle
 
-    # Chemistry: \ce{...} → strip to plain text content
-    s = re.sub(r"\\ce\{([^}]*)\}", r"\\text{\1}", s)
 
-    # \cancel, \bcancel, \xcancel — KaTeX supports \cancel but Mathpix
-    # sometimes uses variants; normalize to \cancel or strip
-    s = re.sub(r"\\bcancel\{([^}]*)\}", r"\\cancel{\1}", s)
-    s = re.sub(r"\\xcancel\{([^}]*)\}", r"\\cancel{\1}", s)
+def _unwrap(keeps_leading: bool = False) -> Handler:
+    """``\\name{A}{B}...{X}`` → ``X``.
 
-    # \mbox{...} → \text{...} (KaTeX uses \text)
-    s = re.sub(r"\\mbox\{([^}]*)\}", r"\\text{\1}", s)
+    ``keeps_leading``: a \\displaystyle at the start of ``X`` still counts
+    as the start of the expression.
+    """
+    def handle(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+        start, k = j, _group_end(rw.s, j, end)
+        if k < 0:
+            return None
+        if name in _MULTI_ARG:
+            while (n := _group_end(rw.s, k, end)) >= 0:
+                start, k = k, n
+        if not keeps_leading:
+            rw.past_start = True
+        rw.scan(start + 1, k - 1, depth + 1)
+        return k
+    return handle
 
-    # \textrm, \textsl, \textsc — normalize to \text
-    for cmd in ("textrm", "textsl", "textsc", "textup"):
-        s = re.sub(rf"\\{cmd}\{{([^}}]*)\}}", r"\\text{\1}", s)
 
-    # \ensuremath{...} → just the content
-    s = re.sub(r"\\ensuremath\{([^}]*)\}", r"\1", s)
+def _def(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """``\\def\\name{...}`` → nothing."""
+    m = _COMMAND_NAME.match(rw.s, j, end)
+    k = _group_end(rw.s, m.end(), end) if m else -1
+    return k if k >= 0 else None
 
-    # \mathrm{...} — KaTeX supports it, but Mathpix sometimes uses
-    # \rm which is not supported; convert \rm{...} → \mathrm{...}
-    s = re.sub(r"\\rm\{([^}]*)\}", r"\\mathrm{\1}", s)
-    # Bare \rm (no braces) — strip it
-    s = re.sub(r"\\rm\b(?!\{)", "", s)
 
-    # \boldmath, \unboldmath — not in KaTeX, strip
-    s = re.sub(r"\\(?:un)?boldmath\b", "", s)
+def _href(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """``\\href{url}{text}`` → ``text``."""
+    j = _group_end(rw.s, j, end)
+    k = _group_end(rw.s, j, end) if j >= 0 else -1
+    if k < 0:
+        return None
+    rw.past_start = True
+    rw.scan(j + 1, k - 1, depth + 1)
+    return k
 
-    # \vcenter{...} → just content
-    s = re.sub(r"\\vcenter\{([^}]*)\}", r"\1", s)
 
-    # \adjustbox, \scalebox, \resizebox — strip wrapper, keep content
-    for cmd in ("adjustbox", "scalebox", "resizebox"):
-        # These can have multiple brace groups; take the last one as content
-        s = re.sub(rf"\\{cmd}(?:\{{[^}}]*\}})*\{{([^}}]*)\}}", r"\1", s)
+def _includegraphics(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    s = rw.s
+    if j < end and s[j] == "[":
+        close = s.find("]", j, end)
+        if close < 0:
+            return None
+        j = close + 1
+    k = _group_end(s, j, end)
+    if k < 0:
+        return None
+    rw.out.append("[image]")
+    return k
 
-    # \intertext{...} → \text{...} (used in align environments)
-    s = re.sub(r"\\intertext\{([^}]*)\}", r"\\text{\1}", s)
 
-    # Strip entire tikz/pgf environments (can't render in KaTeX)
-    s = re.sub(r"\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}", "[diagram]", s, flags=re.DOTALL)
-    s = re.sub(r"\\begin\{pgfpicture\}.*?\\end\{pgfpicture\}", "[diagram]", s, flags=re.DOTALL)
+def _picture(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """Whole tikz/pgf environments → ``[diagram]``."""
+    m = _PICTURE.match(rw.s, j, end)
+    if m is None:
+        return None
+    terminator = f"\\end{{{m.group(1)}}}"
+    close = rw.s.find(terminator, m.end(), end)
+    if close < 0:
+        return None
+    rw.out.append("[diagram]")
+    return close + len(terminator)
 
-    # \includegraphics — can't render, replace with placeholder
-    s = re.sub(r"\\includegraphics(?:\[[^\]]*\])?\{[^}]*\}", "[image]", s)
 
-    # \href{url}{text} → just the text
-    s = re.sub(r"\\href\{[^}]*\}\{([^}]*)\}", r"\1", s)
-    # \url{...} → plain text
-    s = re.sub(r"\\url\{([^}]*)\}", r"\\text{\1}", s)
+def _displaystyle(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """Drop \\displaystyle (and the whitespace around it) at the very start."""
+    if not rw.at_start():
+        return None
+    rw.out.clear()
+    rw.past_start = True
+    return _SPACE.match(rw.s, j, end).end()
 
-    # Strip trailing whitespace/newlines
-    s = s.strip()
 
-    return s
+def _drop_limits(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """``\\sum\\limits`` → ``\\sum`` (Mathpix sometimes misplaces \\limits)."""
+    if not rw.s.startswith("\\limits", j, end):
+        return None
+    rw.out.append("\\" + name)
+    return j + len("\\limits")
+
+
+def _rm(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """``\\rm{X}`` → ``\\mathrm{X}``; a bare ``\\rm`` is dropped."""
+    if j < end and rw.s[j] == "{":
+        return _to_mathrm(rw, name, j, end, depth)
+    return _strip_bare(rw, name, j, end, depth)
+
+
+def _strip_bare(rw: _Rewriter, name: str, j: int, end: int, depth: int) -> int | None:
+    """Drop a command not followed by a word character."""
+    if _is_word_char(rw.s, j):
+        return None
+    rw.past_start = True
+    return j
+
+
+_to_mathrm = _rename("\\mathrm")
+_BIG_OPERATORS = ("sum", "prod", "int", "bigcup", "bigcap", "coprod", "bigoplus", "bigotimes")
+_MULTI_ARG = frozenset(("adjustbox", "scalebox", "resizebox"))
+
+_HANDLERS: dict[str, Handler] = {
+    # Equation numbering looks bad in the sidebar
+    "tag": _remove(1),
+    # \def and \newcommand are not supported in KaTeX
+    "def": _def,
+    "newcommand": _remove(2),
+    "hspace": _rename("\\kern"),
+    # Not in KaTeX: keep the content
+    "mathrlap": _unwrap(keeps_leading=True),
+    "mathllap": _unwrap(keeps_leading=True),
+    "mathclap": _unwrap(keeps_leading=True),
+    # KaTeX supports it, but Mathpix sometimes puts it outside math mode
+    "displaystyle": _displaystyle,
+    **{op: _drop_limits for op in _BIG_OPERATORS},
+    # Chemistry: plain text content
+    "ce": _rename("\\text"),
+    "bcancel": _rename("\\cancel"),
+    "xcancel": _rename("\\cancel"),
+    # KaTeX uses \text
+    "mbox": _rename("\\text"),
+    "textrm": _rename("\\text"),
+    "textsl": _rename("\\text"),
+    "textsc": _rename("\\text"),
+    "textup": _rename("\\text"),
+    "intertext": _rename("\\text"),
+    "url": _rename("\\text"),
+    "ensuremath": _unwrap(),
+    "rm": _rm,
+    "boldmath": _strip_bare,
+    "unboldmath": _strip_bare,
+    "vcenter": _unwrap(),
+    # Several brace groups; the last one is the content
+    "adjustbox": _unwrap(),
+    "scalebox": _unwrap(),
+    "resizebox": _unwrap(),
+    # Can't render: placeholders
+    "begin": _picture,
+    "includegraphics": _includegraphics,
+    "href": _href,
+}
+
+# What must follow a command name for it to match at all, so common
+# commands that need no rewrite (\int, \begin{array}) never reach Python
+_LOOKAHEADS = {
+    **{op: r"(?=\\limits)" for op in _BIG_OPERATORS},
+    "begin": r"(?=\{(?:tikzpicture|pgfpicture)\})",
+    # Also stripped when glued to the next word ("\displaystylex")
+    "displaystyle": "",
+}
+_COMMAND = re.compile(r"\\(" + "|".join(
+    name + _LOOKAHEADS.get(name, r"(?![a-zA-Z])") for name in sorted(_HANDLERS, key=len, reverse=True)
+) + ")")
+_DELIMITER = re.compile(r"\\(?:(left)(?=[(\[{|.])|right(?=[)\]}|.]))")
+
+
+def sanitize_for_katex(latex: str) -> str:
+    """Convert Mathpix LaTeX quirks to KaTeX-compatible syntax."""
+    rw = _Rewriter(latex)
+    rw.scan(0, len(latex))
+    s = "".join(rw.out)
+    # Fix unbalanced \left / \right — if one is missing, remove both
+    delimiters = _DELIMITER.findall(s)  # "left" for each \left, "" for each \right
+    if delimiters.count("left") * 2 != len(delimiters):
+        s = _DELIMITER.sub("", s)
+    return s.strip()
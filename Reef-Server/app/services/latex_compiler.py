@@ -1,11 +1,31 @@
-"""LaTeX compilation service using tectonic."""
+"""LaTeX compilation service using tectonic.
+
+One ``LaTeXCompiler`` is shared by the whole process (``get_compiler``).
+It is validated once — ``tectonic --version`` plus a warm compile of the
+full template, which fetches any TeX packages missing from tectonic's
+cache — by the startup pre-warm, or by the first document if that didn't
+finish. A failed validation (often a package download that timed out) is
+retried by the next document once a backoff has passed, doubling from
+``RETRY_AFTER_SECONDS`` up to ``MAX_RETRY_AFTER_SECONDS``. ``/health``
+reports the outcome (``compiler_health``).
+"""
 
 import base64
+import logging
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
 from pathlib import Path
 
+from app.services import cost_ledger, metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_SECONDS = 30.0
+MAX_RETRY_AFTER_SECONDS = 600.0
+
 LATEX_TEMPLATE = r"""
 \documentclass[12pt,letterpaper]{{article}}
 
@@ -70,6 +90,45 @@ class LaTeXCompiler:
 
     def __init__(self, tectonic_path: str | None = None):
         self.tectonic_path = tectonic_path or "tectonic"
+        self.status = "unchecked"  # "ok" | "failed" once validate() has run
+        self.version: str | None = None
+        self.error: str | None = None
+        self.validate_seconds: float | None = None
+        self.failures = 0  # consecutive failed validations
+        self.retry_at = 0.0  # monotonic time after which a failure is retried
+        self._validate_lock = threading.Lock()
+
+    def validate(self) -> None:
+        """Check tectonic and warm its package cache, once. Blocking.
+
+        Later calls return immediately once it has succeeded. After a
+        failure they re-raise it until the backoff has passed, then the
+        next call validates again.
+        """
+        with self._validate_lock:
+            if self.status == "unchecked" or (self.status == "failed" and time.monotonic() >= self.retry_at):
+                started = time.perf_counter()
+                try:
+                    self._check_tectonic()
+                    # Fills tectonic's package cache for the full template, so
+                    # the first real compile doesn't download packages
+                    self.compile_latex("Warm-up $x^2$")
+                    self.status, self.error, self.failures = "ok", None, 0
+                except Exception as e:
+                    self.status = "failed"
+                    self.error = str(e)[:500]
+                    self.failures += 1
+                self.validate_seconds = round(time.perf_counter() - started, 2)
+                if self.status == "ok":
+                    logger.info("  [latex] %s ready (validated in %.2fs)", self.version, self.validate_seconds)
+                else:
+                    backoff = min(RETRY_AFTER_SECONDS * 2 ** (self.failures - 1), MAX_RETRY_AFTER_SECONDS)
+                    self.retry_at = time.monotonic() + backoff
+                    logger.error(f"  [latex] compiler unavailable (retry in {backoff:.0f}s): {self.error}")
+        if self.status == "failed":
+            raise RuntimeError(self.error)
+
+    def _check_tectonic(self) -> None:
         try:
             result = subprocess.run(
                 [self.tectonic_path, "--version"],
@@ -82,6 +141,7 @@ class LaTeXCompiler:
                 "tectonic not found. Install with: "
                 "curl --proto '=https' --tlsv1.2 -fsSL https://drop-sh.fullyjustified.net | sh"
             )
+        self.version = result.stdout.strip()
 
     def compile_latex(
         self,
@@ -90,6 +150,8 @@ class LaTeXCompiler:
     ) -> bytes:
         """Compile LaTeX body content to PDF bytes."""
         temp_dir = Path(tempfile.mkdtemp())
+        started = time.perf_counter()
+        outcome = "error"
         try:
             images_dir = temp_dir / "images"
             if image_data:
@@ -112,6 +174,8 @@ class LaTeXCompiler:
             )
 
             if result.returncode != 0:
+                metrics.latex_compile_failures.inc()
+                outcome = "failed"
                 log_file = temp_dir / "question.log"
                 log_content = log_file.read_text()[-2000:] if log_file.exists() else ""
                 raise RuntimeError(
@@ -120,8 +184,37 @@ class LaTeXCompiler:
 
             pdf_file = temp_dir / "question.pdf"
             if not pdf_file.exists():
+                metrics.latex_compile_failures.inc()
+                outcome = "failed"
                 raise RuntimeError("PDF file was not generated")
 
+            outcome = "ok"
             return pdf_file.read_bytes()
         finally:
+            elapsed = time.perf_counter() - started
+            metrics.latex_compile_seconds.labels(outcome).observe(elapsed)
+            cost_ledger.record("tectonic", latency_ms=elapsed * 1000, outcome=outcome)
             shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+_compiler: LaTeXCompiler | None = None
+
+
+def get_compiler() -> LaTeXCompiler:
+    """The process-wide compiler. Not validated until ``validate()`` runs."""
+    global _compiler
+    if _compiler is None:
+        _compiler = LaTeXCompiler()
+    return _compiler
+
+
+def compiler_health() -> dict:
+    """Compiler status for ``/health``."""
+    compiler = get_compiler()
+    return {
+        "status": compiler.status,
+        "version": compiler.version,
+        "validate_seconds": compiler.validate_seconds,
+        "error": compiler.error,
+        "failures": compiler.failures,
+    }
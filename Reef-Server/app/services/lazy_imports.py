@@ -0,0 +1,41 @@
+"""Deferred imports for heavy optional-at-startup modules.
+
+``openai``, ``fitz``, ``numpy``, ``rdp`` and ``circle_fit`` together take
+over a second to import, and most of it is not needed until a request
+touches them. ``lazy_module(name)`` returns a stand-in that imports the
+real module on first attribute access and then copies its namespace in,
+so after that first use attribute lookups cost the same as on the
+module itself.
+
+Modules using a lazy stand-in need ``from __future__ import annotations``
+if they reference it in annotations, otherwise the annotation loads it at
+definition time. ``preload`` imports the stand-ins' modules eagerly; the
+app lifespan runs it in a thread so the first request doesn't pay.
+Run ``scripts/profile_imports.py`` to see what still loads at startup.
+"""
+
+import importlib
+import types
+
+_registry: dict[str, "_LazyModule"] = {}
+
+
+class _LazyModule(types.ModuleType):
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """A module stand-in for ``name`` that imports it on first use."""
+    if name not in _registry:
+        _registry[name] = _LazyModule(name)
+    return _registry[name]
+
+
+def preload() -> list[str]:
+    """Import every module registered through ``lazy_module``. Returns their names."""
+    for name, stand_in in list(_registry.items()):
+        stand_in.__dict__.update(importlib.import_module(name).__dict__)
+    return list(_registry)
@@ -3,23 +3,28 @@
 import asyncio
 import base64
 import copy
+import functools
+import json
 import logging
 import os
 import re
+import time
 from dataclasses import dataclass
 
-from openai import (
-    APIConnectionError,
-    APITimeoutError,
-    AsyncOpenAI,
-    BadRequestError,
-    InternalServerError,
-    RateLimitError,
-)
+from pydantic import BaseModel
+
+from app.services import cost_ledger, metrics
+from app.services.lazy_imports import lazy_module
+from app.services.rate_limiter import PRIORITY_INTERACTIVE, estimate_request_tokens, get_limiter
 
 logger = logging.getLogger(__name__)
 
-_RETRYABLE = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+# Imported on first client construction (~0.4s), not at app startup
+openai = lazy_module("openai")
+
+
+def _retryable() -> tuple[type[Exception], ...]:
+    return (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError)
 
 
 @dataclass
@@ -28,6 +33,8 @@ class LLMResult:
     content: str
     input_tokens: int = 0
     output_tokens: int = 0
+    cached_tokens: int = 0  # part of input_tokens served from the provider's prompt cache
+    model: str = ""  # model that produced the content
 
 
 def _make_strict(schema: dict) -> dict:
@@ -62,6 +69,45 @@ def _make_strict(schema: dict) -> dict:
     return schema
 
 
+# Strict schemas keyed by id() of the source schema; the source is kept in
+# the entry so a recycled id can't return a stale schema. Callers that build
+# a fresh schema per call (instead of using json_schema()) would grow this,
+# hence the cap.
+_strict_cache: dict[int, tuple[dict, dict]] = {}
+_STRICT_CACHE_MAX = 64
+
+
+def _strict_schema(schema: dict) -> dict:
+    """``_make_strict(schema)``, computed once per schema object."""
+    entry = _strict_cache.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        if len(_strict_cache) >= _STRICT_CACHE_MAX:
+            _strict_cache.clear()
+        entry = (schema, _make_strict(schema))
+        _strict_cache[id(schema)] = entry
+    return entry[1]
+
+
+@functools.cache
+def json_schema(model: type[BaseModel]) -> dict:
+    """``model.model_json_schema()``, built once per model. Do not mutate."""
+    return model.model_json_schema()
+
+
+@functools.cache
+def schema_instruction(model: type[BaseModel]) -> str:
+    """Output-format instructions embedding the model's JSON schema.
+
+    Needed for providers without structured output (json_object fallback).
+    Constant per model, so it belongs in the cacheable system prompt.
+    """
+    return (
+        "\n\n## CRITICAL: Output Format\n"
+        "Return ONLY a valid JSON object matching this schema. No markdown, no explanation, no code fences.\n"
+        f"```json\n{json.dumps(json_schema(model), indent=2)}\n```"
+    )
+
+
 class LLMClient:
     """Client for interacting with any OpenAI-compatible API."""
 
@@ -79,7 +125,7 @@ class LLMClient:
         kwargs: dict = {"api_key": api_key}
         if base_url:
             kwargs["base_url"] = base_url
-        self.client = AsyncOpenAI(**kwargs)
+        self.client = openai.AsyncOpenAI(**kwargs)
         self.model = model
         self._strict_json_supported: bool | None = None  # auto-detect on first call
 
@@ -93,7 +139,7 @@ class LLMClient:
                 "json_schema": {
                     "name": "response",
                     "strict": True,
-                    "schema": _make_strict(response_schema),
+                    "schema": _strict_schema(response_schema),
                 },
             }
         # Fallback: json_object mode (model must be prompted to return JSON)
@@ -108,7 +154,13 @@ class LLMClient:
         max_retries: int = 3,
         timeout: float = 120.0,
         system_prompt: str | None = None,
+        priority: int = PRIORITY_INTERACTIVE,
     ) -> LLMResult:
+        """Send one chat completion, waiting for this model's rate limiter first.
+
+        ``priority`` orders queued callers (``PRIORITY_BACKGROUND`` for
+        fire-and-forget work such as answer keys).
+        """
         content: list[dict] = [{"type": "text", "text": prompt}]
         if images:
             for img_bytes in images:
@@ -135,9 +187,20 @@ class LLMClient:
             kwargs["response_format"] = response_format
 
         last_exc: Exception | None = None
-        for attempt in range(1, max_retries + 1):
+        limiter = get_limiter(self.model)
+        estimated = estimate_request_tokens(prompt, system_prompt, images)
+
+        attempt = 0
+        while attempt < max_retries:
+            attempt += 1
+            await limiter.acquire(estimated, priority)
+            started = time.perf_counter()
             try:
-                response = await self.client.chat.completions.create(**kwargs)
+                raw = await self.client.chat.completions.with_raw_response.create(**kwargs)
+                response = raw.parse()
+                elapsed = time.perf_counter() - started
+                limiter.on_success(raw.headers)
+                metrics.llm_request_seconds.labels(self.model, "ok").observe(elapsed)
                 usage = response.usage
                 if self._strict_json_supported is None and response_schema is not None:
                     self._strict_json_supported = True
@@ -146,12 +209,35 @@ class LLMClient:
                 content = re.sub(
                     r"<think>.*?</think>\s*", "", content, flags=re.DOTALL
                 )
-                return LLMResult(
+                details = getattr(usage, "prompt_tokens_details", None)
+                result = LLMResult(
                     content=content,
                     input_tokens=usage.prompt_tokens if usage else 0,
                     output_tokens=usage.completion_tokens if usage else 0,
+                    cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0,
+                    model=self.model,
+                )
+                if usage:
+                    limiter.settle(estimated, result.input_tokens + result.output_tokens)
+                metrics.llm_tokens.labels(self.model, "input").inc(result.input_tokens)
+                metrics.llm_tokens.labels(self.model, "output").inc(result.output_tokens)
+                metrics.llm_tokens.labels(self.model, "cached").inc(result.cached_tokens)
+                cost_ledger.record(
+                    "openrouter",
+                    model=self.model,
+                    input_tokens=result.input_tokens,
+                    output_tokens=result.output_tokens,
+                    cost_dollars=cost_ledger.llm_cost_dollars(
+                        self.model, result.input_tokens, result.output_tokens,
+                    ),
+                    latency_ms=elapsed * 1000,
+                    cached_tokens=result.cached_tokens,
+                )
+                return result
+            except openai.BadRequestError as e:
+                metrics.llm_request_seconds.labels(self.model, "bad_request").observe(
+                    time.perf_counter() - started
                 )
-            except BadRequestError as e:
                 # Strict JSON schema not supported — fall back to json_object
                 if (
                     self._strict_json_supported is not False
@@ -163,10 +249,25 @@ class LLMClient:
                     )
                     self._strict_json_supported = False
                     kwargs["response_format"] = {"type": "json_object"}
-                    continue  # retry immediately with json_object
+                    attempt -= 1  # the json_object retry doesn't use up an attempt
+                    continue
                 raise
-            except _RETRYABLE as e:
+            except _retryable() as e:
+                metrics.llm_request_seconds.labels(self.model, type(e).__name__).observe(
+                    time.perf_counter() - started
+                )
                 last_exc = e
+                if isinstance(e, openai.RateLimitError):
+                    # The limiter pauses this model for everyone and re-queues
+                    # us by priority — no per-caller sleep
+                    limiter.on_rate_limited(e.response.headers)
+                    if attempt < max_retries:
+                        logger.warning(
+                            f"LLM attempt {attempt}/{max_retries} rate limited ({self.model}); re-queued"
+                        )
+                    else:
+                        logger.error(f"LLM call failed after {max_retries} attempts: {e}")
+                    continue
                 if attempt < max_retries:
                     delay = min(2 ** attempt, 16)
                     logger.warning(
@@ -177,3 +278,14 @@ class LLMClient:
                 else:
                     logger.error(f"LLM call failed after {max_retries} attempts: {e}")
         raise last_exc  # type: ignore[misc]
+
+
+@functools.cache
+def get_llm_client(model: str, api_key: str | None = None, base_url: str | None = None) -> LLMClient:
+    """Shared client per (model, key, base URL).
+
+    Reuses one ``AsyncOpenAI`` (and its connection pool) across documents
+    and remembers per-model strict-JSON support; the lifespan pre-warms
+    the configured models.
+    """
+    return LLMClient(api_key=api_key, model=model, base_url=base_url)
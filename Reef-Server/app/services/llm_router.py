@@ -0,0 +1,204 @@
+"""Model routing with hedged requests over ``LLMClient``.
+
+An ``LLMRouter`` owns an ordered list of interchangeable models for one
+kind of call (``"parse"``, ``"latex_fix"``). Each ``generate``:
+
+1. Sends the request to the first healthy model.
+2. If that call is still running after the model's learned p95 latency
+   for this route, sends the same request to the next model (a *hedge*).
+3. Returns the first response that passes ``validate``; the other call
+   is cancelled.
+4. If a call fails or returns an invalid response, moves on to the next
+   model immediately instead of sleeping through retries.
+
+Latency and error rates are learned per ``(route, model)`` and shared by
+every router in the process. Until ``MIN_SAMPLES`` latencies are known
+for a model there is no p95, so no hedge is sent — only failover.
+Models whose recent error rate exceeds ``UNHEALTHY_ERROR_RATE`` are
+tried last. The error rate decays with a half-life of
+``ERROR_HALF_LIFE_SECONDS`` while a model gets no calls, so a model tried
+last (and so rarely called) moves back to the front after an outage and
+its next calls decide whether it stays there.
+
+A call cancelled because the other one won still ran for as long as it
+was running: if that is already past the model's p95 it is kept as a
+latency sample (a lower bound), so slow calls that lose a hedge don't
+pull the p95 down.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from app.services.llm_client import LLMResult, get_llm_client
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+ERROR_ALPHA = 0.1  # EWMA weight of the newest outcome
+ERROR_HALF_LIFE_SECONDS = 120.0
+UNHEALTHY_ERROR_RATE = 0.5
+
+
+@dataclass
+class ModelStats:
+    """Recent latencies and an error-rate EWMA for one route/model pair."""
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    error_rate: float = 0.0  # as of ``updated_at``
+    updated_at: float = field(default_factory=time.monotonic)
+    calls: int = 0
+
+    def current_error_rate(self) -> float:
+        idle = time.monotonic() - self.updated_at
+        return self.error_rate * 0.5 ** (idle / ERROR_HALF_LIFE_SECONDS)
+
+    def record(self, seconds: float | None, ok: bool) -> None:
+        self.calls += 1
+        error_rate = self.current_error_rate()
+        self.error_rate = error_rate + ERROR_ALPHA * ((0.0 if ok else 1.0) - error_rate)
+        self.updated_at = time.monotonic()
+        if ok and seconds is not None:
+            self.latencies.append(seconds)
+
+    def record_cancelled(self, seconds: float) -> None:
+        """A call cancelled after ``seconds``; its latency was at least that.
+
+        Only a lower bound past the p95 says anything about the tail, so
+        shorter ones (e.g. a hedge that started late) are not recorded.
+        """
+        p95 = self.p95()
+        if p95 is not None and seconds >= p95:
+            self.latencies.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @property
+    def healthy(self) -> bool:
+        return self.calls < 5 or self.current_error_rate() <= UNHEALTHY_ERROR_RATE
+
+
+_stats: dict[tuple[str, str], ModelStats] = {}
+
+
+def get_stats(route: str, model: str) -> ModelStats:
+    key = (route, model)
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats[key] = ModelStats()
+    return stats
+
+
+class LLMRouter:
+    """Route one kind of LLM call across equivalent models with hedging."""
+
+    def __init__(
+        self,
+        route: str,
+        models: list[str],
+        api_key: str | None = None,
+        base_url: str | None = None,
+    ):
+        if not models:
+            raise ValueError("LLMRouter needs at least one model")
+        self.route = route
+        self.models = list(models)
+        self._clients = {m: get_llm_client(m, api_key, base_url) for m in self.models}
+
+    @property
+    def model(self) -> str:
+        """The preferred model (first in configured order)."""
+        return self.models[0]
+
+    def ordered_models(self) -> list[str]:
+        """Configured order, with unhealthy models moved to the back."""
+        healthy = [m for m in self.models if get_stats(self.route, m).healthy]
+        return healthy + [m for m in self.models if m not in healthy]
+
+    async def _call(self, model: str, kwargs: dict, last: bool, validate) -> LLMResult:
+        stats = get_stats(self.route, model)
+        started = time.perf_counter()
+        try:
+            # Another model is waiting, so fail over instead of backing off
+            result = await self._clients[model].generate(**kwargs, max_retries=3 if last else 1)
+            if validate is not None and not validate(result):
+                raise ValueError(f"invalid response from {model}")
+        except asyncio.CancelledError:
+            stats.record_cancelled(time.perf_counter() - started)
+            raise
+        except Exception:
+            stats.record(None, ok=False)
+            raise
+        stats.record(time.perf_counter() - started, ok=True)
+        result.model = model
+        return result
+
+    async def generate(
+        self,
+        prompt: str,
+        validate: Callable[[LLMResult], bool] | None = None,
+        **kwargs,
+    ) -> LLMResult:
+        """``LLMClient.generate`` over the routed models.
+
+        ``validate`` decides whether a response counts (e.g. it parses as
+        the expected schema); an invalid response is treated as a failure.
+        ``result.model`` names the model that answered.
+        """
+        kwargs = {"prompt": prompt, **kwargs}
+        kwargs.pop("max_retries", None)
+        queue = self.ordered_models()
+        running: dict[asyncio.Task, str] = {}
+        last_exc: Exception | None = None
+
+        def _launch() -> None:
+            model = queue.pop(0)
+            task = asyncio.create_task(self._call(model, kwargs, not queue, validate))
+            running[task] = model
+
+        _launch()
+        try:
+            while running:
+                hedge_after = None
+                if queue and len(running) == 1:
+                    (only_model,) = running.values()
+                    hedge_after = get_stats(self.route, only_model).p95()
+
+                done, _ = await asyncio.wait(
+                    running, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    logger.info(
+                        "  [llm-router] %s: %s exceeded p95 %.1fs, hedging with %s",
+                        self.route, next(iter(running.values())), hedge_after, queue[0],
+                    )
+                    _launch()
+                    continue
+
+                winner: LLMResult | None = None
+                for task in done:
+                    model = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_exc = e
+                        logger.warning(f"  [llm-router] {self.route}: {model} failed: {type(e).__name__}: {e}")
+                        continue
+                    winner = winner or result
+                if winner is not None:
+                    return winner
+
+                if not running and queue:
+                    _launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        raise last_exc  # type: ignore[misc]
@@ -1,14 +1,20 @@
 """Mathpix PDF OCR client — submit, poll, download MMD + images.
 
 Uses httpx.AsyncClient for all HTTP calls. The main entry point is
-``process_pdf(pdf_bytes)`` which returns ``(mmd_text, {filename: image_bytes})``.
+``process_pdf(pdf)`` which returns ``(mmd_text, {filename: image_bytes})``.
 """
 
 import asyncio
 import logging
 import re
+import time
+from contextlib import nullcontext
+from pathlib import Path
 
+from app.config import settings
+from app.services import cost_ledger, metrics
 from app.services.http_pool import get_client as get_http
+from app.services.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -29,9 +35,12 @@ class MathpixTimeoutError(MathpixError):
 # Helpers
 # ---------------------------------------------------------------------------
 
-_MD_IMAGE_RE = re.compile(r"!\[[^\]]*\]\((https://cdn\.mathpix\.com/[^)]+)\)")
+# CDN host is configurable so a local stand-in (scripts/mock_backends.py)
+# can serve figure images during offline load tests.
+_CDN = re.escape(settings.mathpix_cdn_base.rstrip("/"))
+_MD_IMAGE_RE = re.compile(rf"!\[[^\]]*\]\(({_CDN}/[^)]+)\)")
 _LATEX_IMAGE_RE = re.compile(
-    r"\\includegraphics(?:\[[^\]]*\])?\{(https://cdn\.mathpix\.com/[^}]+)\}"
+    rf"\\includegraphics(?:\[[^\]]*\])?\{{({_CDN}/[^}}]+)\}}"
 )
 
 
@@ -83,14 +92,16 @@ class MathpixClient:
 
     API_BASE = "https://api.mathpix.com"
 
-    def __init__(self, app_id: str, app_key: str):
+    def __init__(self, app_id: str, app_key: str, api_base: str | None = None):
+        if api_base:
+            self.API_BASE = api_base.rstrip("/")
         self._headers = {
             "app_id": app_id,
             "app_key": app_key,
         }
 
-    async def submit_pdf(self, pdf_bytes: bytes) -> str:
-        """Submit a PDF for processing. Returns the ``pdf_id``."""
+    async def submit_pdf(self, pdf: bytes | Path) -> str:
+        """Submit a PDF (bytes, or a file streamed from disk). Returns the ``pdf_id``."""
         url = f"{self.API_BASE}/v3/pdf"
         options = {
             "math_inline_delimiters": ["$", "$"],
@@ -98,19 +109,22 @@ class MathpixClient:
             "rm_spaces": True,
         }
         client = get_http()
-        resp = await client.post(
-            url,
-            headers=self._headers,
-            files={"file": ("document.pdf", pdf_bytes, "application/pdf")},
-            data={"options_json": _json_dumps(options)},
-            timeout=60,
-        )
-        resp.raise_for_status()
+        is_path = isinstance(pdf, Path)
+        size = pdf.stat().st_size if is_path else len(pdf)
+        with span("ocr.submit", pdf_bytes=size), (open(pdf, "rb") if is_path else nullcontext(pdf)) as body:
+            resp = await client.post(
+                url,
+                headers=self._headers,
+                files={"file": ("document.pdf", body, "application/pdf")},
+                data={"options_json": _json_dumps(options)},
+                timeout=60,
+            )
+            resp.raise_for_status()
         data = resp.json()
         pdf_id = data.get("pdf_id")
         if not pdf_id:
             raise MathpixError(f"No pdf_id in response: {data}")
-        logger.info(f"  [mathpix] Submitted PDF, got pdf_id={pdf_id}")
+        logger.info("  [mathpix] Submitted PDF, got pdf_id=%s", pdf_id)
         return pdf_id
 
     async def poll_until_complete(
@@ -119,27 +133,32 @@ class MathpixClient:
         *,
         interval: float = 3.0,
         max_attempts: int = 100,
-    ) -> None:
-        """Poll until the PDF processing completes or errors."""
+    ) -> dict:
+        """Poll until the PDF processing completes or errors.
+
+        Returns the final status response (``num_pages`` etc.).
+        """
         url = f"{self.API_BASE}/v3/pdf/{pdf_id}"
         client = get_http()
-        for attempt in range(1, max_attempts + 1):
-            resp = await client.get(url, headers=self._headers, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
-            status = data.get("status")
-
-            if status == "completed":
-                logger.info(
-                    f"  [mathpix] PDF {pdf_id} completed after {attempt} polls"
-                )
-                return
-            if status == "error":
-                raise MathpixError(
-                    f"Mathpix processing error: {data.get('error', data)}"
-                )
-
-            await asyncio.sleep(interval)
+        with span("ocr.poll", pdf_id=pdf_id) as poll_span:
+            for attempt in range(1, max_attempts + 1):
+                poll_span.set_attribute("polls", attempt)
+                metrics.mathpix_polls.inc()
+                resp = await client.get(url, headers=self._headers, timeout=30)
+                resp.raise_for_status()
+                data = resp.json()
+                status = data.get("status")
+
+                if status == "completed":
+                    metrics.mathpix_polls_per_pdf.observe(attempt)
+                    logger.info("  [mathpix] PDF %s completed after %d polls", pdf_id, attempt)
+                    return data
+                if status == "error":
+                    raise MathpixError(
+                        f"Mathpix processing error: {data.get('error', data)}"
+                    )
+
+                await asyncio.sleep(interval)
 
         raise MathpixTimeoutError(
             f"Mathpix PDF {pdf_id} did not complete after {max_attempts} polls "
@@ -150,9 +169,10 @@ class MathpixClient:
         """Download the MMD output for a completed PDF."""
         url = f"{self.API_BASE}/v3/pdf/{pdf_id}.mmd"
         client = get_http()
-        resp = await client.get(url, headers=self._headers, timeout=30)
-        resp.raise_for_status()
-        return resp.text
+        with span("ocr.mmd", pdf_id=pdf_id):
+            resp = await client.get(url, headers=self._headers, timeout=30)
+            resp.raise_for_status()
+            return resp.text
 
     async def download_image(self, url: str) -> bytes:
         """Fetch a single image from the Mathpix CDN."""
@@ -166,8 +186,9 @@ class MathpixClient:
     async def transcribe_image(self, image_base64: str) -> str:
         """Send a base64 PNG image to Mathpix and get back LaTeX."""
         client = get_http()
+        started = time.perf_counter()
         resp = await client.post(
-            "https://api.mathpix.com/v3/text",
+            f"{self.API_BASE}/v3/text",
             headers={
                 **self._headers,
                 "Content-type": "application/json",
@@ -181,11 +202,71 @@ class MathpixClient:
             timeout=30,
         )
         resp.raise_for_status()
+        cost_ledger.record(
+            "mathpix_image",
+            cost_dollars=cost_ledger.MATHPIX_IMAGE_DOLLARS,
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+        data = resp.json()
+        return data.get("latex_styled", data.get("text", ""))
+
+    # -- Strokes (digital ink) ------------------------------------------------
+
+    async def create_strokes_session(self, expires: int = 300) -> dict:
+        """Create an app token with a strokes session.
+
+        Returns ``{"app_token", "strokes_session_id", "app_token_expires_at"}``
+        (the last in epoch milliseconds). The token authenticates
+        ``/v3/strokes`` calls for that session only, so it is safe to hand to
+        a client.
+        """
+        client = get_http()
+        resp = await client.post(
+            f"{self.API_BASE}/v3/app-tokens",
+            headers={**self._headers, "Content-type": "application/json"},
+            json={"include_strokes_session_id": True, "expires": expires},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        if not data.get("app_token") or not data.get("strokes_session_id"):
+            raise MathpixError(f"No strokes session in response: {data}")
+        return data
+
+    async def transcribe_strokes(
+        self, strokes: list[dict], *, app_token: str, session_id: str,
+    ) -> str:
+        """Send ``[{"x": [...], "y": [...]}, ...]`` to a strokes session; return LaTeX.
+
+        Raises ``httpx.HTTPStatusError`` on a non-2xx response (401 when the
+        session's token has expired).
+        """
+        client = get_http()
+        started = time.perf_counter()
+        resp = await client.post(
+            f"{self.API_BASE}/v3/strokes",
+            headers={"app_token": app_token, "Content-type": "application/json"},
+            json={
+                "strokes": {"strokes": {
+                    "x": [s["x"] for s in strokes],
+                    "y": [s["y"] for s in strokes],
+                }},
+                "strokes_session_id": session_id,
+                "formats": ["latex_styled", "text"],
+            },
+            timeout=30,
+        )
+        resp.raise_for_status()
+        cost_ledger.record(
+            "mathpix_strokes",
+            latency_ms=(time.perf_counter() - started) * 1000,
+            strokes=len(strokes),
+        )
         data = resp.json()
         return data.get("latex_styled", data.get("text", ""))
 
     async def process_pdf(
-        self, pdf_bytes: bytes
+        self, pdf: bytes | Path
     ) -> tuple[str, dict[str, bytes], dict[str, str]]:
         """Full flow: submit -> poll -> download MMD + images.
 
@@ -193,9 +274,18 @@ class MathpixClient:
         The third element maps each CDN URL to its local filename, useful
         for replacing URLs inline before sending MMD to the LLM.
         """
-        pdf_id = await self.submit_pdf(pdf_bytes)
-        await self.poll_until_complete(pdf_id)
+        started = time.perf_counter()
+        pdf_id = await self.submit_pdf(pdf)
+        status = await self.poll_until_complete(pdf_id)
         mmd = await self.download_mmd(pdf_id)
+        pages = status.get("num_pages") or 0
+        cost_ledger.record(
+            "mathpix_pdf",
+            cost_dollars=pages * cost_ledger.MATHPIX_PDF_PAGE_DOLLARS,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            pdf_id=pdf_id,
+            pages=pages,
+        )
 
         # Build URL -> filename mapping
         image_urls = extract_image_urls(mmd)
@@ -213,9 +303,10 @@ class MathpixClient:
                     data = await self.download_image(img_url)
                     return url_to_filename[img_url], data
 
-            results = await asyncio.gather(
-                *[_fetch(u) for u in image_urls], return_exceptions=True
-            )
+            with span("ocr.images", count=len(image_urls)):
+                results = await asyncio.gather(
+                    *[_fetch(u) for u in image_urls], return_exceptions=True
+                )
             for r in results:
                 if isinstance(r, Exception):
                     logger.warning(f"  [mathpix] Image download failed: {r}")
@@ -223,8 +314,8 @@ class MathpixClient:
                     images[r[0]] = r[1]
 
         logger.info(
-            f"  [mathpix] PDF {pdf_id}: {len(mmd)} chars MMD, "
-            f"{len(images)} images downloaded"
+            "  [mathpix] PDF %s: %d chars MMD, %d images downloaded",
+            pdf_id, len(mmd), len(images),
         )
         return mmd, images, url_to_filename
 
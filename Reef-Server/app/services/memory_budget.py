@@ -0,0 +1,178 @@
+"""Per-document memory accounting and admission control.
+
+A reconstruction job holds several large buffers at once: Mathpix figure
+bytes, their base64 copies for tectonic, one PDF per question and the
+merge document. ``JobMemory`` tracks those explicitly — the pipeline
+calls ``hold(name, nbytes)`` when a buffer appears and ``release(name)``
+when it is dropped — giving a current and peak footprint per job and the
+peak per buffer name.
+
+``MemoryBudget`` admits jobs against ``JOB_MEMORY_BUDGET_MB``. Each job
+reserves a projected footprint: the larger of ``JOB_MEMORY_ESTIMATE_MB``
+and a moving average of recent jobs' measured peaks. A job whose
+reservation does not fit waits (FIFO) until running jobs finish; one job
+is always admitted when nothing else runs, so an oversized document
+still gets processed alone. A running job whose accounted bytes exceed
+its reservation grows the reservation, so later admissions see it.
+
+With ``DEBUG=true`` every ``hold``/``release`` also samples
+``tracemalloc`` — process-wide traced Python allocations, which shows
+what the explicit accounting misses at the cost of slower allocation.
+"""
+
+import asyncio
+import logging
+import time
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MB = 2**20
+PEAK_EWMA_ALPHA = 0.2
+
+
+class JobMemory:
+    """Bytes held by one reconstruction job, by buffer name."""
+
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self.held: dict[str, int] = {}
+        self.peak = 0
+        self.peak_by_name: dict[str, int] = {}
+        self.reserved = 0
+        self.traced_peak: int | None = None
+        self._budget: "MemoryBudget | None" = None
+
+    @property
+    def current(self) -> int:
+        return sum(self.held.values())
+
+    def hold(self, name: str, nbytes: int) -> None:
+        """Record that the job now holds ``nbytes`` under ``name`` (replaces the old value)."""
+        self.held[name] = nbytes
+        self.peak_by_name[name] = max(self.peak_by_name.get(name, 0), nbytes)
+        self.peak = max(self.peak, self.current)
+        self._sample_traced()
+        if self._budget is not None and self.current > self.reserved:
+            self._budget.grow(self, self.current)
+
+    def release(self, name: str) -> None:
+        self.held.pop(name, None)
+        self._sample_traced()
+
+    def _sample_traced(self) -> None:
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            self.traced_peak = max(self.traced_peak or 0, peak)
+
+    def summary(self) -> dict:
+        """JSON-ready accounting for ``stage_timings``."""
+        out = {
+            "peak_mb": round(self.peak / MB, 1),
+            "reserved_mb": round(self.reserved / MB, 1),
+            "peak_by_buffer_mb": {k: round(v / MB, 2) for k, v in self.peak_by_name.items()},
+        }
+        if self.traced_peak is not None:
+            out["tracemalloc_peak_mb"] = round(self.traced_peak / MB, 1)
+        return out
+
+
+class MemoryBudget:
+    """FIFO admission of jobs whose projected footprints must fit ``budget`` bytes."""
+
+    def __init__(self, budget: int, default_estimate: int):
+        self.budget = budget
+        self.default_estimate = default_estimate
+        self.reserved = 0
+        self.running: set[JobMemory] = set()
+        self._observed_peak: float | None = None
+        self._waiters: deque[JobMemory] = deque()
+        self._changed: asyncio.Condition | None = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def projected(self) -> int:
+        """Reservation for the next job."""
+        if self._observed_peak is None:
+            return self.default_estimate
+        return max(self.default_estimate, int(self._observed_peak))
+
+    def _fits(self, amount: int) -> bool:
+        return not self.running or self.reserved + amount <= self.budget
+
+    def would_defer(self) -> bool:
+        return bool(self._waiters) or not self._fits(self.projected())
+
+    async def acquire(self, job: JobMemory) -> None:
+        cond = self._condition()
+        async with cond:
+            self._waiters.append(job)
+            try:
+                await cond.wait_for(
+                    lambda: self._waiters[0] is job and self._fits(self.projected())
+                )
+            finally:
+                self._waiters.remove(job)
+                cond.notify_all()
+            job.reserved = self.projected()
+            job._budget = self
+            self.reserved += job.reserved
+            self.running.add(job)
+
+    def grow(self, job: JobMemory, nbytes: int) -> None:
+        self.reserved += nbytes - job.reserved
+        job.reserved = nbytes
+
+    async def release(self, job: JobMemory) -> None:
+        cond = self._condition()
+        async with cond:
+            if job in self.running:
+                self.running.discard(job)
+                self.reserved -= job.reserved
+                job._budget = None
+                if job.peak:
+                    self._observed_peak = (
+                        float(job.peak) if self._observed_peak is None
+                        else self._observed_peak + PEAK_EWMA_ALPHA * (job.peak - self._observed_peak)
+                    )
+            cond.notify_all()
+
+
+budget = MemoryBudget(
+    settings.job_memory_budget_mb * MB,
+    settings.job_memory_estimate_mb * MB,
+)
+
+
+@asynccontextmanager
+async def admit(job: JobMemory) -> AsyncIterator[float]:
+    """Hold a budget reservation for ``job`` for the duration of the block.
+
+    Yields the seconds spent waiting for admission.
+    """
+    if settings.debug and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    started = time.monotonic()
+    await budget.acquire(job)
+    waited = time.monotonic() - started
+    if waited > 0.01:
+        logger.info(
+            "  [memory] %s admitted after %.1fs (%d MB reserved of %d MB)",
+            job.document_id, waited, budget.reserved // MB, budget.budget // MB,
+        )
+    try:
+        yield waited
+    finally:
+        await budget.release(job)
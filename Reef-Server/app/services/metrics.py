@@ -0,0 +1,387 @@
+"""In-process Prometheus-style metrics with lock-free hot paths.
+
+Counters and histograms keep one value cell per thread: the event loop and
+each ``asyncio.to_thread`` worker only ever write their own cell, so
+``inc()`` / ``observe()`` never take a lock. A scrape sums the cells.
+Gauges are read through callbacks at scrape time.
+
+``render()`` produces the Prometheus text exposition format served by
+``GET /metrics``.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# Latency buckets (seconds) sized for HTTP handlers through LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: list[_Metric] = []
+
+
+# ---------------------------------------------------------------------------
+# Per-thread cells
+# ---------------------------------------------------------------------------
+
+
+class _ThreadCells:
+    """One mutable cell (a list of floats) per writing thread."""
+
+    __slots__ = ("_size", "_local", "_cells")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: list[list[float]] = []
+
+    def mine(self) -> list[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0.0] * self._size
+            self._local.cell = cell
+            self._cells.append(cell)  # list.append is atomic under the GIL
+            return cell
+
+    def totals(self) -> list[float]:
+        out = [0.0] * self._size
+        for cell in list(self._cells):
+            for i, v in enumerate(cell):
+                out[i] += v
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Metric types
+# ---------------------------------------------------------------------------
+
+
+class _Metric(ABC):
+    """A registered metric; ``render`` writes its ``_samples``."""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        _registry.append(self)
+
+    @abstractmethod
+    def _samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        """``(sample name, labels, value)`` for every series."""
+
+
+class _LabeledMetric(_Metric):
+    """A metric with one child (series) per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        super().__init__(name, documentation)
+
+    def labels(self, *values: str, **kwvalues: str):
+        """Return the child for a label combination (created on first use)."""
+        key = tuple(str(v) for v in values) if values else tuple(str(kwvalues[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child for a new label combination."""
+
+    def _label_dict(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class _CounterChild:
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._cells.mine()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+
+class Counter(_LabeledMetric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name, self._label_dict(key), child.value
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_cells")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self._bounds = bounds
+        # [bucket_0 .. bucket_n, +Inf bucket, sum, count]
+        self._cells = _ThreadCells(len(bounds) + 3)
+
+    def observe(self, value: float) -> None:
+        cell = self._cells.mine()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self) -> _Timer:
+        """Context manager observing elapsed wall time in seconds."""
+        return _Timer(self)
+
+    def snapshot(self) -> tuple[list[float], float, float]:
+        totals = self._cells.totals()
+        return totals[:-2], totals[-2], totals[-1]
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self) -> _Timer:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_LabeledMetric):
+    """Bucketed distribution of observed values."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            labels = self._label_dict(key)
+            counts, total, count = child.snapshot()
+            cumulative = 0.0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": _format_bound(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Gauge(_Metric):
+    """Point-in-time value read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], float] | None = None):
+        super().__init__(name, documentation)
+        self._fn = fn
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._fn = fn
+
+    def _samples(self):
+        if self._fn is None:
+            return
+        try:
+            value = float(self._fn())
+        except Exception:
+            return
+        yield self.name, {}, value
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """Render every registered metric in Prometheus text format 0.0.4."""
+    lines: list[str] = []
+    for metric in list(_registry):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric._samples():
+            if labels:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# ASGI middleware
+# ---------------------------------------------------------------------------
+
+
+class RequestMetricsMiddleware:
+    """Record request latency labelled by the matched router (first tag) and route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                tags = getattr(route, "tags", None)
+                router_name = str(tags[0]) if tags else "untagged"
+                route_path = getattr(route, "path", "unknown")
+            else:
+                router_name, route_path = "none", "unmatched"
+            http_request_seconds.labels(
+                router_name, route_path, scope.get("method", ""), status
+            ).observe(time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------------
+
+http_request_seconds = Histogram(
+    "reef_http_request_duration_seconds",
+    "HTTP request latency by router and route.",
+    ("router", "route", "method", "status"),
+)
+
+llm_request_seconds = Histogram(
+    "reef_llm_request_duration_seconds",
+    "LLM API call latency per attempt.",
+    ("model", "outcome"),
+)
+llm_tokens = Counter(
+    "reef_llm_tokens_total",
+    "LLM tokens consumed, from LLMResult usage.",
+    ("model", "kind"),
+)
+
+latex_compile_seconds = Histogram(
+    "reef_latex_compile_duration_seconds",
+    "tectonic compile duration.",
+    ("outcome",),
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60),
+)
+latex_compile_failures = Counter(
+    "reef_latex_compile_failures_total",
+    "tectonic compiles that exited non-zero or produced no PDF.",
+)
+
+mathpix_polls = Counter(
+    "reef_mathpix_polls_total",
+    "Mathpix PDF status polls issued.",
+)
+mathpix_polls_per_pdf = Histogram(
+    "reef_mathpix_polls_per_pdf",
+    "Polls needed before a Mathpix PDF finished.",
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+
+answer_key_cache_lookups = Counter(
+    "reef_answer_key_cache_lookups_total",
+    "Answer-key cache lookups by where they were answered (memory, db, miss).",
+    ("source",),
+)
+
+transcription_requests = Counter(
+    "reef_transcription_requests_total",
+    "Canvas transcription requests received by the coordinator.",
+)
+transcription_runs = Counter(
+    "reef_transcription_runs_total",
+    "Canvas transcriptions started, by outcome (completed, failed, superseded).",
+    ("outcome",),
+)
+
+supabase_patch_seconds = Histogram(
+    "reef_supabase_patch_duration_seconds",
+    "Supabase documents PATCH latency from update_document_status.",
+    ("outcome",),
+)
+
+documents_in_flight = Gauge(
+    "reef_documents_in_flight",
+    "Documents currently in the reconstruction pipeline.",
+)
+background_tasks = Gauge(
+    "reef_background_tasks",
+    "Fire-and-forget tasks (answer keys) still running.",
+)
+executor_queue_depth = Gauge(
+    "reef_executor_queue_depth",
+    "Work items waiting in the default thread-pool executor.",
+)
+llm_queued_calls = Gauge(
+    "reef_llm_queued_calls",
+    "LLM calls waiting in the client-side rate limiter, all models.",
+)
+job_memory_reserved_bytes = Gauge(
+    "reef_job_memory_reserved_bytes",
+    "Memory reserved by admitted reconstruction jobs against the job memory budget.",
+)
+jobs_waiting_for_memory = Gauge(
+    "reef_jobs_waiting_for_memory",
+    "Reconstruction jobs deferred by the job memory budget.",
+)
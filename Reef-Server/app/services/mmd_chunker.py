@@ -0,0 +1,146 @@
+"""Split oversized MMD at problem boundaries and merge the parsed chunks.
+
+Stage 3 sends the whole Mathpix MMD to one parse call. Long documents
+blow through the call timeout and the output-length limit (truncated
+``QuestionBatch`` JSON). ``split_mmd`` cuts the text into chunks of at
+most ``max_tokens`` estimated tokens, only at lines that start a new
+problem ("3.", "(3)", "Problem 3", a numbered heading). A single problem
+larger than the budget stays whole — a split problem cannot be parsed.
+
+Boundary detection is heuristic: a numbered sub-item inside a problem
+looks like a new problem. To survive a cut at such a line, every chunk
+after the first repeats the previous chunk's last segment, and
+``merge_batches`` drops a question whose text is contained in a
+neighbouring question from the adjacent chunk, keeping the longer one.
+Questions are renumbered 1..n in document order after merging.
+"""
+
+import logging
+import re
+
+from app.models import Question, QuestionBatch
+from app.services.question_index import normalize
+from app.services.token_estimator import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# A line that starts a new problem (markdown/bold/section wrappers allowed)
+_BOUNDARY_RE = re.compile(
+    r"^\s*(?:#{1,6}\s*)?(?:\\section\*?\{)?(?:\*\*)?\s*"
+    r"(?:(?:problem|question|exercise)\s*\d+"
+    r"|\d{1,3}\s*[.)]\s"
+    r"|[(\[]\d{1,3}[)\]]\s)",
+    re.IGNORECASE,
+)
+
+# Overlap only if the repeated segment costs at most this share of a chunk
+MAX_OVERLAP_SHARE = 0.3
+# How many questions at each side of a chunk seam are checked for duplicates
+SEAM_WINDOW = 2
+# Share of the shorter question's shingles found in the longer one
+CONTAINMENT_THRESHOLD = 0.8
+MIN_SHINGLES = 8
+_SHINGLE = 5
+
+
+def _segments(mmd: str) -> list[str]:
+    """Lines grouped into runs that each start at a problem boundary."""
+    segments: list[list[str]] = [[]]
+    for line in mmd.splitlines(keepends=True):
+        if _BOUNDARY_RE.match(line) and segments[-1]:
+            segments.append([])
+        segments[-1].append(line)
+    return ["".join(lines) for lines in segments if lines]
+
+
+def split_mmd(mmd: str, max_tokens: int) -> list[str]:
+    """Chunks of ``mmd`` within ``max_tokens``, cut only at problem boundaries.
+
+    Returns ``[mmd]`` when it already fits. Chunks after the first start
+    with the previous chunk's last segment (see module docstring).
+    """
+    if estimate_tokens(mmd) <= max_tokens:
+        return [mmd]
+
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for segment in _segments(mmd):
+        tokens = estimate_tokens(segment)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            overlap = current[-1]
+            overlap_tokens = estimate_tokens(overlap)
+            if (
+                len(current) > 1
+                and overlap_tokens <= max_tokens * MAX_OVERLAP_SHARE
+                and overlap_tokens + tokens <= max_tokens
+            ):
+                current, current_tokens = [overlap], overlap_tokens
+            else:
+                current, current_tokens = [], 0
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+# ---------------------------------------------------------------------------
+# Merging
+# ---------------------------------------------------------------------------
+
+
+def _question_text(question: Question) -> str:
+    def walk(node) -> list[str]:
+        out = [getattr(node, "label", ""), node.text]
+        for part in node.parts:
+            out.extend(walk(part))
+        return out
+    return normalize(" ".join(p for p in walk(question) if p))
+
+
+def _shingles(text: str) -> set[str]:
+    if len(text) <= _SHINGLE:
+        return {text}
+    return {text[i:i + _SHINGLE] for i in range(len(text) - _SHINGLE + 1)}
+
+
+def _is_contained(a: set[str], b: set[str]) -> bool:
+    """True if the smaller shingle set mostly appears in the larger one."""
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    if len(small) < MIN_SHINGLES:  # "Prove it." style stems: exact match only
+        return small == large
+    return len(small & large) / len(small) >= CONTAINMENT_THRESHOLD
+
+
+def merge_batches(batches: list[QuestionBatch]) -> QuestionBatch:
+    """Concatenate chunk results in order, dropping questions duplicated across a seam."""
+    merged: list[Question] = []
+    texts: list[set[str]] = []
+    for chunk_index, batch in enumerate(batches):
+        seam_start = len(merged)
+        for position, question in enumerate(batch.questions):
+            shingles = _shingles(_question_text(question))
+            duplicate = None
+            if chunk_index > 0 and position < SEAM_WINDOW:
+                for i in range(max(0, seam_start - SEAM_WINDOW), seam_start):
+                    if _is_contained(shingles, texts[i]):
+                        duplicate = i
+                        break
+            if duplicate is None:
+                merged.append(question)
+                texts.append(shingles)
+                continue
+            logger.info(
+                "  [mmd-chunker] chunk %d: question %d duplicates one from the "
+                "previous chunk, keeping the longer copy",
+                chunk_index, position + 1,
+            )
+            if len(shingles) > len(texts[duplicate]):
+                merged[duplicate] = question
+                texts[duplicate] = shingles
+
+    for number, question in enumerate(merged, start=1):
+        question.number = number
+    return QuestionBatch(questions=merged)
@@ -0,0 +1,111 @@
+"""Startup pre-warming — pay one-time costs before the health check passes.
+
+Fly starts machines on demand, so a cold start sits in front of a user's
+request. The lifespan awaits ``prewarm()`` before yielding, which runs the
+one-time work concurrently instead of on the first request:
+
+- ``modules``: import the modules deferred through ``lazy_imports``
+  (``openai``, ``fitz``, ``numpy``, ...) in a worker thread
+- ``jwks``: fetch the Supabase signing keys
+- ``llm_clients``: build the shared ``LLMClient`` per configured model
+- ``compiler``: validate the shared ``LaTeXCompiler`` and warm tectonic's
+  package cache
+- ``strokes_sessions``: pre-create the spare Mathpix strokes sessions
+
+Each step is timed and logged; a failing step is logged and skipped (the
+first request then pays for it as before). Steps still running after
+``PREWARM_TIMEOUT_SECONDS`` are cancelled so a slow dependency can't keep
+the machine from serving.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+_steps: dict[str, Callable[[], Awaitable[object]]] = {}
+
+
+def step(name: str):
+    """Register an async function as a named pre-warm step."""
+    def decorator(fn: Callable[[], Awaitable[object]]):
+        _steps[name] = fn
+        return fn
+    return decorator
+
+
+@step("modules")
+async def _preload_modules() -> None:
+    from app.services.lazy_imports import preload
+
+    await asyncio.to_thread(preload)
+
+
+@step("jwks")
+async def _fetch_jwks() -> None:
+    from app.auth import refresh_jwks
+
+    await refresh_jwks()
+
+
+@step("llm_clients")
+async def _build_llm_clients() -> None:
+    from app.services.answer_keys import ANSWER_KEY_MODEL
+    from app.services.llm_client import get_llm_client
+
+    if not settings.openrouter_api_key:
+        return
+    for model in dict.fromkeys([*settings.llm_fast_models, ANSWER_KEY_MODEL]):
+        # Constructing AsyncOpenAI imports openai on first use; keep it off the loop
+        await asyncio.to_thread(get_llm_client, model, settings.openrouter_api_key, OPENROUTER_BASE_URL)
+
+
+@step("compiler")
+async def _validate_compiler() -> None:
+    from app.services.latex_compiler import get_compiler
+
+    await asyncio.to_thread(get_compiler().validate)
+
+
+@step("strokes_sessions")
+async def _fill_strokes_sessions() -> None:
+    from app.services.strokes_sessions import pool
+
+    await pool.fill()
+
+
+async def _timed(name: str) -> float:
+    started = time.monotonic()
+    await _steps[name]()
+    return time.monotonic() - started
+
+
+async def prewarm(timeout: float | None = None) -> dict[str, str]:
+    """Run every registered step concurrently. Returns ``{step: outcome}``."""
+    timeout = settings.prewarm_timeout_seconds if timeout is None else timeout
+    started = time.monotonic()
+    tasks = {asyncio.create_task(_timed(name)): name for name in _steps}
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+
+    outcomes: dict[str, str] = {}
+    for task in done:
+        name = tasks[task]
+        if task.exception() is not None:
+            logger.warning("  [startup] pre-warm %s failed: %s", name, task.exception())
+            outcomes[name] = "failed"
+        else:
+            logger.info("  [startup] pre-warmed %s in %.2fs", name, task.result())
+            outcomes[name] = "ok"
+    for task in pending:
+        task.cancel()
+        logger.warning("  [startup] pre-warm %s still running after %.0fs; skipped", tasks[task], timeout)
+        outcomes[tasks[task]] = "timeout"
+    await asyncio.gather(*pending, return_exceptions=True)
+    logger.info("  [startup] pre-warm finished in %.2fs", time.monotonic() - started)
+    return outcomes
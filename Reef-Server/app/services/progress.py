@@ -1,9 +1,20 @@
-"""Lightweight helper to update document status_message via Supabase REST."""
+"""Document status updates via Supabase REST, coalesced per document.
+
+Each document gets a ``_StatusWriter`` that merges pending field updates
+and sends at most one PATCH per ``status_flush_interval`` from a
+background task, so progress messages never block the pipeline.
+Critical ``completed``/``failed`` states flush immediately (with retries)
+and carry any still-pending fields with them. A per-writer lock keeps
+PATCHes for one document in order.
+"""
 
 import asyncio
 import logging
+import time
+from functools import lru_cache
 
 from app.config import settings
+from app.services import metrics
 from app.services.http_pool import get_client as get_http
 
 logger = logging.getLogger(__name__)
@@ -13,22 +24,118 @@ _CRITICAL_STATUSES = {"completed", "failed"}
 _UNSET = object()  # sentinel — distinguishes "not provided" from explicit None
 
 
+@lru_cache(maxsize=1)
+def _headers(service_role_key: str) -> dict[str, str]:
+    return {
+        "apikey": service_role_key,
+        "Authorization": f"Bearer {service_role_key}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal",
+    }
+
+
+class _StatusWriter:
+    """Pending ``documents`` fields for one row plus the task that sends them."""
+
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self.pending: dict = {}
+        self.last_sent = 0.0
+        self.lock = asyncio.Lock()
+        self.task: asyncio.Task | None = None
+        self.flushing = 0
+
+    def schedule(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_later())
+            _flush_tasks.add(self.task)
+            self.task.add_done_callback(_flush_tasks.discard)
+
+    async def _flush_later(self) -> None:
+        delay = self.last_sent + settings.status_flush_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Clear before sending so updates arriving mid-PATCH schedule the next flush
+        self.task = None
+        await self.flush()
+
+    async def flush(self, critical: bool = False) -> None:
+        self.flushing += 1
+        try:
+            async with self.lock:
+                payload, self.pending = self.pending, {}
+                if payload:
+                    await self._send(payload, critical)
+                    self.last_sent = time.monotonic()
+        finally:
+            self.flushing -= 1
+        # Keep the writer (and its last_sent) around for one interval so the
+        # next update is still rate limited, then drop it if nothing arrived.
+        asyncio.get_running_loop().call_later(settings.status_flush_interval, self._evict_if_idle)
+
+    def _evict_if_idle(self) -> None:
+        idle = not self.pending and self.task is None and not self.flushing
+        if idle and time.monotonic() - self.last_sent >= settings.status_flush_interval:
+            if _writers.get(self.document_id) is self:
+                del _writers[self.document_id]
+
+    async def _send(self, payload: dict, critical: bool) -> None:
+        status = payload.get("status")
+        max_attempts = 3 if critical else 1
+        url = f"{settings.supabase_url}/rest/v1/documents?id=eq.{self.document_id}"
+        headers = _headers(settings.supabase_service_role_key)
+
+        for attempt in range(1, max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                client = get_http()
+                resp = await client.patch(url, json=payload, headers=headers, timeout=10)
+                resp.raise_for_status()
+                metrics.supabase_patch_seconds.labels("ok").observe(time.perf_counter() - started)
+                return
+            except Exception as e:
+                metrics.supabase_patch_seconds.labels("error").observe(time.perf_counter() - started)
+                if attempt < max_attempts:
+                    delay = 2 ** attempt
+                    logger.warning(
+                        f"Status update attempt {attempt}/{max_attempts} failed for "
+                        f"{self.document_id} (status={status}): {e}. Retrying in {delay}s..."
+                    )
+                    await asyncio.sleep(delay)
+                elif critical:
+                    logger.error(
+                        f"CRITICAL: Failed to set document {self.document_id} to "
+                        f"'{status}' after {max_attempts} attempts: {e}"
+                    )
+                else:
+                    logger.warning(f"Failed to update document {self.document_id}: {e}")
+
+
+_writers: dict[str, _StatusWriter] = {}
+_flush_tasks: set[asyncio.Task] = set()  # strong references (prevent GC)
+
+
+async def _submit(document_id: str, payload: dict, critical: bool) -> None:
+    writer = _writers.get(document_id)
+    if writer is None:
+        writer = _writers[document_id] = _StatusWriter(document_id)
+    writer.pending.update(payload)
+    if critical:
+        await writer.flush(critical=True)
+    else:
+        writer.schedule()
+
+
+async def flush_all() -> None:
+    """Send every pending update now (e.g. on shutdown)."""
+    await asyncio.gather(*(w.flush() for w in list(_writers.values())))
+
+
 async def update_progress(document_id: str, message: str | None):
-    """PATCH status_message on the documents table. Non-critical — never crashes the pipeline."""
+    """Queue a status_message update. Non-critical — returns without waiting for the PATCH."""
     if not document_id or not settings.supabase_service_role_key:
         return
-    try:
-        url = f"{settings.supabase_url}/rest/v1/documents?id=eq.{document_id}"
-        headers = {
-            "apikey": settings.supabase_service_role_key,
-            "Authorization": f"Bearer {settings.supabase_service_role_key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal",
-        }
-        client = get_http()
-        await client.patch(url, json={"status_message": message}, headers=headers)
-    except Exception as e:
-        print(f"  [progress] Failed to update status_message: {e}")
+    await _submit(document_id, {"status_message": message}, critical=False)
 
 
 async def update_document_status(
@@ -41,80 +148,59 @@ async def update_document_status(
     status_message=_UNSET,
     input_tokens=_UNSET,
     output_tokens=_UNSET,
+    cached_tokens=_UNSET,
     llm_calls=_UNSET,
     gpu_seconds=_UNSET,
     pipeline_seconds=_UNSET,
     cost_cents=_UNSET,
     question_pages=_UNSET,
     question_regions=_UNSET,
+    download_seconds=_UNSET,
+    ocr_seconds=_UNSET,
+    figures_seconds=_UNSET,
+    parse_seconds=_UNSET,
+    compile_seconds=_UNSET,
+    merge_seconds=_UNSET,
+    upload_seconds=_UNSET,
+    answer_key_seconds=_UNSET,
+    stage_timings=_UNSET,
 ):
-    """PATCH multiple fields on a document row at once.
+    """Update multiple fields on a document row at once.
 
     Pass ``None`` explicitly to set a column to NULL (e.g. clear status_message).
-    Omit a parameter to leave that column untouched.  Non-critical — never crashes.
+    Omit a parameter to leave that column untouched.  Non-critical updates are
+    coalesced and sent in the background; ``completed``/``failed`` are sent
+    before returning.  Never crashes.
     """
     if not document_id or not settings.supabase_service_role_key:
         return
-    payload: dict = {}
-    if status is not _UNSET:
-        payload["status"] = status
-    if page_count is not _UNSET:
-        payload["page_count"] = page_count
-    if problem_count is not _UNSET:
-        payload["problem_count"] = problem_count
-    if error_message is not _UNSET:
-        payload["error_message"] = error_message
-    if status_message is not _UNSET:
-        payload["status_message"] = status_message
-    if input_tokens is not _UNSET:
-        payload["input_tokens"] = input_tokens
-    if output_tokens is not _UNSET:
-        payload["output_tokens"] = output_tokens
-    if llm_calls is not _UNSET:
-        payload["llm_calls"] = llm_calls
-    if gpu_seconds is not _UNSET:
-        payload["gpu_seconds"] = gpu_seconds
-    if pipeline_seconds is not _UNSET:
-        payload["pipeline_seconds"] = pipeline_seconds
-    if cost_cents is not _UNSET:
-        payload["cost_cents"] = cost_cents
-    if question_pages is not _UNSET:
-        payload["question_pages"] = question_pages
-    if question_regions is not _UNSET:
-        payload["question_regions"] = question_regions
+    fields = {
+        "status": status,
+        "page_count": page_count,
+        "problem_count": problem_count,
+        "error_message": error_message,
+        "status_message": status_message,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cached_tokens": cached_tokens,
+        "llm_calls": llm_calls,
+        "gpu_seconds": gpu_seconds,
+        "pipeline_seconds": pipeline_seconds,
+        "cost_cents": cost_cents,
+        "question_pages": question_pages,
+        "question_regions": question_regions,
+        "download_seconds": download_seconds,
+        "ocr_seconds": ocr_seconds,
+        "figures_seconds": figures_seconds,
+        "parse_seconds": parse_seconds,
+        "compile_seconds": compile_seconds,
+        "merge_seconds": merge_seconds,
+        "upload_seconds": upload_seconds,
+        "answer_key_seconds": answer_key_seconds,
+        "stage_timings": stage_timings,
+    }
+    payload = {k: v for k, v in fields.items() if v is not _UNSET}
     if not payload:
         return
 
-    is_critical = status in _CRITICAL_STATUSES
-    max_attempts = 3 if is_critical else 1
-
-    url = f"{settings.supabase_url}/rest/v1/documents?id=eq.{document_id}"
-    headers = {
-        "apikey": settings.supabase_service_role_key,
-        "Authorization": f"Bearer {settings.supabase_service_role_key}",
-        "Content-Type": "application/json",
-        "Prefer": "return=minimal",
-    }
-
-    for attempt in range(1, max_attempts + 1):
-        try:
-            client = get_http()
-            resp = await client.patch(url, json=payload, headers=headers, timeout=10)
-            resp.raise_for_status()
-            return
-        except Exception as e:
-            if attempt < max_attempts:
-                delay = 2 ** attempt
-                logger.warning(
-                    f"Status update attempt {attempt}/{max_attempts} failed for "
-                    f"{document_id} (status={status}): {e}. Retrying in {delay}s..."
-                )
-                await asyncio.sleep(delay)
-            else:
-                if is_critical:
-                    logger.error(
-                        f"CRITICAL: Failed to set document {document_id} to "
-                        f"'{status}' after {max_attempts} attempts: {e}"
-                    )
-                else:
-                    logger.warning(f"Failed to update document status: {e}")
+    await _submit(document_id, payload, critical=status in _CRITICAL_STATUSES)
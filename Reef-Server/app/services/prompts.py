@@ -216,13 +216,10 @@ Estimate answer_space_cm at the most specific level:
 Return a QuestionBatch JSON object containing all extracted questions.
 """
 
+# Answer-key prompts are split so the long instructions form a stable system
+# prompt (cacheable by the provider) and only the question varies per call.
 ANSWER_KEY_PROMPT = """\
-You are generating a structured answer key for a homework or exam question. The answer key will be used by an AI tutor to guide students through the solution step by step.
-
-## Question (structured JSON)
-```json
-{question_json}
-```
+You are generating a structured answer key for a homework or exam question. The answer key will be used by an AI tutor to guide students through the solution step by step. The question is given as structured JSON in the user message.
 
 ## Output structure
 
@@ -281,3 +278,10 @@ Write like a chill, knowledgeable friend — someone who makes hard problems fee
 - For conceptual / non-calculation questions, each step should cover one key point or reasoning link.
 - If a step involves choosing a coordinate system, sign convention, or variable direction (e.g., measuring x from top vs bottom, tension positive vs negative), include BOTH common conventions in the `work` field separated by "Equivalently: ...". This lets the evaluator accept either approach.
 """
+
+ANSWER_KEY_QUESTION_PROMPT = """\
+## Question (structured JSON)
+```json
+{question_json}
+```
+"""
@@ -0,0 +1,302 @@
+"""In-process near-duplicate index for questions and parsed documents.
+
+Exact content hashes (``answer_key_cache``) miss uploads that differ only
+by whitespace, numbering or LaTeX spelling. ``MinHashIndex`` catches
+those: text is normalized, split into character shingles and reduced to
+a 128-value MinHash signature. Signatures live in one preallocated numpy
+array and are bucketed by LSH bands, so a lookup only compares against a
+handful of candidates.
+
+A similar text alone is not enough to reuse a result — "2x = 4" and
+"2x = 5", or ``e^{x+1}`` and ``e^{x}+1``, are near-identical strings with
+different answers. Every entry carries a *guard* (the numbers, LaTeX
+commands and operators of the text in order, plus the figure byte
+hashes) that must match exactly before a match is returned; the prose
+around them may differ.
+
+Two indexes are kept:
+
+- ``questions``: one entry per answered question, payload is its
+  ``answer_key_cache`` key, so ``generate_answer_keys`` can reuse the
+  stored answer of a near-identical question.
+- ``documents``: one entry per parsed document MMD, payload is the
+  ``QuestionBatch`` JSON with figure filenames replaced by figure hashes,
+  so the Stage 3 parse can be skipped for a re-upload.
+
+Every reuse or rejection is logged. ``NEAR_DUPLICATE_THRESHOLD`` (default
+0.9, estimated Jaccard similarity) controls how close counts as "near".
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import settings
+from app.services.lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+BANDS = 32  # 32 bands x 4 rows: candidates found down to ~0.45 similarity
+SHINGLE = 5
+
+
+@functools.cache
+def _seeds() -> np.ndarray:
+    return np.random.default_rng(0x5EEF).integers(1, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+# ---------------------------------------------------------------------------
+# Normalization
+# ---------------------------------------------------------------------------
+
+_LATEX_SPELLINGS = [
+    (re.compile(r"\\[dt]frac"), r"\\frac"),
+    (re.compile(r"\\(?:left|right|big|Big|bigg|Bigg)\b"), ""),
+    (re.compile(r"\\(?:,|;|!|:|quad|qquad)|~"), ""),
+    (re.compile(r"\\(?:mathrm|text|textrm|operatorname)\{([^{}]*)\}"), r"\1"),
+    (re.compile(r"\\\(|\\\)|\\\[|\\\]|\$"), ""),
+    # x^{2} is x^2; other braces are structure and are kept
+    (re.compile(r"([\^_])\{\s*(\w)\s*\}"), r"\1\2"),
+]
+# Numbers, LaTeX commands (\\sin, \\%) and operators/brackets — the reuse guard
+_GUARD_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|\\(?:[a-z]+|.)|[-+*/^_=<>()\[\]{}|!]")
+# Leading "3.", "(a)", "Problem 4:" style numbering
+_NUMBERING_RE = re.compile(
+    r"^\s*(?:(?:problem|question|exercise|q)\s*)?(?:\d+|[a-z]|[ivx]+)\s*[.):]\s*", re.IGNORECASE
+)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip numbering, LaTeX spacing/delimiters and all whitespace.
+
+    Braces are kept (except around a lone sub/superscript), so grouping
+    still tells ``e^{x+1}`` from ``e^{x}+1``.
+    """
+    text = _NUMBERING_RE.sub("", text)
+    for pattern, repl in _LATEX_SPELLINGS:
+        text = pattern.sub(repl, text)
+    return _SPACE_RE.sub("", text.lower())
+
+
+def math_tokens(normalized: str) -> tuple[str, ...]:
+    """Every number, LaTeX command and operator, in order — part of the reuse guard."""
+    return tuple(_GUARD_TOKEN_RE.findall(normalized))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, vectorized (uint64 arithmetic wraps)."""
+    z = values
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def signature(normalized: str) -> np.ndarray:
+    """MinHash signature (``NUM_PERM`` uint32 values) over character shingles."""
+    data = normalized.encode()
+    if len(data) <= SHINGLE:
+        shingles = {zlib.crc32(data)}
+    else:
+        shingles = {zlib.crc32(data[i:i + SHINGLE]) for i in range(len(data) - SHINGLE + 1)}
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    mixed = _mix(hashes[None, :] ^ _seeds()[:, None])
+    return mixed.min(axis=1).astype(np.uint32)
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Match:
+    payload: Any
+    similarity: float
+
+
+class MinHashIndex:
+    """Fixed-capacity MinHash/LSH index; the oldest entry is overwritten when full."""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self._signatures: np.ndarray | None = None  # allocated on first add
+        self._band_keys: list[list[int] | None] = [None] * capacity
+        self._guards: list[tuple | None] = [None] * capacity
+        self._payloads: list[Any] = [None] * capacity
+        self._buckets: dict[tuple[int, int], set[int]] = {}
+        self._next = 0
+        self.size = 0
+
+    @staticmethod
+    def _bands(sig: np.ndarray) -> list[int]:
+        rows = NUM_PERM // BANDS
+        return [hash(sig[b * rows:(b + 1) * rows].tobytes()) for b in range(BANDS)]
+
+    def add(self, sig: np.ndarray, guard: tuple, payload: Any) -> None:
+        slot = self._next
+        self._next = (self._next + 1) % self.capacity
+        old_keys = self._band_keys[slot]
+        if old_keys is not None:
+            for band, key in enumerate(old_keys):
+                bucket = self._buckets.get((band, key))
+                if bucket is not None:
+                    bucket.discard(slot)
+                    if not bucket:
+                        del self._buckets[(band, key)]
+        else:
+            self.size += 1
+
+        keys = self._bands(sig)
+        if self._signatures is None:
+            self._signatures = np.zeros((self.capacity, NUM_PERM), dtype=np.uint32)
+        self._signatures[slot] = sig
+        self._band_keys[slot] = keys
+        self._guards[slot] = guard
+        self._payloads[slot] = payload
+        for band, key in enumerate(keys):
+            self._buckets.setdefault((band, key), set()).add(slot)
+
+    def query(self, sig: np.ndarray, guard: tuple, threshold: float, label: str) -> Match | None:
+        """Best entry at or above ``threshold`` whose guard matches, else None.
+
+        ``label`` identifies the lookup in the reuse log.
+        """
+        if threshold > 1:
+            return None
+        candidates: set[int] = set()
+        for band, key in enumerate(self._bands(sig)):
+            candidates |= self._buckets.get((band, key), set())
+        if not candidates:
+            return None
+
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[slots] == sig).mean(axis=1)
+        for i in np.argsort(-similarity):
+            score = float(similarity[i])
+            if score < threshold:
+                logger.info(
+                    "  [near-dup] %s %s: no reuse, best similarity %.2f < %.2f",
+                    self.name, label, score, threshold,
+                    extra={"sample": 20},  # one per question on every upload
+                )
+                return None
+            slot = int(slots[i])
+            if self._guards[slot] != guard:
+                logger.info(
+                    "  [near-dup] %s %s: rejected match at %.2f (math or figures differ)",
+                    self.name, label, score,
+                )
+                continue
+            logger.info("  [near-dup] %s %s: reusing match at %.2f", self.name, label, score)
+            return Match(self._payloads[slot], score)
+        return None
+
+
+questions = MinHashIndex("questions", settings.near_duplicate_index_size)
+documents = MinHashIndex("documents", max(settings.near_duplicate_index_size // 8, 16))
+
+
+# ---------------------------------------------------------------------------
+# Question-level helpers (answer keys)
+# ---------------------------------------------------------------------------
+
+
+def _question_text(node: dict) -> str:
+    pieces = [node.get("label", ""), node.get("text", "")]
+    pieces.extend(_question_text(part) for part in node.get("parts", []))
+    return " ".join(p for p in pieces if p)
+
+
+def _question_figures(node: dict, figure_hashes: dict[str, str]) -> list[str]:
+    found = [figure_hashes.get(name, name) for name in node.get("figures", [])]
+    for part in node.get("parts", []):
+        found.extend(_question_figures(part, figure_hashes))
+    return found
+
+
+def _question_key(question_dict: dict, figure_hashes: dict[str, str]) -> tuple[np.ndarray, tuple]:
+    text = normalize(_question_text(question_dict))
+    guard = (math_tokens(text), tuple(sorted(_question_figures(question_dict, figure_hashes))))
+    return signature(text), guard
+
+
+def find_similar_question(question_dict: dict, figure_hashes: dict[str, str], label: str) -> Any:
+    """Payload of a near-identical indexed question, or None."""
+    sig, guard = _question_key(question_dict, figure_hashes)
+    match = questions.query(sig, guard, settings.near_duplicate_threshold, label)
+    return match.payload if match is not None else None
+
+
+def add_question(question_dict: dict, figure_hashes: dict[str, str], payload: Any) -> None:
+    sig, guard = _question_key(question_dict, figure_hashes)
+    questions.add(sig, guard, payload)
+
+
+# ---------------------------------------------------------------------------
+# Document-level helpers (Stage 3 parse)
+# ---------------------------------------------------------------------------
+
+
+def figure_hashes(images: dict[str, bytes] | None) -> dict[str, str]:
+    """``{filename: sha256}`` for Mathpix figure bytes."""
+    return {name: hashlib.sha256(data).hexdigest() for name, data in (images or {}).items()}
+
+
+def _rename_figures(node: Any, mapping: dict[str, str]) -> Any:
+    """Copy of a parsed batch dict with every ``figures`` entry renamed (None if unmapped)."""
+    if isinstance(node, dict):
+        out = {}
+        for key, value in node.items():
+            if key == "figures":
+                renamed = [mapping.get(name) for name in value]
+                if any(name is None for name in renamed):
+                    return None
+                out[key] = renamed
+            else:
+                child = _rename_figures(value, mapping)
+                if child is None and value is not None:
+                    return None
+                out[key] = child
+        return out
+    if isinstance(node, list):
+        items = [_rename_figures(item, mapping) for item in node]
+        return None if any(i is None for i in items) else items
+    return node
+
+
+def _document_key(mmd: str, hashes: dict[str, str]) -> tuple[np.ndarray, tuple]:
+    for name, digest in hashes.items():
+        mmd = mmd.replace(name, digest[:16])
+    text = normalize(mmd)
+    return signature(text), (math_tokens(text), tuple(sorted(hashes.values())))
+
+
+def find_similar_document(mmd: str, images: dict[str, bytes] | None, label: str) -> dict | None:
+    """Parsed ``QuestionBatch`` dict of a near-identical prior document, figures renamed."""
+    hashes = figure_hashes(images)
+    sig, guard = _document_key(mmd, hashes)
+    match = documents.query(sig, guard, settings.near_duplicate_threshold, label)
+    if match is None:
+        return None
+    by_hash = {digest: name for name, digest in hashes.items()}
+    return _rename_figures(match.payload, by_hash)
+
+
+def add_document(mmd: str, images: dict[str, bytes] | None, batch: dict) -> None:
+    hashes = figure_hashes(images)
+    stored = _rename_figures(batch, hashes)
+    if stored is None:  # a figure we have no bytes for — not safely reusable
+        return
+    sig, guard = _document_key(mmd, hashes)
+    documents.add(sig, guard, stored)
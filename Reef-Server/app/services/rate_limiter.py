@@ -0,0 +1,204 @@
+"""Client-side, per-model rate limiting for OpenRouter calls.
+
+Each model gets an ``AdaptiveRateLimiter`` holding two token buckets:
+requests per minute and tokens per minute. ``LLMClient.generate`` calls
+``acquire`` before every request, so callers wait in a priority queue
+instead of all firing, all getting 429 and all backing off together.
+
+The buckets adapt:
+
+- ``x-ratelimit-limit-*`` / ``x-ratelimit-remaining-*`` response headers
+  (OpenAI-style ``-requests``/``-tokens`` suffixes) set the capacity and
+  current level; OpenRouter's bare ``X-RateLimit-Remaining`` caps the
+  request level.
+- A 429 pauses the whole model until ``retry-after`` (or the reset
+  header) and halves the admitted rate; each success wins 5% back.
+
+Interactive calls (``PRIORITY_INTERACTIVE``) are always admitted ahead of
+queued fire-and-forget work (``PRIORITY_BACKGROUND``).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Mapping
+
+from app.config import settings
+from app.services.token_estimator import IMAGE_TOKENS, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+MIN_SCALE = 0.1
+DEFAULT_PAUSE_SECONDS = 2.0
+
+
+class _Bucket:
+    """Continuously refilling bucket; capacity refills over 60 s."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float) -> None:
+        rate = self.capacity * scale / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, scale: float) -> float:
+        """Seconds until ``amount`` is available (0 if it already is)."""
+        # A single request larger than the bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.capacity * scale / 60.0)
+
+
+class AdaptiveRateLimiter:
+    """Request and token buckets for one model, with a priority wait queue."""
+
+    def __init__(self, model: str, requests_per_minute: float, tokens_per_minute: float):
+        self.model = model
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self._waiters: list[list] = []  # heap of [priority, seq, cost]
+        self._seq = itertools.count()
+        self._changed: asyncio.Condition | None = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _refill(self, now: float) -> None:
+        self.requests.refill(now, self.scale)
+        self.tokens.refill(now, self.scale)
+
+    def _wait_time(self, cost: float, now: float) -> float:
+        return max(
+            self.paused_until - now,
+            self.requests.wait_for(1, self.scale),
+            self.tokens.wait_for(cost, self.scale),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, estimated_tokens: int, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Wait until this call may be sent, highest priority first."""
+        entry = [priority, next(self._seq), float(estimated_tokens)]
+        cond = self._condition()
+        async with cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    timeout = None
+                    if self._waiters[0] is entry:
+                        timeout = self._wait_time(entry[2], now)
+                        if timeout <= 0:
+                            self.requests.level -= 1
+                            self.tokens.level -= min(entry[2], self.tokens.capacity)
+                            return
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                cond.notify_all()
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Charge the difference between the estimate and real usage."""
+        self.tokens.level -= actual_tokens - estimated_tokens
+
+    def on_success(self, headers: Mapping[str, str] | None) -> None:
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + 0.05)
+        if headers:
+            self._apply_headers(headers)
+
+    def on_rate_limited(self, headers: Mapping[str, str] | None) -> None:
+        """A 429: pause every caller for this model and halve the rate."""
+        self.scale = max(MIN_SCALE, self.scale * 0.5)
+        pause = _retry_after(headers) if headers else None
+        self.paused_until = max(self.paused_until, time.monotonic() + (pause or DEFAULT_PAUSE_SECONDS))
+        self.requests.level = min(self.requests.level, 0.0)
+        if headers:
+            self._apply_headers(headers)
+        logger.warning(
+            f"  [rate-limit] {self.model}: 429, pausing {pause or DEFAULT_PAUSE_SECONDS:.1f}s, "
+            f"rate scale {self.scale:.2f}, {self.queued} queued"
+        )
+
+    def _apply_headers(self, headers: Mapping[str, str]) -> None:
+        for bucket, suffix in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _header_number(headers, f"x-ratelimit-limit-{suffix}")
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{suffix}")
+            if bucket is self.requests and remaining is None:
+                # OpenRouter reports requests left in its own (shorter) window
+                # without a suffix — usable as a level, not as a per-minute limit
+                remaining = _header_number(headers, "x-ratelimit-remaining")
+            if limit:
+                bucket.capacity = limit
+            if remaining is not None:
+                bucket.level = min(bucket.level, remaining)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _retry_after(headers: Mapping[str, str]) -> float | None:
+    """Seconds to wait from ``retry-after`` or an OpenRouter reset timestamp."""
+    seconds = _header_number(headers, "retry-after")
+    if seconds is not None:
+        return seconds
+    reset = _header_number(headers, "x-ratelimit-reset")
+    if reset is not None and reset > 1e12:  # epoch milliseconds
+        return max(0.0, reset / 1000 - time.time())
+    return None
+
+
+_limiters: dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_limiter(model: str) -> AdaptiveRateLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limiter = _limiters[model] = AdaptiveRateLimiter(
+            model, settings.llm_requests_per_minute, settings.llm_tokens_per_minute,
+        )
+    return limiter
+
+
+def queued_calls() -> int:
+    """Callers waiting across every model's limiter."""
+    return sum(limiter.queued for limiter in _limiters.values())
+
+
+def estimate_request_tokens(
+    prompt: str, system_prompt: str | None = None, images: list[bytes] | None = None,
+) -> int:
+    """Input size of one call, for admission against the token bucket."""
+    return (
+        estimate_tokens(prompt)
+        + (estimate_tokens(system_prompt) if system_prompt else 0)
+        + IMAGE_TOKENS * len(images or ())
+    )
@@ -9,7 +9,9 @@ from __future__ import annotations
 
 import re
 
-import fitz  # PyMuPDF
+from app.services.lazy_imports import lazy_module
+
+fitz = lazy_module("fitz")  # PyMuPDF
 
 _BOLD_FLAG = 1 << 4
 _LABEL_RE = re.compile(r"^\(([^)]+)\)")
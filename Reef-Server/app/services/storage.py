@@ -1,39 +1,70 @@
-"""Supabase Storage helpers — download/upload document PDFs via REST."""
+"""Supabase Storage helpers — download/upload document PDFs via REST.
+
+The ``*_file`` variants stream between Storage and a local file in
+``CHUNK_SIZE`` pieces, so a document PDF is never held in memory whole;
+the pipeline uses those. Their file reads and writes run in worker
+threads so disk I/O never blocks the event loop. The ``bytes`` variants remain for small objects
+and callers that already have the data in memory.
+"""
+
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator
 
 from app.config import settings
 from app.services.http_pool import get_client as get_http
 
+CHUNK_SIZE = 1 << 20  # 1 MiB
 
-async def download_document_pdf(user_id: str, document_id: str) -> bytes:
-    """Download ``{userId}/{docId}/original.pdf`` from the ``documents`` bucket."""
-    path = f"{user_id}/{document_id}/original.pdf"
-    url = f"{settings.supabase_url}/storage/v1/object/documents/{path}"
-    headers = {
+
+def _headers(**extra: str) -> dict:
+    return {
         "apikey": settings.supabase_service_role_key,
         "Authorization": f"Bearer {settings.supabase_service_role_key}",
+        **extra,
     }
+
+
+def _object_url(path: str) -> str:
+    return f"{settings.supabase_url}/storage/v1/object/documents/{path}"
+
+
+async def download_document_pdf(user_id: str, document_id: str) -> bytes:
+    """Download ``{userId}/{docId}/original.pdf`` from the ``documents`` bucket."""
     client = get_http()
-    resp = await client.get(url, headers=headers, timeout=60)
+    resp = await client.get(
+        _object_url(f"{user_id}/{document_id}/original.pdf"), headers=_headers(), timeout=60,
+    )
     resp.raise_for_status()
     return resp.content
 
 
+async def download_document_pdf_file(user_id: str, document_id: str, dest: Path) -> int:
+    """Stream ``original.pdf`` into ``dest`` chunk by chunk. Returns the byte count."""
+    client = get_http()
+    size = 0
+    async with client.stream(
+        "GET", _object_url(f"{user_id}/{document_id}/original.pdf"), headers=_headers(), timeout=60,
+    ) as resp:
+        resp.raise_for_status()
+        with open(dest, "wb") as f:
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+    return size
+
+
 async def upload_question_figure(
     document_id: str, filename: str, image_bytes: bytes
 ) -> str:
     """Upload a question figure to ``{docId}/figures/{filename}`` and return the storage URL."""
-    path = f"{document_id}/figures/{filename}"
-    url = f"{settings.supabase_url}/storage/v1/object/documents/{path}"
+    url = _object_url(f"{document_id}/figures/{filename}")
     # Detect content type from extension
     ct = "image/jpeg" if filename.lower().endswith((".jpg", ".jpeg")) else "image/png"
-    headers = {
-        "apikey": settings.supabase_service_role_key,
-        "Authorization": f"Bearer {settings.supabase_service_role_key}",
-        "Content-Type": ct,
-        "x-upsert": "true",
-    }
     client = get_http()
-    resp = await client.put(url, content=image_bytes, headers=headers, timeout=30)
+    resp = await client.put(
+        url, content=image_bytes, headers=_headers(**{"Content-Type": ct, "x-upsert": "true"}), timeout=30,
+    )
     resp.raise_for_status()
     return url
 
@@ -42,14 +73,33 @@ async def upload_document_pdf(
     user_id: str, document_id: str, pdf_bytes: bytes
 ) -> None:
     """Upload ``output.pdf`` to ``{userId}/{docId}/output.pdf`` (upserts)."""
-    path = f"{user_id}/{document_id}/output.pdf"
-    url = f"{settings.supabase_url}/storage/v1/object/documents/{path}"
-    headers = {
-        "apikey": settings.supabase_service_role_key,
-        "Authorization": f"Bearer {settings.supabase_service_role_key}",
-        "Content-Type": "application/pdf",
-        "x-upsert": "true",
-    }
     client = get_http()
-    resp = await client.put(url, content=pdf_bytes, headers=headers, timeout=120)
+    resp = await client.put(
+        _object_url(f"{user_id}/{document_id}/output.pdf"),
+        content=pdf_bytes,
+        headers=_headers(**{"Content-Type": "application/pdf", "x-upsert": "true"}),
+        timeout=120,
+    )
+    resp.raise_for_status()
+
+
+async def _file_chunks(path: Path) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+            yield chunk
+
+
+async def upload_document_pdf_file(user_id: str, document_id: str, path: Path) -> None:
+    """Stream a local PDF to ``{userId}/{docId}/output.pdf`` (upserts)."""
+    client = get_http()
+    resp = await client.put(
+        _object_url(f"{user_id}/{document_id}/output.pdf"),
+        content=_file_chunks(path),
+        headers=_headers(**{
+            "Content-Type": "application/pdf",
+            "Content-Length": str(path.stat().st_size),
+            "x-upsert": "true",
+        }),
+        timeout=120,
+    )
     resp.raise_for_status()
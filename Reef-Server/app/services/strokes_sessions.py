@@ -0,0 +1,167 @@
+"""Pool of Mathpix strokes sessions, one active per user plus pre-created spares.
+
+Creating a strokes session (``/v3/app-tokens``) is a round trip to Mathpix
+on the path of a user's first transcription, and each session's app token
+expires after ``STROKES_SESSION_SECONDS``. The pool keeps:
+
+- an active session per user, reused for every edit until it is within
+  ``EXPIRY_MARGIN_SECONDS`` of expiring (Mathpix bills per session, not
+  per request, so reuse is also cheaper)
+- ``STROKES_SESSION_SPARES`` unassigned sessions, created in the
+  background, so a user whose session expired (or who has none) gets one
+  without waiting on Mathpix. Spares expire too, so after each fill a
+  timer refills the pool when the oldest spare stops being usable.
+
+Sessions that Mathpix rejects (401/403) are dropped with ``invalidate``.
+The pool is in-process; a second machine keeps its own.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from app.config import settings
+from app.services import cost_ledger
+from app.services.mathpix import MathpixClient
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_MARGIN_SECONDS = 30
+
+
+@dataclass
+class StrokesSession:
+    app_token: str
+    session_id: str
+    expires_at: float  # time.monotonic()
+    requests: int = 0
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def usable(self) -> bool:
+        return self.remaining() > EXPIRY_MARGIN_SECONDS
+
+
+def mathpix_client() -> MathpixClient:
+    return MathpixClient(
+        app_id=settings.mathpix_app_id,
+        app_key=settings.mathpix_app_key,
+        api_base=settings.mathpix_api_base,
+    )
+
+
+class StrokesSessionPool:
+    def __init__(self, spares: int, lifetime: int):
+        self.spares_target = spares
+        self.lifetime = lifetime
+        self._active: dict[str, StrokesSession] = {}
+        self._spares: list[StrokesSession] = []
+        self._creating: dict[str, asyncio.Future] = {}  # user_id -> pending session
+        self._refill_task: asyncio.Task | None = None
+        self._refresh: asyncio.TimerHandle | None = None
+        self.created = 0
+
+    async def _create(self) -> StrokesSession:
+        started = time.monotonic()
+        data = await mathpix_client().create_strokes_session(expires=self.lifetime)
+        self.created += 1
+        return StrokesSession(data["app_token"], data["strokes_session_id"], started + self.lifetime)
+
+    def _take_spare(self) -> StrokesSession | None:
+        while self._spares:
+            session = self._spares.pop()
+            if session.usable:
+                return session
+        return None
+
+    async def acquire(self, user_id: str) -> StrokesSession:
+        """The user's active session, or a fresh one if it is missing or expiring."""
+        session = self._active.get(user_id)
+        if session is not None and session.usable:
+            session.requests += 1
+            return session
+
+        pending = self._creating.get(user_id)
+        if pending is None:
+            # Concurrent first requests from one user share one new session
+            pending = asyncio.ensure_future(self._assign(user_id))
+            self._creating[user_id] = pending
+            pending.add_done_callback(lambda _: self._creating.pop(user_id, None))
+        session = await asyncio.shield(pending)
+        session.requests += 1
+        return session
+
+    async def _assign(self, user_id: str) -> StrokesSession:
+        session = self._take_spare()
+        if session is None:
+            session = await self._create()
+        else:
+            logger.info("  [strokes] %s: assigned a pre-created session", user_id)
+        self._active[user_id] = session
+        cost_ledger.record("mathpix_strokes_session", cost_dollars=cost_ledger.MATHPIX_STROKES_SESSION_DOLLARS)
+        self._prune()
+        self.refill()
+        return session
+
+    def invalidate(self, user_id: str, session: StrokesSession) -> None:
+        """Drop a session Mathpix rejected; the next ``acquire`` replaces it."""
+        if self._active.get(user_id) is session:
+            del self._active[user_id]
+
+    def _prune(self) -> None:
+        expired = [u for u, s in self._active.items() if s.remaining() <= 0]
+        for user_id in expired:
+            del self._active[user_id]
+
+    def refill(self) -> None:
+        """Top the spares back up in the background."""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self.fill())
+
+    async def fill(self) -> None:
+        """Create sessions until ``spares_target`` usable spares exist."""
+        if not settings.mathpix_app_key:
+            return
+        # Loop: spares taken while a round is in flight need another round
+        while (missing := self.spares_target - sum(1 for s in self._spares if s.usable)) > 0:
+            results = await asyncio.gather(*(self._create() for _ in range(missing)), return_exceptions=True)
+            self._spares = [s for s in self._spares if s.usable]
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.warning(f"  [strokes] failed to pre-create a session: {result}")
+                else:
+                    self._spares.append(result)
+            if all(isinstance(r, BaseException) for r in results):
+                break
+        self._schedule_refresh()
+
+    def _schedule_refresh(self) -> None:
+        """Refill when the first spare stops being usable, not on the next assignment."""
+        if self._refresh is not None:
+            self._refresh.cancel()
+        self._refresh = None
+        usable = [s.remaining() - EXPIRY_MARGIN_SECONDS for s in self._spares if s.usable]
+        if usable:
+            self._refresh = asyncio.get_running_loop().call_later(min(usable), self.refill)
+
+    async def stop(self) -> None:
+        if self._refresh is not None:
+            self._refresh.cancel()
+            self._refresh = None
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+
+    def stats(self) -> dict:
+        return {
+            "active": sum(1 for s in self._active.values() if s.usable),
+            "spares": sum(1 for s in self._spares if s.usable),
+            "created": self.created,
+        }
+
+
+pool = StrokesSessionPool(settings.strokes_session_spares, settings.strokes_session_seconds)
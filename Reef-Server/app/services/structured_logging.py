@@ -0,0 +1,158 @@
+"""Structured, request-scoped logging that never blocks the event loop.
+
+``configure_logging`` replaces ``logging.basicConfig``:
+
+- The root logger gets a ``QueueHandler``. Records go onto an in-memory
+  queue and a ``QueueListener`` thread formats and writes them, so a slow
+  stdout (container log driver under load) stalls a thread, not the loop.
+- Messages are formatted lazily: callers pass ``%``-style arguments and
+  the string is built on the listener thread, only for records that pass
+  the level check. Arguments must therefore not be mutated after the
+  call — pass scalars or copies.
+- ``bind(**fields)`` attaches fields (``document_id``, ``user_id``,
+  ``stage``) to every record logged from the current task and the tasks
+  it spawns, via a context variable. ``tracing.span`` binds ``stage``.
+- ``LOG_FORMAT=json`` (default) writes one JSON object per line;
+  ``LOG_FORMAT=text`` keeps the old human-readable line with the bound
+  fields appended.
+- High-volume lines opt into sampling with ``extra={"sample": n}``: only
+  every n-th record from that call site is kept. Warnings and errors are
+  never sampled.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from app.config import settings
+
+_fields: ContextVar[dict] = ContextVar("log_fields", default={})
+
+_listener: logging.handlers.QueueListener | None = None
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample"}
+
+
+def bind_fields(**fields) -> None:
+    """Add fields to every record from the current task (and tasks it spawns)."""
+    _fields.set({**_fields.get(), **fields})
+
+
+@contextmanager
+def bind(**fields) -> Iterator[None]:
+    """``bind_fields`` for the duration of a block."""
+    token = _fields.set({**_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+# ---------------------------------------------------------------------------
+# Handler chain
+# ---------------------------------------------------------------------------
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """Captures bound fields in the calling task; defers formatting.
+
+    The stock ``prepare`` formats the message before enqueueing, which is
+    exactly the work we want off the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        fields = _fields.get()
+        if fields:
+            record.__dict__.update({k: v for k, v in fields.items() if k not in record.__dict__})
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every n-th record of call sites logged with ``extra={"sample": n}``."""
+
+    def __init__(self):
+        super().__init__()
+        self._counters: dict[tuple[str, int], itertools.count] = defaultdict(itertools.count)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample", None)
+        if not every or every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        return next(self._counters[(record.pathname, record.lineno)]) % every == 0
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, bound fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage().strip(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The previous ``basicConfig`` line, with bound fields appended."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = _extra_fields(record)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return line
+
+
+def configure_logging() -> None:
+    """Route all logging through a queue to a formatting thread. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter() if settings.log_format == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _ContextQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.log_level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Drain the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,240 @@
+"""Span-based timing for the reconstruction pipeline.
+
+``span(name, **attributes)`` times a block of work, records it on the
+active ``PipelineTrace`` (if any) and forwards it to an OpenTelemetry
+tracer. The default tracer is a no-op; set ``OTEL_ENABLED=true`` with
+``opentelemetry-api`` installed (and an SDK/exporter configured, e.g. via
+``opentelemetry-instrument``) to export spans.
+
+Span names are dotted, and the first segment is the pipeline stage the
+span is summarized under (``ocr.poll`` → ``ocr``), so ``PipelineTrace``
+can roll spans up into the per-stage ``documents`` columns.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from app.config import settings
+from app.services.structured_logging import bind
+
+logger = logging.getLogger(__name__)
+
+# Stages with a dedicated ``<stage>_seconds`` column on ``documents``
+STAGE_COLUMNS = ("download", "ocr", "figures", "parse", "compile", "merge", "upload")
+
+
+# ---------------------------------------------------------------------------
+# Tracer (OpenTelemetry-compatible, no-op by default)
+# ---------------------------------------------------------------------------
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+class _NoopTracer:
+    """Mirrors ``opentelemetry.trace.Tracer.start_as_current_span``."""
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: dict | None = None) -> Iterator[_NoopSpan]:
+        yield _NoopSpan()
+
+
+_tracer: Any = _NoopTracer()
+
+
+def init_tracing() -> None:
+    """Install the OpenTelemetry tracer if enabled and available."""
+    global _tracer
+    if not settings.otel_enabled:
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed; spans stay local")
+        return
+    _tracer = trace.get_tracer("reef-server")
+    logger.info("OpenTelemetry tracing enabled")
+
+
+def set_tracer(tracer: Any) -> None:
+    """Override the tracer (anything with ``start_as_current_span``)."""
+    global _tracer
+    _tracer = tracer or _NoopTracer()
+
+
+# ---------------------------------------------------------------------------
+# Local span records
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class SpanRecord:
+    """A finished (or in-progress) span kept for the pipeline summary."""
+    name: str
+    start: float
+    end: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+class Span:
+    """Handle yielded by ``span()`` — sets attributes locally and on the OTel span."""
+
+    __slots__ = ("_record", "_otel")
+
+    def __init__(self, record: SpanRecord, otel_span: Any):
+        self._record = record
+        self._otel = otel_span
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self._record.attributes[key] = value
+        if value is not None:
+            self._otel.set_attribute(key, _otel_value(value))
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (0 if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@dataclass
+class PipelineTrace:
+    """All spans recorded while processing one document.
+
+    ``peak_rss_bytes`` is the process RSS high-water sampled at every span
+    end — shared with concurrent documents, but it shows which stage a
+    spike lands in. ``memory`` is the job's own buffer accounting
+    (``memory_budget.JobMemory``), when the pipeline attaches one.
+    """
+    spans: list[SpanRecord] = field(default_factory=list)
+    peak_rss_bytes: int = 0
+    peak_rss_stage: str | None = None
+    memory: Any = None
+
+    def add(self, record: SpanRecord) -> None:
+        self.spans.append(record)
+        rss = rss_bytes()
+        if rss > self.peak_rss_bytes:
+            self.peak_rss_bytes = rss
+            self.peak_rss_stage = record.name.split(".", 1)[0]
+
+    def stage_seconds(self) -> dict[str, float]:
+        """Wall time per stage: first span start to last span end.
+
+        Spans inside a stage overlap (questions compile concurrently), so the
+        wall extent is what the stage actually cost the document.
+        """
+        bounds: dict[str, list[float]] = {}
+        for s in self.spans:
+            stage = s.name.split(".", 1)[0]
+            lo_hi = bounds.setdefault(stage, [s.start, s.end])
+            lo_hi[0] = min(lo_hi[0], s.start)
+            lo_hi[1] = max(lo_hi[1], s.end)
+        return {stage: round(hi - lo, 3) for stage, (lo, hi) in bounds.items()}
+
+    def summary(self) -> dict:
+        """Per-span-name totals plus per-question compile details (JSONB)."""
+        by_name: dict[str, dict] = {}
+        questions: dict[str, dict] = {}
+        for s in self.spans:
+            agg = by_name.setdefault(s.name, {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+            agg["count"] += 1
+            agg["total"] += s.seconds
+            agg["max"] = max(agg["max"], s.seconds)
+            if s.error:
+                agg["errors"] += 1
+            label = s.attributes.get("question")
+            if label is not None and s.name.startswith("compile."):
+                q = questions.setdefault(label, {"attempts": 0, "compile_seconds": 0.0, "fix_seconds": 0.0})
+                if s.name == "compile.fix":
+                    q["fix_seconds"] += s.seconds
+                else:
+                    q["attempts"] += 1
+                    q["compile_seconds"] += s.seconds
+        for agg in by_name.values():
+            agg["total"] = round(agg["total"], 3)
+            agg["max"] = round(agg["max"], 3)
+        for q in questions.values():
+            q["compile_seconds"] = round(q["compile_seconds"], 3)
+            q["fix_seconds"] = round(q["fix_seconds"], 3)
+        out = {
+            "stages": self.stage_seconds(),
+            "spans": by_name,
+            "questions": questions,
+            "peak_rss_mb": round(self.peak_rss_bytes / 2**20, 1),
+            "peak_rss_stage": self.peak_rss_stage,
+        }
+        if self.memory is not None:
+            out["memory"] = self.memory.summary()
+        return out
+
+    def columns(self) -> dict:
+        """Keyword arguments for ``update_document_status``."""
+        stages = self.stage_seconds()
+        cols = {f"{stage}_seconds": stages.get(stage, 0.0) for stage in STAGE_COLUMNS}
+        cols["stage_timings"] = self.summary()
+        return cols
+
+
+_current_trace: ContextVar[PipelineTrace | None] = ContextVar("pipeline_trace", default=None)
+
+
+def start_trace() -> PipelineTrace:
+    """Collect spans from the current task (and tasks it spawns) into a new trace.
+
+    Call at the top of a coroutine that runs as its own task — the context
+    variable is task-local, so the trace ends with the task.
+    """
+    trace = PipelineTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a block of work as a span named ``<stage>.<detail>``."""
+    record = SpanRecord(name=name, start=time.monotonic(), attributes=dict(attributes))
+    trace = _current_trace.get()
+    with (
+        bind(stage=name.split(".", 1)[0]),
+        _tracer.start_as_current_span(name, attributes=_otel_attributes(attributes)) as otel_span,
+    ):
+        try:
+            yield Span(record, otel_span)
+        except BaseException as e:
+            # start_as_current_span records the exception on the OTel span
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.end = time.monotonic()
+            if trace is not None:
+                trace.add(record)
+
+
+def _otel_value(value: Any) -> Any:
+    """OpenTelemetry only accepts primitive attribute values."""
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+def _otel_attributes(attributes: dict) -> dict:
+    return {k: _otel_value(v) for k, v in attributes.items() if v is not None}
@@ -0,0 +1,176 @@
+"""Coalesce transcription requests per canvas — debounce, supersede, fan out.
+
+The client asks for a transcription after every pen stroke, so while a
+student writes, requests for one canvas arrive faster than Mathpix
+answers them, and each is stale as soon as the next stroke lands. For
+each canvas (``(user_id, document_id, question_label)``) the coordinator:
+
+- debounces: a request waits ``TRANSCRIPTION_DEBOUNCE_SECONDS`` and is
+  replaced by any newer request that arrives in that window
+- supersedes: a newer request cancels the transcription already in
+  flight (its Mathpix calls still pending are never sent)
+- fans out: every request waiting on the canvas gets the result of the
+  latest run, so the client sees the newest LaTeX on every response
+
+So that continuous writing can't starve a canvas, a request never waits
+longer than ``TRANSCRIPTION_MAX_WAIT_SECONDS`` for the debounce, and a run
+whose oldest waiter has waited that long is no longer cancelled; newer
+requests queue behind it instead. Runs for one canvas never overlap.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+from app.config import settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Canvas = tuple[str, str, str]  # (user_id, document_id, question_label)
+
+
+@dataclass
+class _CanvasState:
+    run: Callable[[], Awaitable] | None = None  # latest request, not yet started
+    waiters: list[asyncio.Future] = field(default_factory=list)
+    first_at: float = 0.0  # when the oldest of ``waiters`` arrived
+    timer: asyncio.Task | None = None
+    task: asyncio.Task | None = None  # run in flight
+    task_waiters: list[asyncio.Future] = field(default_factory=list)
+    task_first_at: float = 0.0
+    # Newest run kept past max_wait; later runs start only after it ends
+    kept: asyncio.Task | None = None
+
+    @property
+    def idle(self) -> bool:
+        return (
+            not self.waiters and not self.task_waiters
+            and self.timer is None and self.task is None and self.kept is None
+        )
+
+
+class TranscriptionCoordinator:
+    def __init__(self, debounce: float, max_wait: float):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._canvases: dict[Canvas, _CanvasState] = {}
+        self.requests = 0
+        self.runs = 0
+        self.superseded = 0
+
+    async def submit(self, canvas: Canvas, run: Callable[[], Awaitable[T]]) -> T:
+        """Request a transcription of ``canvas``; ``run`` performs it.
+
+        Returns (or raises) the outcome of the latest ``run`` submitted for
+        the canvas before the transcription started, which may not be this
+        one's.
+        """
+        state = self._canvases.setdefault(canvas, _CanvasState())
+        now = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        if not state.waiters:
+            state.first_at = now
+        state.run = run
+        state.waiters.append(waiter)
+        self.requests += 1
+        metrics.transcription_requests.inc()
+
+        if state.task is not None and now - state.task_first_at < self.max_wait:
+            # In flight but stale: cancel it, its waiters get the next run
+            state.task.cancel()
+            self.superseded += 1
+            metrics.transcription_runs.labels("superseded").inc()
+            state.waiters = state.task_waiters + state.waiters
+            state.first_at = min(state.first_at, state.task_first_at)
+            state.task, state.task_waiters = None, []
+        self._schedule(canvas, state, now)
+
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            self._abandon(canvas, state, waiter)
+            raise
+
+    def _schedule(self, canvas: Canvas, state: _CanvasState, now: float) -> None:
+        if state.timer is not None:
+            state.timer.cancel()
+        delay = min(self.debounce, max(0.0, state.first_at + self.max_wait - now))
+        state.timer = asyncio.create_task(self._start_after(canvas, state, delay))
+
+    async def _start_after(self, canvas: Canvas, state: _CanvasState, delay: float) -> None:
+        await asyncio.sleep(delay)
+        state.timer = None
+        run, waiters, first_at = state.run, state.waiters, state.first_at
+        state.run, state.waiters = None, []
+        if state.task is not None:
+            # submit() let it run on. Remember it separately: the run started
+            # here may itself be cancelled, and its successor must still wait.
+            state.kept = state.task
+        task = asyncio.create_task(self._execute(run, waiters, state.kept))
+        state.task, state.task_waiters, state.task_first_at = task, waiters, first_at
+        task.add_done_callback(lambda t: self._finished(canvas, state, t))
+        if len(waiters) > 1:
+            logger.info("  [transcribe] %s/%s: %d requests coalesced into one run", canvas[1], canvas[2], len(waiters))
+
+    async def _execute(
+        self, run: Callable[[], Awaitable], waiters: list[asyncio.Future], previous: asyncio.Task | None,
+    ) -> None:
+        if previous is not None:
+            # A run kept past max_wait is still going; don't overlap it
+            await asyncio.wait({previous})
+        self.runs += 1
+        try:
+            result = await run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.transcription_runs.labels("failed").inc()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        metrics.transcription_runs.labels("completed").inc()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def _finished(self, canvas: Canvas, state: _CanvasState, task: asyncio.Task) -> None:
+        if state.task is task:
+            state.task, state.task_waiters = None, []
+        if state.kept is task:
+            state.kept = None
+        if state.idle and self._canvases.get(canvas) is state:
+            del self._canvases[canvas]
+
+    def _abandon(self, canvas: Canvas, state: _CanvasState, waiter: asyncio.Future) -> None:
+        """A caller went away; stop work nobody is waiting for."""
+        waiter.cancel()
+        if waiter in state.waiters:
+            state.waiters.remove(waiter)
+        if waiter in state.task_waiters:
+            state.task_waiters.remove(waiter)
+        if not state.waiters and state.timer is not None:
+            state.timer.cancel()
+            state.timer, state.run = None, None
+        if not state.task_waiters and state.task is not None:
+            state.task.cancel()
+            state.task = None
+        if state.idle and self._canvases.get(canvas) is state:
+            del self._canvases[canvas]
+
+    def stats(self) -> dict:
+        return {
+            "canvases": len(self._canvases),
+            "requests": self.requests,
+            "runs": self.runs,
+            "superseded": self.superseded,
+        }
+
+
+coordinator = TranscriptionCoordinator(
+    settings.transcription_debounce_seconds, settings.transcription_max_wait_seconds,
+)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Stroke clustering benchmark — grid index vs pairwise, full vs incremental.
+
+For each stroke count probed by ``stress_test_mathpix.py`` (1–500), times:
+
+- ``pairwise``: the reference clustering that tests every cluster for
+  every stroke (quadratic)
+- ``grid``: ``chunk_manager._cluster_strokes`` (uniform-grid index)
+- ``incremental``: adding one stroke to a canvas whose other strokes are
+  already clustered (``chunk_manager._canvas_clusters``), i.e. one edit
+
+and checks that grid and pairwise produce the same clusters. Two layouts:
+``stress`` is the stress script's synthetic grid of glyphs (everything
+ends up in a few large clusters), ``lines`` is a derivation written as
+separate lines of about ten glyphs.
+
+Usage:
+    python scripts/bench_clustering.py
+    python scripts/bench_clustering.py --repeat 20 --output bench_results/clustering.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_server_root = os.path.dirname(_here)
+for _p in (_server_root, _here):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+from app.services import chunk_manager  # noqa: E402
+from stress_test_mathpix import generate_stroke, generate_strokes  # noqa: E402
+
+STROKE_COUNTS = [1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500]
+
+
+def lines_layout(n: int, seed: int = 0) -> list[dict]:
+    """n glyph strokes written as lines of ~10 glyphs, 70px apart."""
+    rng = random.Random(seed)
+    types = ["line", "curve", "circle", "slash"]
+    strokes = []
+    for i in range(n):
+        row, col = divmod(i, 10)
+        cx = 20 + col * 34 + rng.uniform(-3, 3)
+        cy = 40 + row * 70 + rng.uniform(-4, 4)
+        strokes.append(generate_stroke(cx, cy, types[i % len(types)]))
+    return strokes
+
+
+LAYOUTS = {"stress": generate_strokes, "lines": lines_layout}
+
+
+def pairwise_clusters(strokes: list[dict]) -> list[list[int]]:
+    """Reference clustering: every stroke against every cluster."""
+    clusters: list[tuple[list[int], tuple]] = []
+    for i, stroke in enumerate(strokes):
+        keys, bbox = [i], chunk_manager._stroke_bbox(stroke)
+        while joined := [c for c in clusters if chunk_manager._bboxes_join(bbox, c[1])]:
+            for c in joined:
+                clusters.remove(c)
+                keys += c[0]
+                bbox = chunk_manager._union(bbox, c[1])
+        clusters.append((keys, bbox))
+    return sorted(sorted(keys) for keys, _ in clusters)
+
+
+def _best_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+
+def _incremental_ms(strokes: list[dict], repeat: int) -> float:
+    times = []
+    for r in range(repeat):
+        canvas = ("bench", "doc", f"canvas-{r}")
+        chunk_manager._canvas_clusters(canvas, strokes[:-1])
+        started = time.perf_counter()
+        chunk_manager._canvas_clusters(canvas, strokes)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def run(repeat: int) -> list[dict]:
+    rows = []
+    for layout, make in LAYOUTS.items():
+        print(f"\n{layout} layout")
+        print(f"  {'strokes':>7} {'clusters':>8} {'pairwise':>10} {'grid':>10} {'speedup':>8} {'+1 stroke':>10}")
+        for n in STROKE_COUNTS:
+            strokes = make(n)
+            grid = sorted(c.stroke_indices for c in chunk_manager._cluster_strokes(strokes))
+            reference = pairwise_clusters(strokes)
+            if grid != reference:
+                sys.exit(f"{layout}/{n}: grid clusters differ from pairwise")
+            pairwise_ms = _best_ms(lambda: pairwise_clusters(strokes), repeat)
+            grid_ms = _best_ms(lambda: chunk_manager._cluster_strokes(strokes), repeat)
+            incremental_ms = _incremental_ms(strokes, repeat) if n > 1 else math.nan
+            rows.append({
+                "layout": layout,
+                "strokes": n,
+                "clusters": len(grid),
+                "pairwise_ms": round(pairwise_ms, 3),
+                "grid_ms": round(grid_ms, 3),
+                "incremental_ms": round(incremental_ms, 3),
+            })
+            print(
+                f"  {n:>7} {len(grid):>8} {pairwise_ms:>8.2f}ms {grid_ms:>8.2f}ms "
+                f"{pairwise_ms / grid_ms if grid_ms else math.nan:>7.1f}x {incremental_ms:>8.2f}ms"
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Stroke clustering benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--output", help="Write rows as JSON to this path")
+    args = parser.parse_args(argv)
+
+    rows = run(args.repeat)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
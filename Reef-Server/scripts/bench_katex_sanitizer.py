@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""KaTeX sanitizer benchmark — single-pass rewrite vs the per-rule re.sub chain.
+
+Times ``katex_sanitizer.sanitize_for_katex`` against the implementation it
+replaced (kept below as ``legacy_sanitize``) on:
+
+- ``typical``: short strokes transcriptions like the ones returned by
+  ``/ai/transcribe-strokes`` (one line of math, a few rewrites each)
+- ``large``: a ~10 KB page of Mathpix output built from the same lines
+
+and checks that both produce the same output on every input.
+
+Usage:
+    python scripts/bench_katex_sanitizer.py
+    python scripts/bench_katex_sanitizer.py --repeat 20 --output bench_results/katex_sanitizer.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_server_root = os.path.dirname(_here)
+if _server_root not in sys.path:
+    sys.path.insert(0, _server_root)
+
+from app.services.katex_sanitizer import sanitize_for_katex  # noqa: E402
+
+TYPICAL = [
+    r"x^{2}+2 x+1=0",
+    r"\frac{d}{d x}\left(x^{2}\right)=2 x",
+    r"\int_{0}^{1} x^{2} d x=\frac{1}{3}",
+    r"\displaystyle \sum\limits_{n=1}^{\infty} \frac{1}{n^{2}}=\frac{\pi^{2}}{6}",
+    r"E=m c^{2} \tag{1}",
+    r"\mbox{if } x>0, \quad f(x)=\left( x+1 \right)",
+    r"\ce{H2O} \rightarrow \ce{H2} + \ce{O2}",
+    r"y=\left\{\begin{array}{ll}x & x \geq 0 \\ -x & x<0\end{array}\right.",
+    r"\rm{d} x \quad \textrm{for all } x \in \mathbb{R}",
+    r"\lim _{x \rightarrow 0} \frac{\sin x}{x}=1",
+]
+
+
+def legacy_sanitize(latex: str) -> str:
+    """The previous implementation: one re.sub per rule, uncompiled."""
+    s = latex
+
+    # Remove \tag{...} — equation numbering looks bad in sidebar
+    s = re.sub(r"\\tag\{[^}]*\}", "", s)
+
+    # \def and \newcommand not supported in KaTeX — strip them
+    s = re.sub(r"\\def\\[a-zA-Z]+\{[^}]*\}", "", s)
+    s = re.sub(r"\\newcommand\{[^}]*\}\{[^}]*\}", "", s)
+
+    # \hspace{...} → \kern{...}
+    s = re.sub(r"\\hspace\{([^}]*)\}", r"\\kern{\1}", s)
+
+    # \mathrlap, \mathllap, \mathclap — not in KaTeX, strip wrapper
+    for cmd in ("mathrlap", "mathllap", "mathclap"):
+        s = re.sub(rf"\\{cmd}\{{([^}}]*)\}}", r"\1", s)
+
+    # \displaystyle at start of expression — KaTeX supports it but
+    # Mathpix sometimes puts it outside math mode
+    s = re.sub(r"^\s*\\displaystyle\s*", "", s)
+
+    # \limits placement: \sum\limits_{...} → \sum_{...}
+    # KaTeX supports \limits but Mathpix sometimes misplaces it
+    s = re.sub(r"\\(sum|prod|int|bigcup|bigcap|coprod|bigoplus|bigotimes)\\limits", r"\\\1", s)
+
+    # Fix unbalanced \left / \right — if one is missing, remove both
+    left_count = len(re.findall(r"\\left[\(\[\{|.]", s))
+    right_count = len(re.findall(r"\\right[\)\]\}|.]", s))
+    if left_count != right_count:
+        s = re.sub(r"\\left([\(\[\{|.])", r"\1", s)
+        s = re.sub(r"\\right([\)\]\}|.])", r"\1", s)
+
+    # --- Expanded: handle more Mathpix outputs that KaTeX doesn't support ---
+
+    # Chemistry: \ce{...} → strip to plain text content
+    s = re.sub(r"\\ce\{([^}]*)\}", r"\\text{\1}", s)
+
+    # \cancel, \bcancel, \xcancel — KaTeX supports \cancel but Mathpix
+    # sometimes uses variants; normalize to \cancel or strip
+    s = re.sub(r"\\bcancel\{([^}]*)\}", r"\\cancel{\1}", s)
+    s = re.sub(r"\\xcancel\{([^}]*)\}", r"\\cancel{\1}", s)
+
+    # \mbox{...} → \text{...} (KaTeX uses \text)
+    s = re.sub(r"\\mbox\{([^}]*)\}", r"\\text{\1}", s)
+
+    # \textrm, \textsl, \textsc — normalize to \text
+    for cmd in ("textrm", "textsl", "textsc", "textup"):
+        s = re.sub(rf"\\{cmd}\{{([^}}]*)\}}", r"\\text{\1}", s)
+
+    # \ensuremath{...} → just the content
+    s = re.sub(r"\\ensuremath\{([^}]*)\}", r"\1", s)
+
+    # \mathrm{...} — KaTeX supports it, but Mathpix sometimes uses
+    # \rm which is not supported; convert \rm{...} → \mathrm{...}
+    s = re.sub(r"\\rm\{([^}]*)\}", r"\\mathrm{\1}", s)
+    # Bare \rm (no braces) — strip it
+    s = re.sub(r"\\rm\b(?!\{)", "", s)
+
+    # \boldmath, \unboldmath — not in KaTeX, strip
+    s = re.sub(r"\\(?:un)?boldmath\b", "", s)
+
+    # \vcenter{...} → just content
+    s = re.sub(r"\\vcenter\{([^}]*)\}", r"\1", s)
+
+    # \adjustbox, \scalebox, \resizebox — strip wrapper, keep content
+    for cmd in ("adjustbox", "scalebox", "resizebox"):
+        # These can have multiple brace groups; take the last one as content
+        s = re.sub(rf"\\{cmd}(?:\{{[^}}]*\}})*\{{([^}}]*)\}}", r"\1", s)
+
+    # \intertext{...} → \text{...} (used in align environments)
+    s = re.sub(r"\\intertext\{([^}]*)\}", r"\\text{\1}", s)
+
+    # Strip entire tikz/pgf environments (can't render in KaTeX)
+    s = re.sub(r"\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}", "[diagram]", s, flags=re.DOTALL)
+    s = re.sub(r"\\begin\{pgfpicture\}.*?\\end\{pgfpicture\}", "[diagram]", s, flags=re.DOTALL)
+
+    # \includegraphics — can't render, replace with placeholder
+    s = re.sub(r"\\includegraphics(?:\[[^\]]*\])?\{[^}]*\}", "[image]", s)
+
+    # \href{url}{text} → just the text
+    s = re.sub(r"\\href\{[^}]*\}\{([^}]*)\}", r"\1", s)
+    # \url{...} → plain text
+    s = re.sub(r"\\url\{([^}]*)\}", r"\\text{\1}", s)
+
+    # Strip trailing whitespace/newlines
+    s = s.strip()
+
+    return s
+
+
+def large_input(size: int = 10_000) -> str:
+    lines, total = [], 0
+    while total < size:
+        line = TYPICAL[len(lines) % len(TYPICAL)]
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def _per_call_us(fn, inputs: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for latex in inputs:
+            fn(latex)
+        best = min(best, time.perf_counter() - started)
+    return best / len(inputs) * 1e6
+
+
+def run(repeat: int) -> list[dict]:
+    large = large_input()
+    cases = {"typical": TYPICAL * 20, "large": [large]}
+    for latex in TYPICAL + [large]:
+        if sanitize_for_katex(latex) != legacy_sanitize(latex):
+            sys.exit(f"output differs from legacy on {latex[:60]!r}")
+
+    rows = []
+    print(f"  {'input':>8} {'bytes':>7} {'legacy':>10} {'single-pass':>12} {'speedup':>8} {'MB/s':>7}")
+    for name, inputs in cases.items():
+        size = sum(len(s) for s in inputs) / len(inputs)
+        legacy_us = _per_call_us(legacy_sanitize, inputs, repeat)
+        new_us = _per_call_us(sanitize_for_katex, inputs, repeat)
+        rows.append({
+            "input": name,
+            "bytes": round(size),
+            "legacy_us": round(legacy_us, 2),
+            "single_pass_us": round(new_us, 2),
+            "speedup": round(legacy_us / new_us, 2),
+            "mb_per_s": round(size / new_us, 2),
+        })
+        print(
+            f"  {name:>8} {size:>7.0f} {legacy_us:>8.1f}us {new_us:>10.1f}us "
+            f"{legacy_us / new_us:>7.1f}x {size / new_us:>7.1f}"
+        )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="KaTeX sanitizer benchmark")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per measurement")
+    parser.add_argument("--output", help="Write rows as JSON to this path")
+    args = parser.parse_args(argv)
+
+    rows = run(args.repeat)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
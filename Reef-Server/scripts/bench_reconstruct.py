@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Reconstruction throughput benchmark — how many documents per minute per worker.
+
+Drives ``_run_pipeline`` in-process against stubbed backends with fixed
+latency: Mathpix and Supabase are served by ``scripts/mock_backends.py``
+through ``httpx.ASGITransport``, and LLM calls return canned JSON after a
+fixed sleep. LaTeX compiles use real tectonic when it is on PATH, otherwise
+(or with ``--compile-latency``) a stub that sleeps and renders the body with
+PyMuPDF.
+
+Per-stage times are read back from the ``<stage>_seconds`` columns the
+pipeline writes to its document row. Each concurrency level runs in a fresh
+subprocess so peak RSS is per level.
+
+Usage:
+    python scripts/bench_reconstruct.py
+    python scripts/bench_reconstruct.py --corpus ~/pdfs --concurrency 1,4,8 --llm-latency 1500
+    python scripts/bench_reconstruct.py --docs 16 --pages 4 --compile-latency 400
+
+Output:
+    bench_results/reconstruct-<commit>.json — one comparable report per commit
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+_here = Path(__file__).resolve().parent
+_server_root = _here.parent
+if str(_server_root) not in sys.path:
+    sys.path.insert(0, str(_server_root))
+if str(_here) not in sys.path:
+    sys.path.insert(0, str(_here))
+
+MOCK_BASE = "http://mock"
+STAGES = ("download", "ocr", "parse", "compile", "merge", "upload")
+
+# Must be set before any app module reads settings
+os.environ.setdefault("SUPABASE_URL", MOCK_BASE)
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ.setdefault("MATHPIX_API_BASE", MOCK_BASE)
+os.environ.setdefault("MATHPIX_CDN_BASE", f"{MOCK_BASE}/cdn")
+# Synthetic documents are near-identical; measure the full pipeline, not reuse
+os.environ.setdefault("NEAR_DUPLICATE_THRESHOLD", "2")
+
+
+# ---------------------------------------------------------------------------
+# Stubs
+# ---------------------------------------------------------------------------
+
+
+def _install_stubs(args: argparse.Namespace) -> None:
+    """Patch the LLM client and (optionally) the LaTeX compiler for an offline run."""
+    import re
+
+    import fitz
+
+    from app.services.latex_compiler import LaTeXCompiler
+    from app.services.llm_client import LLMClient, LLMResult
+
+    llm_delay = args.llm_latency / 1000
+    problem_re = re.compile(r"Problem\s+(\d+)\.?\s*(.*?)(?=Problem\s+\d+|\Z)", re.DOTALL)
+    figure_re = re.compile(r"!\[[^\]]*\]\(([^)]+)\)")
+
+    async def fake_generate(self, prompt: str, *a, response_schema: dict | None = None, **kw) -> LLMResult:
+        await asyncio.sleep(llm_delay)
+        props = (response_schema or {}).get("properties", {})
+        if "questions" in props:
+            mmd = prompt.rsplit("## MMD Content", 1)[-1]
+            questions = []
+            for num, body in problem_re.findall(mmd):
+                figures = figure_re.findall(body)
+                text = figure_re.sub("", body).strip().strip("`").strip()
+                questions.append({"number": int(num), "text": text, "figures": figures, "parts": []})
+            content = json.dumps({"questions": questions})
+        elif "question_number" in props:
+            content = json.dumps({
+                "question_number": 1,
+                "parts": [{"label": "a", "final_answer": "$1$", "steps": [
+                    {"description": "Apply the rule", "explanation": "Which rule?", "work": "$x$"},
+                ]}],
+            })
+        else:
+            content = "Fixed body"
+        return LLMResult(content=content, input_tokens=len(prompt) // 4, output_tokens=len(content) // 4)
+
+    LLMClient.generate = fake_generate
+
+    if args.compile_latency is not None or shutil.which("tectonic") is None:
+        compile_delay = (args.compile_latency or 300) / 1000
+
+        def fake_compile(self, latex_content: str, image_data: dict | None = None) -> bytes:
+            time.sleep(compile_delay)
+            doc = fitz.open()
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(72, 72, 540, 720), latex_content[:3000], fontsize=10)
+            data = doc.tobytes()
+            doc.close()
+            return data
+
+        LaTeXCompiler.validate = lambda self: None
+        LaTeXCompiler.compile_latex = fake_compile
+
+
+# ---------------------------------------------------------------------------
+# Single level (child process)
+# ---------------------------------------------------------------------------
+
+
+def _load_corpus(args: argparse.Namespace) -> list[bytes]:
+    from mock_backends import synthetic_pdf
+
+    if args.corpus:
+        pdfs = sorted(Path(args.corpus).expanduser().glob("*.pdf"))
+        if not pdfs:
+            raise SystemExit(f"No PDFs found in {args.corpus}")
+        corpus = [p.read_bytes() for p in pdfs]
+    else:
+        corpus = [synthetic_pdf(args.pages)]
+    return [corpus[i % len(corpus)] for i in range(args.docs)]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "mean": round(statistics.fmean(values), 4) if values else 0.0,
+        "p50": round(_percentile(values, 50), 4),
+        "p95": round(_percentile(values, 95), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+async def _run_level(args: argparse.Namespace, concurrency: int) -> dict:
+    import httpx
+
+    from mock_backends import MockConfig, create_app
+
+    from app.routers import reconstruct_v2
+    from app.services.http_pool import init_pool
+
+    _install_stubs(args)
+
+    config = MockConfig(seed=args.seed, polls_until_complete=args.mathpix_polls)
+    config.set_latency("mathpix", f"fixed:{args.mathpix_latency}")
+    config.set_latency("supabase", f"fixed:{args.storage_latency}")
+    mock = create_app(config, cdn_base=f"{MOCK_BASE}/cdn")
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock), base_url=MOCK_BASE)
+    init_pool(client)
+
+    user_id = "bench-user"
+    docs = _load_corpus(args)
+    doc_ids = []
+    for pdf in docs:
+        doc_id = str(uuid.uuid4())
+        mock.state.objects[f"documents/{user_id}/{doc_id}/original.pdf"] = pdf
+        doc_ids.append(doc_id)
+
+    sem = asyncio.Semaphore(concurrency)
+    doc_seconds: dict[str, float] = {}
+
+    async def _one(doc_id: str) -> None:
+        async with sem:
+            start = time.monotonic()
+            await reconstruct_v2._run_pipeline(document_id=doc_id, user_id=user_id)
+            doc_seconds[doc_id] = time.monotonic() - start
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.monotonic()
+    await asyncio.gather(*[_one(d) for d in doc_ids])
+    wall = time.monotonic() - wall_start
+
+    # Let fire-and-forget answer keys finish so CPU accounting includes them
+    if reconstruct_v2._background_tasks:
+        await asyncio.gather(*list(reconstruct_v2._background_tasks), return_exceptions=True)
+
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (
+        (usage_after.ru_utime - usage_before.ru_utime)
+        + (usage_after.ru_stime - usage_before.ru_stime)
+        + (children_after.ru_utime - children_before.ru_utime)
+        + (children_after.ru_stime - children_before.ru_stime)
+    )
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak_rss_mb = max(usage_after.ru_maxrss, children_after.ru_maxrss) / rss_divisor
+
+    rows = {row["id"]: row for row in mock.state.tables["documents"]}
+    succeeded = [d for d in doc_ids if rows.get(d, {}).get("status") == "completed"]
+    failures = {
+        d: rows.get(d, {}).get("error_message") for d in doc_ids if d not in succeeded
+    }
+
+    # Stage timings come from the pipeline's own tracing columns
+    stage_values = {
+        stage: [float(rows[d].get(f"{stage}_seconds") or 0.0) for d in succeeded]
+        for stage in STAGES
+    }
+
+    await client.aclose()
+    return {
+        "concurrency": concurrency,
+        "documents": len(doc_ids),
+        "succeeded": len(succeeded),
+        "failures": failures,
+        "wall_seconds": round(wall, 3),
+        "docs_per_minute": round(len(succeeded) / wall * 60, 2) if wall else 0.0,
+        "cpu_seconds": round(cpu, 3),
+        "cpu_seconds_per_doc": round(cpu / len(doc_ids), 3) if doc_ids else 0.0,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "document_seconds": _summary([doc_seconds[d] for d in succeeded]),
+        "stages": {stage: _summary(values) for stage, values in stage_values.items()},
+        "mock_requests": {g: s["requests"] for g, s in mock.state.stats.items()},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+
+def _git(*cmd: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *cmd], capture_output=True, text=True, cwd=_server_root, timeout=10,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reconstruction throughput benchmark")
+    parser.add_argument("--corpus", help="Directory of PDFs (default: synthetic PDFs)")
+    parser.add_argument("--docs", type=int, default=8, help="Documents per concurrency level")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per synthetic PDF")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated levels")
+    parser.add_argument("--llm-latency", type=float, default=1000, help="LLM call latency (ms)")
+    parser.add_argument("--mathpix-latency", type=float, default=200, help="Per Mathpix request (ms)")
+    parser.add_argument("--mathpix-polls", type=int, default=3, help="Polls before OCR completes")
+    parser.add_argument("--storage-latency", type=float, default=50, help="Per Supabase request (ms)")
+    parser.add_argument(
+        "--compile-latency", type=float, default=None,
+        help="Stub tectonic with this latency (ms); default uses tectonic if installed",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Report path (default: bench_results/reconstruct-<commit>.json)")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = _parse_args()
+
+    if args.level is not None:
+        import logging
+        logging.basicConfig(level=logging.WARNING)
+        result = asyncio.run(_run_level(args, args.level))
+        print(json.dumps(result))
+        return
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    report = {
+        "benchmark": "reconstruct",
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--", ".")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "tectonic": "stub" if args.compile_latency is not None or not shutil.which("tectonic") else "real",
+        "config": {
+            k: v for k, v in vars(args).items() if k not in ("level", "output")
+        },
+        "levels": [],
+    }
+
+    print(f"Reconstruction benchmark @ {commit} ({report['tectonic']} tectonic)")
+    print("=" * 72)
+    for level in levels:
+        cmd = [sys.executable, __file__, *sys.argv[1:], "--level", str(level)]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=_server_root)
+        if proc.returncode != 0:
+            print(f"  concurrency {level}: FAILED\n{proc.stderr[-2000:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["levels"].append(result)
+        stages = " ".join(f"{s}={result['stages'][s]['p50']:.2f}" for s in STAGES)
+        print(
+            f"  c={level:<3} {result['succeeded']}/{result['documents']} ok | "
+            f"{result['docs_per_minute']:>7.2f} docs/min | cpu {result['cpu_seconds']:>6.2f}s | "
+            f"rss {result['peak_rss_mb']:>6.1f}MB | p50 {stages}"
+        )
+
+    output = Path(args.output) if args.output else _server_root / "bench_results" / f"reconstruct-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
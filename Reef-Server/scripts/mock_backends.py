@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""Local stand-in for Mathpix and Supabase — offline load and latency testing.
+
+Serves the subset of both APIs the reconstruction pipeline touches:
+
+    Mathpix   POST /v3/pdf, GET /v3/pdf/{id}, GET /v3/pdf/{id}.mmd,
+              GET /cdn/{path} (figure images), POST /v3/text,
+              POST /v3/app-tokens, POST /v3/strokes
+    Supabase  GET/POST/PATCH /rest/v1/{table},
+              GET/PUT/POST /storage/v1/object/{bucket}/{path}
+
+Every route belongs to a group (submit, poll, mmd, cdn, text, strokes, rest,
+storage)
+with its own latency distribution and error rate, so a run is reproducible
+for a given ``--seed``.
+
+Usage:
+    python scripts/mock_backends.py --port 8765
+    python scripts/mock_backends.py --latency mathpix=lognormal:800:0.4 --error-rate cdn=0.05
+
+Point the server at it:
+    MATHPIX_API_BASE=http://127.0.0.1:8765 \\
+    MATHPIX_CDN_BASE=http://127.0.0.1:8765/cdn \\
+    SUPABASE_URL=http://127.0.0.1:8765 \\
+    SUPABASE_SERVICE_ROLE_KEY=mock \\
+    uvicorn app.main:app
+
+``create_app()`` is importable so benchmarks can mount the mock in-process
+through ``httpx.ASGITransport`` instead of a real socket.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import random
+import sys
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import fitz  # PyMuPDF
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+GROUPS = ("submit", "poll", "mmd", "cdn", "text", "strokes", "rest", "storage")
+
+# Aliases accepted on the command line for setting several groups at once
+_GROUP_ALIASES = {
+    "all": GROUPS,
+    "mathpix": ("submit", "poll", "mmd", "cdn", "text", "strokes"),
+    "supabase": ("rest", "storage"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Latency distributions
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Latency:
+    """A latency distribution in milliseconds.
+
+    Spec strings: ``fixed:MS``, ``uniform:LO:HI``, ``normal:MEAN:STDDEV``,
+    ``lognormal:MEDIAN:SIGMA``.
+    """
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> Latency:
+        kind, _, rest = spec.partition(":")
+        args = [float(x) for x in rest.split(":")] if rest else []
+        if kind == "fixed" and len(args) == 1:
+            return cls(kind, args[0])
+        if kind in ("uniform", "normal", "lognormal") and len(args) == 2:
+            return cls(kind, args[0], args[1])
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Return a delay in seconds (never negative)."""
+        if self.kind == "fixed":
+            ms = self.a
+        elif self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.a, self.b)
+        else:
+            ms = self.a * math.exp(rng.gauss(0.0, self.b))
+        return max(ms, 0.0) / 1000
+
+
+@dataclass
+class MockConfig:
+    """Behaviour knobs for the stand-in services."""
+    latency: dict[str, Latency] = field(default_factory=lambda: {g: Latency() for g in GROUPS})
+    error_rate: dict[str, float] = field(default_factory=lambda: {g: 0.0 for g in GROUPS})
+    error_status: int = 503
+    polls_until_complete: int = 2
+    figures_per_page: int = 1
+    default_pages: int = 2
+    seed: int = 0
+
+    def set_latency(self, target: str, spec: str) -> None:
+        for group in _expand_group(target):
+            self.latency[group] = Latency.parse(spec)
+
+    def set_error_rate(self, target: str, rate: float) -> None:
+        for group in _expand_group(target):
+            self.error_rate[group] = rate
+
+
+def _expand_group(target: str) -> tuple[str, ...]:
+    if target in _GROUP_ALIASES:
+        return _GROUP_ALIASES[target]
+    if target in GROUPS:
+        return (target,)
+    raise ValueError(f"Unknown group {target!r} (expected one of {GROUPS} or {tuple(_GROUP_ALIASES)})")
+
+
+# ---------------------------------------------------------------------------
+# Synthetic content
+# ---------------------------------------------------------------------------
+
+_PROBLEM_TEMPLATES = [
+    "Find the derivative of $f(x) = x^{n} \\sin(x)$.",
+    "Evaluate the integral \\[ \\int_0^{n} x e^{-x} \\, dx \\]",
+    "Solve the differential equation $\\frac{dy}{dx} = {n} y$ with $y(0) = 1$.",
+    "A block of mass ${n}$ kg rests on an incline at $30^\\circ$. Find the normal force.",
+]
+
+
+def synthetic_pdf(pages: int) -> bytes:
+    """Build a small text PDF with one math-flavoured problem per page."""
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        text = f"Problem {i + 1}. " + _PROBLEM_TEMPLATES[i % len(_PROBLEM_TEMPLATES)].replace("{n}", str(i + 2))
+        page.insert_text((72, 72), text, fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _page_count(pdf_bytes: bytes) -> int:
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception:
+        return 1
+
+
+def _synthetic_mmd(pdf_bytes: bytes, pdf_id: str, cdn_base: str, figures_per_page: int) -> str:
+    """Derive MMD from the submitted PDF's text, adding CDN figure references."""
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        page_texts = [page.get_text().strip() for page in doc]
+        doc.close()
+    except Exception:
+        page_texts = []
+
+    blocks: list[str] = []
+    for i, text in enumerate(page_texts or [""]):
+        if not text:
+            text = f"Problem {i + 1}. " + _PROBLEM_TEMPLATES[i % len(_PROBLEM_TEMPLATES)].replace("{n}", str(i + 2))
+        blocks.append(text)
+        for f in range(figures_per_page):
+            blocks.append(
+                f"![]({cdn_base}/cropped/{pdf_id}-{i + 1}-{f}.jpg"
+                f"?height=240&width=320&top_left_y={100 + f * 10}&top_left_x=72)"
+            )
+    return "\n\n".join(blocks)
+
+
+def _figure_jpeg(width: int = 320, height: int = 240) -> bytes:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), 0)
+    pix.clear_with(230)
+    return pix.tobytes("jpg")
+
+
+# ---------------------------------------------------------------------------
+# PostgREST-ish helpers
+# ---------------------------------------------------------------------------
+
+
+def _eq_filters(request: Request) -> dict[str, str]:
+    """Extract ``col=eq.value`` filters from the query string."""
+    filters = {}
+    for key, value in request.query_params.items():
+        if value.startswith("eq."):
+            filters[key] = value[3:]
+    return filters
+
+
+def _matches(row: dict, filters: dict[str, str]) -> bool:
+    return all(str(row.get(k)) == v for k, v in filters.items())
+
+
+# ---------------------------------------------------------------------------
+# App
+# ---------------------------------------------------------------------------
+
+
+def create_app(config: MockConfig | None = None, cdn_base: str | None = None) -> FastAPI:
+    """Build the stand-in app.
+
+    ``cdn_base`` is the URL prefix written into generated MMD; it must match
+    the server's ``MATHPIX_CDN_BASE`` so figure downloads route back here.
+    """
+    config = config or MockConfig()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Reef mock backends")
+
+    app.state.config = config
+    app.state.pdfs = {}
+    app.state.tables = defaultdict(list)
+    app.state.objects = {}
+    app.state.stats = defaultdict(lambda: {"requests": 0, "errors": 0, "delay_seconds": 0.0})
+
+    async def _inject(group: str) -> Response | None:
+        """Sleep for the group's latency, then maybe return an injected error."""
+        stats = app.state.stats[group]
+        stats["requests"] += 1
+        delay = config.latency[group].sample(rng)
+        stats["delay_seconds"] += delay
+        if delay:
+            await asyncio.sleep(delay)
+        if rng.random() < config.error_rate[group]:
+            stats["errors"] += 1
+            return JSONResponse({"error": f"injected {group} failure"}, status_code=config.error_status)
+        return None
+
+    def _cdn(request: Request) -> str:
+        return cdn_base or f"{str(request.base_url).rstrip('/')}/cdn"
+
+    # -- Mathpix --------------------------------------------------------------
+
+    @app.post("/v3/pdf")
+    async def submit_pdf(request: Request):
+        if (err := await _inject("submit")) is not None:
+            return err
+        form = await request.form()
+        upload = form.get("file")
+        pdf_bytes = await upload.read() if upload is not None else b""
+        pdf_id = uuid.uuid4().hex[:16]
+        app.state.pdfs[pdf_id] = {
+            "polls": 0,
+            "pages": _page_count(pdf_bytes),
+            "mmd": _synthetic_mmd(pdf_bytes, pdf_id, _cdn(request), config.figures_per_page),
+        }
+        return {"pdf_id": pdf_id}
+
+    @app.get("/v3/pdf/{pdf_id}.mmd")
+    async def download_mmd(pdf_id: str):
+        if (err := await _inject("mmd")) is not None:
+            return err
+        entry = app.state.pdfs.get(pdf_id)
+        if entry is None:
+            return JSONResponse({"error": "unknown pdf_id"}, status_code=404)
+        return Response(entry["mmd"], media_type="text/plain")
+
+    @app.get("/v3/pdf/{pdf_id}")
+    async def poll_pdf(pdf_id: str):
+        if (err := await _inject("poll")) is not None:
+            return err
+        entry = app.state.pdfs.get(pdf_id)
+        if entry is None:
+            return JSONResponse({"error": "unknown pdf_id"}, status_code=404)
+        entry["polls"] += 1
+        done = entry["polls"] >= config.polls_until_complete
+        return {
+            "status": "completed" if done else "split",
+            "percent_done": 100 if done else 50,
+            "num_pages": entry["pages"],
+        }
+
+    @app.get("/cdn/{path:path}")
+    async def cdn_image(path: str):
+        if (err := await _inject("cdn")) is not None:
+            return err
+        return Response(_figure_jpeg(), media_type="image/jpeg")
+
+    @app.post("/v3/text")
+    async def transcribe_text():
+        if (err := await _inject("text")) is not None:
+            return err
+        return {"latex_styled": "x^{2}+1", "text": "$x^{2}+1$", "confidence": 0.99}
+
+    @app.post("/v3/app-tokens")
+    async def create_app_token(request: Request):
+        if (err := await _inject("strokes")) is not None:
+            return err
+        body = await request.json()
+        return {
+            "app_token": f"token-{uuid.uuid4().hex[:16]}",
+            "strokes_session_id": uuid.uuid4().hex,
+            "app_token_expires_at": 0,
+            "expires": body.get("expires", 300),
+        }
+
+    @app.post("/v3/strokes")
+    async def transcribe_strokes(request: Request):
+        if (err := await _inject("strokes")) is not None:
+            return err
+        body = await request.json()
+        count = len(body.get("strokes", {}).get("strokes", {}).get("x", []))
+        return {"latex_styled": f"x_{{{count}}}", "text": f"$x_{{{count}}}$", "confidence": 0.99}
+
+    # -- Supabase REST --------------------------------------------------------
+
+    @app.get("/rest/v1/{table}")
+    async def rest_select(table: str, request: Request):
+        if (err := await _inject("rest")) is not None:
+            return err
+        filters = _eq_filters(request)
+        return [row for row in app.state.tables[table] if _matches(row, filters)]
+
+    @app.post("/rest/v1/{table}")
+    async def rest_insert(table: str, request: Request):
+        if (err := await _inject("rest")) is not None:
+            return err
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        conflict = request.query_params.get("on_conflict")
+        keys = conflict.split(",") if conflict else None
+        existing = app.state.tables[table]
+        for row in rows:
+            if keys:
+                match = next((r for r in existing if all(r.get(k) == row.get(k) for k in keys)), None)
+                if match is not None:
+                    match.update(row)
+                    continue
+            existing.append(dict(row))
+        return Response(status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def rest_update(table: str, request: Request):
+        if (err := await _inject("rest")) is not None:
+            return err
+        filters = _eq_filters(request)
+        body = await request.json()
+        matched = [row for row in app.state.tables[table] if _matches(row, filters)]
+        if not matched and filters:
+            # Documents are created by the client app; record the row on first PATCH
+            app.state.tables[table].append({**filters, **body})
+        for row in matched:
+            row.update(body)
+        return Response(status_code=204)
+
+    # -- Supabase storage -----------------------------------------------------
+
+    @app.get("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_get(bucket: str, path: str):
+        if (err := await _inject("storage")) is not None:
+            return err
+        key = f"{bucket}/{path}"
+        data = app.state.objects.get(key)
+        if data is None:
+            if not path.endswith(".pdf"):
+                return JSONResponse({"error": "not found"}, status_code=404)
+            data = synthetic_pdf(config.default_pages)
+        return Response(data, media_type="application/octet-stream")
+
+    @app.api_route("/storage/v1/object/{bucket}/{path:path}", methods=["PUT", "POST"])
+    async def storage_put(bucket: str, path: str, request: Request):
+        if (err := await _inject("storage")) is not None:
+            return err
+        app.state.objects[f"{bucket}/{path}"] = await request.body()
+        return {"Key": f"{bucket}/{path}"}
+
+    # -- Introspection --------------------------------------------------------
+
+    @app.get("/_mock/stats")
+    async def mock_stats():
+        return {
+            "groups": dict(app.state.stats),
+            "pdfs": len(app.state.pdfs),
+            "objects": len(app.state.objects),
+            "tables": {name: len(rows) for name, rows in app.state.tables.items()},
+        }
+
+    @app.post("/_mock/reset")
+    async def mock_reset():
+        app.state.pdfs.clear()
+        app.state.tables.clear()
+        app.state.objects.clear()
+        app.state.stats.clear()
+        return {"status": "ok"}
+
+    return app
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def _parse_assignment(value: str) -> tuple[str, str]:
+    target, sep, spec = value.partition("=")
+    if not sep:
+        return "all", value
+    return target, spec
+
+
+def build_config(args: argparse.Namespace) -> MockConfig:
+    config = MockConfig(
+        error_status=args.error_status,
+        polls_until_complete=args.polls,
+        figures_per_page=args.figures_per_page,
+        default_pages=args.pages,
+        seed=args.seed,
+    )
+    for value in args.latency:
+        config.set_latency(*_parse_assignment(value))
+    for value in args.error_rate:
+        target, rate = _parse_assignment(value)
+        config.set_error_rate(target, float(rate))
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Mathpix + Supabase stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", action="append", default=[], metavar="[GROUP=]SPEC",
+        help="Latency distribution, e.g. 'poll=fixed:300' or 'mathpix=lognormal:800:0.4' (repeatable)",
+    )
+    parser.add_argument(
+        "--error-rate", action="append", default=[], metavar="[GROUP=]RATE",
+        help="Fraction of requests answered with --error-status, e.g. 'cdn=0.05' (repeatable)",
+    )
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--polls", type=int, default=2, help="Polls before a PDF reports completed")
+    parser.add_argument("--figures-per-page", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=2, help="Pages in synthesized source PDFs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        config = build_config(args)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    import uvicorn
+
+    cdn_base = f"http://{args.host}:{args.port}/cdn"
+    print(f"Mock backends on http://{args.host}:{args.port} (CDN {cdn_base})")
+    uvicorn.run(create_app(config, cdn_base=cdn_base), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Import-time profile of the server — what a cold start pays before serving.
+
+Runs ``python -X importtime -c "import app.main"`` in a fresh interpreter
+and reports the total plus the slowest modules by cumulative and by self
+time. Heavy modules should be behind ``app.services.lazy_imports``; if one
+shows up here, it is being imported eagerly somewhere.
+
+Usage:
+    python scripts/profile_imports.py
+    python scripts/profile_imports.py --top 30 --module app.routers.fit_shape
+    python scripts/profile_imports.py --budget-ms 600   # exit 1 if slower
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+_server_root = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def profile(module: str) -> list[ImportRecord]:
+    """Import ``module`` in a fresh interpreter and parse ``-X importtime`` output."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("SUPABASE_URL", "http://localhost")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_server_root, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    records: list[ImportRecord] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append(ImportRecord(name.strip(), depth, int(self_us), int(cumulative_us)))
+    return records
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Server import-time profile")
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--top", type=int, default=15, help="Rows per table")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the total exceeds this")
+    args = parser.parse_args(argv)
+
+    records = profile(args.module)
+    total_ms = sum(r.cumulative_us for r in records if r.depth == 0) / 1000
+
+    print(f"import {args.module}: {total_ms:.0f} ms total, {len(records)} modules\n")
+    print("Slowest by cumulative time (top-level packages):")
+    top_level = sorted((r for r in records if r.depth <= 1), key=lambda r: -r.cumulative_us)
+    for r in top_level[:args.top]:
+        print(f"  {r.cumulative_us / 1000:8.1f} ms  {r.module}")
+    print("\nSlowest by self time:")
+    for r in sorted(records, key=lambda r: -r.self_us)[:args.top]:
+        print(f"  {r.self_us / 1000:8.1f} ms  {r.module}")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nOver budget: {total_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+-- Wall time of each ledgered call (LLM request, Mathpix job, tectonic compile).
+
+ALTER TABLE public.api_costs
+    ADD COLUMN IF NOT EXISTS latency_ms INT;
@@ -0,0 +1,4 @@
+-- Input tokens served from the LLM provider's prompt cache (a subset of input_tokens).
+
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS cached_tokens INT DEFAULT 0;
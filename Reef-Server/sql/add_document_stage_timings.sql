@@ -0,0 +1,14 @@
+-- Per-stage pipeline timings on documents, summarized from tracing spans.
+-- stage_timings holds the full breakdown: per-span totals and per-question
+-- compile attempts / fix time.
+
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS download_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS ocr_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS figures_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS parse_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS compile_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS merge_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS upload_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS answer_key_seconds DOUBLE PRECISION DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS stage_timings JSONB;
@@ -0,0 +1,17 @@
+-- Content-addressed cache of generated answer keys, shared across documents.
+-- content_hash covers the normalized question, its figure bytes, the model and
+-- the answer-key prompt (see app/services/answer_key_cache.py).
+
+CREATE TABLE IF NOT EXISTS public.answer_key_cache (
+    content_hash TEXT PRIMARY KEY,
+    answer_text TEXT NOT NULL,   -- QuestionAnswer JSON
+    model TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- RLS: server-side only
+ALTER TABLE answer_key_cache ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Service role full access on answer_key_cache"
+    ON answer_key_cache FOR ALL
+    USING (auth.role() = 'service_role');
@@ -4,11 +4,12 @@ CREATE TABLE IF NOT EXISTS api_costs (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id UUID NOT NULL REFERENCES auth.users(id),
     feature TEXT NOT NULL,       -- 'reconstruct', 'answer_key', 'tutor_eval', 'tutor_chat', 'transcribe', 'tts', 'demo'
-    provider TEXT NOT NULL,      -- 'openrouter', 'mathpix_pdf', 'mathpix_strokes', 'elevenlabs', 'groq'
+    provider TEXT NOT NULL,      -- 'openrouter', 'mathpix_pdf', 'mathpix_image', 'mathpix_strokes', 'tectonic', 'elevenlabs', 'groq'
     model TEXT,                  -- e.g. 'google/gemini-3-flash-preview'
     input_tokens INT DEFAULT 0,
     output_tokens INT DEFAULT 0,
     cost_dollars NUMERIC(10,6) NOT NULL DEFAULT 0,
+    latency_ms INT,              -- wall time of the call
     metadata JSONB,              -- document_id, question_number, stage, etc.
     created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
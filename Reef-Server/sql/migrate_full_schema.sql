@@ -76,12 +76,22 @@ CREATE TABLE IF NOT EXISTS public.documents (
     status_message TEXT,
     input_tokens INT DEFAULT 0,
     output_tokens INT DEFAULT 0,
+    cached_tokens INT DEFAULT 0,
     llm_calls INT DEFAULT 0,
     gpu_seconds DOUBLE PRECISION DEFAULT 0,
     pipeline_seconds DOUBLE PRECISION DEFAULT 0,
     cost_cents INT DEFAULT 0,
     question_pages JSONB,
-    question_regions JSONB
+    question_regions JSONB,
+    download_seconds DOUBLE PRECISION DEFAULT 0,
+    ocr_seconds DOUBLE PRECISION DEFAULT 0,
+    figures_seconds DOUBLE PRECISION DEFAULT 0,
+    parse_seconds DOUBLE PRECISION DEFAULT 0,
+    compile_seconds DOUBLE PRECISION DEFAULT 0,
+    merge_seconds DOUBLE PRECISION DEFAULT 0,
+    upload_seconds DOUBLE PRECISION DEFAULT 0,
+    answer_key_seconds DOUBLE PRECISION DEFAULT 0,
+    stage_timings JSONB
 );
 CREATE INDEX IF NOT EXISTS idx_documents_user ON documents (user_id);
 ALTER TABLE documents ENABLE ROW LEVEL SECURITY;
@@ -112,6 +122,19 @@ CREATE POLICY "Users read own answer keys" ON answer_keys FOR SELECT
 CREATE POLICY "Service role full access on answer_keys" ON answer_keys FOR ALL
     USING (auth.role() = 'service_role');
 
+-- ============================================================
+-- ANSWER KEY CACHE (content-addressed, shared across documents)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS public.answer_key_cache (
+    content_hash TEXT PRIMARY KEY,
+    answer_text TEXT NOT NULL,
+    model TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+ALTER TABLE answer_key_cache ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Service role full access on answer_key_cache" ON answer_key_cache FOR ALL
+    USING (auth.role() = 'service_role');
+
 -- ============================================================
 -- CANVAS STROKES
 -- ============================================================
@@ -218,6 +241,7 @@ CREATE TABLE IF NOT EXISTS public.api_costs (
     input_tokens INT NOT NULL DEFAULT 0,
     output_tokens INT NOT NULL DEFAULT 0,
     cost_dollars DOUBLE PRECISION NOT NULL DEFAULT 0,
+    latency_ms INT,
     metadata JSONB,
     created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
@@ -0,0 +1,17 @@
+import httpx
+import pytest
+
+from app.services import http_pool
+
+
+@pytest.fixture
+def mock_http(monkeypatch):
+    """``mock_http(handler)`` points the shared http pool at an ``httpx.MockTransport``.
+
+    The pool's previous client is restored after the test.
+    """
+    def install(handler) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_pool, "_client", client)
+        return client
+    return install
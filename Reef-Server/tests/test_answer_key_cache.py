@@ -0,0 +1,99 @@
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import answer_key_cache
+from app.services.answer_key_cache import question_cache_key
+from app.services.question_index import figure_hashes
+
+MODEL = "test-model"
+
+
+@pytest.fixture
+def table(monkeypatch, mock_http):
+    """Fake ``answer_key_cache`` table; ``fail`` makes every request a 503."""
+    rows: dict[str, dict] = {}
+    state = {"fail": False, "gets": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/rest/v1/answer_key_cache"
+        if state["fail"]:
+            return httpx.Response(503)
+        if request.method == "GET":
+            state["gets"] += 1
+            row = rows.get(request.url.params["content_hash"].removeprefix("eq."))
+            return httpx.Response(200, json=[row] if row else [])
+        body = json.loads(request.content)
+        rows[body["content_hash"]] = {"answer_text": body["answer_text"], "model": body["model"]}
+        return httpx.Response(201)
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(settings, "supabase_service_role_key", "service-key")
+    monkeypatch.setattr(answer_key_cache, "_memory", answer_key_cache.OrderedDict())
+    mock_http(handler)
+    return rows, state
+
+
+def _question(number: int, figure: str, text: str = "Find  $x$ if $2x = 4$.") -> dict:
+    return {
+        "number": number,
+        "text": text,
+        "figures": [figure],
+        "parts": [{"label": "a", "text": "Solve.", "figures": [], "parts": [], "answer_space_cm": 10.0}],
+        "answer_space_cm": 8.0,
+        "figure_storage_urls": {figure: f"https://storage.test/{figure}"},
+    }
+
+
+def test_key_ignores_per_document_fields_and_figure_names():
+    a = question_cache_key(_question(3, "fig-a.png"), figure_hashes({"fig-a.png": b"same image"}), MODEL)
+    b = question_cache_key(
+        _question(7, "fig-b.png", text="Find $x$ if  $2x = 4$. "),
+        figure_hashes({"fig-b.png": b"same image"}),
+        MODEL,
+    )
+    assert a == b
+
+
+def test_key_changes_with_figure_bytes_text_and_model():
+    base = question_cache_key(_question(1, "f.png"), figure_hashes({"f.png": b"one"}), MODEL)
+    assert question_cache_key(_question(1, "f.png"), figure_hashes({"f.png": b"two"}), MODEL) != base
+    assert question_cache_key(_question(1, "f.png", text="Find y."), figure_hashes({"f.png": b"one"}), MODEL) != base
+    assert question_cache_key(_question(1, "f.png"), figure_hashes({"f.png": b"one"}), "other-model") != base
+
+
+@pytest.mark.asyncio
+async def test_lookup_miss_returns_none(table):
+    assert await answer_key_cache.lookup("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_lookup_hits_table_then_memory(table):
+    rows, state = table
+    rows["k1"] = {"answer_text": "x = 2", "model": MODEL}
+
+    expected = {"answer_text": "x = 2", "model": MODEL}
+    assert await answer_key_cache.lookup("k1") == expected
+    assert await answer_key_cache.lookup("k1") == expected
+    assert state["gets"] == 1  # second hit served from memory
+
+
+@pytest.mark.asyncio
+async def test_store_writes_row_and_remembers_it(table):
+    rows, state = table
+    await answer_key_cache.store("k2", "y = 3", MODEL)
+    assert rows["k2"] == {"answer_text": "y = 3", "model": MODEL}
+    assert await answer_key_cache.lookup("k2") == {"answer_text": "y = 3", "model": MODEL}
+    assert state["gets"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_store_and_lookup_do_not_raise(table):
+    rows, state = table
+    state["fail"] = True
+    await answer_key_cache.store("k3", "z = 1", MODEL)  # logged, not raised
+    assert "k3" not in rows
+    answer_key_cache._memory.clear()
+    assert await answer_key_cache.lookup("k3") is None  # failed lookup is a miss
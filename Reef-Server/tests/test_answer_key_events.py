@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.auth import AuthenticatedUser, get_current_user
+from app.config import settings
+from app.main import app
+from app.services import answer_key_events
+from app.services.answer_keys import _next_question
+
+
+@pytest.fixture
+def owners(monkeypatch, mock_http):
+    """Fake ``documents`` table: ``{document_id: user_id}``."""
+    owned: dict[str, str] = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/rest/v1/documents"
+        doc = request.url.params["id"].removeprefix("eq.")
+        user = request.url.params["user_id"].removeprefix("eq.")
+        return httpx.Response(200, json=[{"id": doc}] if owned.get(doc) == user else [])
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    mock_http(handler)
+    return owned
+
+
+def test_next_question_is_focus_first():
+    remaining = [1, 2, 3, 4, 5]
+    assert _next_question(remaining, None) == 1
+    order = []
+    while remaining:
+        q = _next_question(remaining, 3)
+        remaining.remove(q)
+        order.append(q)
+    assert order == [3, 4, 5, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_subscriber_gets_snapshot_then_live_events():
+    answer_key_events.start("doc-events", [1, 2])
+    answer_key_events.publish("doc-events", 1, answer_key_events.READY)
+
+    received = []
+
+    async def consume():
+        async for event, data in answer_key_events.subscribe("doc-events"):
+            received.append((event, data))
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0)
+    answer_key_events.publish("doc-events", 2, answer_key_events.FAILED)
+    answer_key_events.finish("doc-events")
+    await asyncio.wait_for(consumer, 1)
+
+    assert received[0] == (
+        "snapshot",
+        {"questions": {"1": "ready", "2": "queued"}, "focus": None, "finished": False},
+    )
+    assert received[1] == ("question", {"question_number": 2, "status": "failed"})
+    assert received[2] == ("done", {"ready": 1, "failed": 1})
+
+
+@pytest.mark.asyncio
+async def test_events_endpoint_replays_finished_document(owners):
+    owners["doc-sse"] = "user-1"
+    answer_key_events.start("doc-sse", [1])
+    answer_key_events.publish("doc-sse", 1, answer_key_events.READY)
+    answer_key_events.finish("doc-sse")
+
+    app.dependency_overrides[get_current_user] = lambda: AuthenticatedUser(sub="user-1")
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/ai/answer-keys/doc-sse/events")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        "event: snapshot\n"
+        'data: {"questions": {"1": "ready"}, "focus": null, "finished": true}\n\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_focus_requires_existing_channel(owners):
+    owners.update({"doc-unknown": "user-1", "doc-focus": "user-1"})
+    app.dependency_overrides[get_current_user] = lambda: AuthenticatedUser(sub="user-1")
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            missing = await client.post("/ai/answer-keys/doc-unknown/focus", json={"question_number": 2})
+            answer_key_events.start("doc-focus", [1, 2])
+            found = await client.post("/ai/answer-keys/doc-focus/focus", json={"question_number": 2})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert missing.status_code == 404
+    assert "doc-unknown" not in answer_key_events._channels
+    assert found.status_code == 200 and answer_key_events.get_focus("doc-focus") == 2
+    answer_key_events.finish("doc-focus")
+
+
+@pytest.mark.asyncio
+async def test_other_users_document_is_not_found(owners):
+    owners["doc-private"] = "user-2"
+    answer_key_events.start("doc-private", [1])
+    app.dependency_overrides[get_current_user] = lambda: AuthenticatedUser(sub="user-1")
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            events = await client.get("/ai/answer-keys/doc-private/events")
+            focus = await client.post("/ai/answer-keys/doc-private/focus", json={"question_number": 1})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert events.status_code == 404 and focus.status_code == 404
+    assert answer_key_events.get_focus("doc-private") is None
+    answer_key_events.finish("doc-private")
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.answer_keys import AnswerKeyWriter, _answer_key_row
+
+
+def _row(q: int) -> dict:
+    return _answer_key_row("doc-1", q, {"number": q}, "{}", "test-model", 10, 20)
+
+
+@pytest.fixture
+def posts(monkeypatch, mock_http):
+    requests: list[list[dict]] = []
+    reject = set()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        rows = json.loads(request.content)
+        requests.append(rows)
+        assert request.url.params["on_conflict"] == "document_id,question_number"
+        if any(r["question_number"] in reject for r in rows):
+            return httpx.Response(400, json={"message": "bad row"})
+        return httpx.Response(201)
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(settings, "supabase_service_role_key", "service-key")
+    mock_http(handler)
+    return requests, reject
+
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_is_full(posts):
+    requests, _ = posts
+    writer = AnswerKeyWriter(batch_size=3, flush_seconds=60)
+    for q in range(1, 8):
+        await writer.add(_row(q))
+    await writer.close()
+
+    assert [[r["question_number"] for r in batch] for batch in requests] == [[1, 2, 3], [4, 5, 6], [7]]
+    assert writer.written == 7
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_delay(posts):
+    requests, _ = posts
+    writer = AnswerKeyWriter(batch_size=10, flush_seconds=0.05)
+    await writer.add(_row(1))
+    await writer.add(_row(2))
+    assert requests == []
+    await asyncio.sleep(0.1)
+    assert len(requests) == 1 and len(requests[0]) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_per_row(posts):
+    requests, reject = posts
+    reject.add(2)
+    writer = AnswerKeyWriter(batch_size=3, flush_seconds=60)
+    for q in (1, 2, 3):
+        await writer.add(_row(q))
+
+    assert len(requests) == 4  # batch + one retry per row
+    assert writer.written == 2
+    assert writer.failed == 1
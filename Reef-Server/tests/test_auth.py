@@ -0,0 +1,121 @@
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+
+from app import auth
+from app.config import settings
+
+
+def _jwk(private_key, kid: str) -> dict:
+    data = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key()))
+    return {**data, "kid": kid, "alg": "ES256", "use": "sig"}
+
+
+@pytest.fixture
+def keys(monkeypatch, mock_http):
+    """A JWKS endpoint serving whatever keys are in ``published``."""
+    published: list[dict] = []
+    fetches: list[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/auth/v1/.well-known/jwks.json"
+        fetches.append(time.monotonic())
+        return httpx.Response(200, json={"keys": published})
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(auth, "_signing_keys", {})
+    monkeypatch.setattr(auth, "_jwks_fetched_at", None)
+    monkeypatch.setattr(auth, "_jwks_lock", None)
+    monkeypatch.setattr(auth, "_verified", auth.OrderedDict())
+    mock_http(handler)
+    return published, fetches
+
+
+def _token(private_key, kid: str, exp_in: float = 3600, sub: str = "user-1") -> str:
+    return jwt.encode(
+        {"sub": sub, "aud": "authenticated", "role": "authenticated", "exp": int(time.time() + exp_in)},
+        private_key,
+        algorithm="ES256",
+        headers={"kid": kid},
+    )
+
+
+@pytest.mark.asyncio
+async def test_verified_tokens_are_cached(keys, monkeypatch):
+    published, fetches = keys
+    key = ec.generate_private_key(ec.SECP256R1())
+    published.append(_jwk(key, "k1"))
+    token = _token(key, "k1")
+
+    decodes = []
+    real_decode = jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **kw: decodes.append(1) or real_decode(*a, **kw))
+
+    first = await auth.verify_token(token)
+    second = await auth.verify_token(token)
+    assert first.id == second.id == "user-1"
+    assert len(decodes) == 1
+    assert len(fetches) == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_entry_is_dropped_at_exp(keys):
+    published, _ = keys
+    key = ec.generate_private_key(ec.SECP256R1())
+    published.append(_jwk(key, "k1"))
+    token = _token(key, "k1")
+    await auth.verify_token(token)
+
+    digest = next(iter(auth._verified))
+    auth._verified[digest] = (time.time() - 1, auth._verified[digest][1])
+    assert auth._cached_user(digest) is None
+    assert digest not in auth._verified
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded(keys, monkeypatch):
+    published, _ = keys
+    monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 3)
+    key = ec.generate_private_key(ec.SECP256R1())
+    published.append(_jwk(key, "k1"))
+    for i in range(5):
+        await auth.verify_token(_token(key, "k1", sub=f"user-{i}"))
+    assert len(auth._verified) == 3
+
+
+@pytest.mark.asyncio
+async def test_key_rotation_refetches_jwks_once(keys):
+    published, fetches = keys
+    old, new = ec.generate_private_key(ec.SECP256R1()), ec.generate_private_key(ec.SECP256R1())
+    published.append(_jwk(old, "old"))
+    await auth.verify_token(_token(old, "old"))
+
+    published.append(_jwk(new, "new"))
+    auth._jwks_fetched_at -= auth.JWKS_MIN_REFETCH_SECONDS
+    user = await auth.verify_token(_token(new, "new", sub="user-2"))
+    assert user.id == "user-2"
+    assert len(fetches) == 2
+
+    # Unknown kids don't hammer the JWKS endpoint
+    with pytest.raises(HTTPException) as exc:
+        await auth.verify_token(_token(new, "bogus"))
+    assert exc.value.status_code == 401
+    assert len(fetches) == 2
+
+
+@pytest.mark.asyncio
+async def test_expired_and_forged_tokens_are_rejected(keys):
+    published, _ = keys
+    key, attacker = ec.generate_private_key(ec.SECP256R1()), ec.generate_private_key(ec.SECP256R1())
+    published.append(_jwk(key, "k1"))
+
+    with pytest.raises(HTTPException, match="expired"):
+        await auth.verify_token(_token(key, "k1", exp_in=-10))
+    with pytest.raises(HTTPException):
+        await auth.verify_token(_token(attacker, "k1"))
+    assert not auth._verified
@@ -1,7 +1,9 @@
+import random
+
 import pytest
 from app.services.chunk_manager import (
     _stroke_bbox, _should_join, _cluster_strokes, _fingerprint_strokes,
-    transcribe_with_chunks,
+    transcribe_with_chunks, StrokeClusterer, _bboxes_join, latest_chunks,
 )
 
 
@@ -185,3 +187,82 @@ class TestTranscribeWithChunks:
         strokes2 = strokes + [_make_stroke((10, 30), (300, 310))]
         _, chunks2 = await transcribe_with_chunks(strokes2, "u", "d", "Q1a", chunks1, mock_transcribe)
         assert call_count == 1  # only the new cluster transcribed
+
+    @pytest.mark.asyncio
+    async def test_failed_chunk_is_retried_next_call(self):
+        calls = []
+        async def flaky_transcribe(strokes):
+            calls.append(strokes)
+            if len(calls) == 1:
+                raise RuntimeError("mathpix 503")
+            return "x^2"
+
+        strokes = [_make_stroke((10, 30), (100, 110))]
+        latex1, chunks1 = await transcribe_with_chunks(strokes, "u", "d", "Q1a", None, flaky_transcribe)
+        assert latex1 == ""
+        assert chunks1[0]["latex"] is None
+
+        latex2, _ = await transcribe_with_chunks(strokes, "u", "d", "Q1a", chunks1, flaky_transcribe)
+        assert latex2 == "x^2"
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_latest_chunks_are_kept_per_canvas(self):
+        async def mock_transcribe(strokes):
+            return "y"
+
+        strokes = [_make_stroke((10, 30), (100, 110))]
+        _, chunks = await transcribe_with_chunks(strokes, "u", "d-latest", "Q1a", None, mock_transcribe)
+        assert latest_chunks(("u", "d-latest", "Q1a")) == chunks
+        assert latest_chunks(("u", "d-latest", "Q1b")) is None
+
+
+class TestStrokeClusterer:
+    def test_remove_bridge_splits_cluster(self):
+        clusterer = StrokeClusterer()
+        clusterer.add("left", (10, 100, 30, 110))
+        clusterer.add("right", (70, 100, 90, 110))
+        clusterer.add("bridge", (35, 100, 65, 110))
+        assert len(clusterer.clusters()) == 1
+
+        clusterer.remove("bridge")
+        assert [sorted(keys) for keys, _ in clusterer.clusters()] == [["left"], ["right"]]
+
+    def test_grid_matches_pairwise_clustering(self):
+        rng = random.Random(7)
+        strokes = []
+        for _ in range(300):
+            x, y = rng.uniform(0, 800), rng.choice(range(0, 2000, 60)) + rng.uniform(-5, 5)
+            strokes.append(_make_stroke((x, x + rng.uniform(5, 40)), (y, y + rng.uniform(5, 30))))
+
+        def pairwise(strokes):
+            clusters = []
+            for i, s in enumerate(strokes):
+                keys, bbox = [i], _stroke_bbox(s)
+                while joined := [c for c in clusters if _bboxes_join(bbox, c[1])]:
+                    for c in joined:
+                        clusters.remove(c)
+                        keys += c[0]
+                        bbox = (min(bbox[0], c[1][0]), min(bbox[1], c[1][1]),
+                                max(bbox[2], c[1][2]), max(bbox[3], c[1][3]))
+                clusters.append((keys, bbox))
+            return sorted(sorted(k) for k, _ in clusters)
+
+        assert sorted(c.stroke_indices for c in _cluster_strokes(strokes)) == pairwise(strokes)
+
+    @pytest.mark.asyncio
+    async def test_canvas_clusterer_is_updated_incrementally(self, monkeypatch):
+        async def mock(strokes): return "x"
+        inserts = 0
+        real_add = StrokeClusterer.add
+        def counting_add(self, key, bbox):
+            nonlocal inserts
+            inserts += 1
+            real_add(self, key, bbox)
+        monkeypatch.setattr(StrokeClusterer, "add", counting_add)
+
+        strokes = [_make_stroke((10 + 40 * i, 30 + 40 * i), (100, 110)) for i in range(20)]
+        await transcribe_with_chunks(strokes, "u", "d", "incremental", None, mock)
+        assert inserts == 20
+        await transcribe_with_chunks(strokes + [_make_stroke((10, 30), (300, 310))], "u", "d", "incremental", None, mock)
+        assert inserts == 21
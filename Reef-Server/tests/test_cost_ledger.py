@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import cost_ledger
+
+
+@pytest.fixture
+def posts(monkeypatch, mock_http):
+    requests: list[list[dict]] = []
+    fail = [False]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/rest/v1/api_costs"
+        if fail[0]:
+            return httpx.Response(503)
+        rows = json.loads(request.content)
+        if any(row["user_id"] == "deleted-user" for row in rows):
+            return httpx.Response(409, json={"code": "23503", "message": "foreign key violation"})
+        requests.append(rows)
+        return httpx.Response(201)
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(settings, "supabase_service_role_key", "service-key")
+    monkeypatch.setattr(cost_ledger, "_buffer", cost_ledger.deque(maxlen=cost_ledger.MAX_BUFFERED))
+    mock_http(handler)
+    return requests, fail
+
+
+def _in_context(fn, *args, **kwargs):
+    """Run ``fn`` in a fresh context so ``set_context`` doesn't leak between tests."""
+    return contextvars.copy_context().run(fn, *args, **kwargs)
+
+
+def test_calls_outside_a_user_context_are_not_recorded(posts):
+    _in_context(cost_ledger.record, "openrouter", model="m")
+    assert not cost_ledger._buffer
+
+
+@pytest.mark.asyncio
+async def test_rows_carry_context_and_flush_in_batches(posts, monkeypatch):
+    requests, _ = posts
+    monkeypatch.setattr(cost_ledger, "MAX_BATCH", 2)
+
+    def calls():
+        cost_ledger.set_context("user-1", "reconstruct", document_id="doc-1")
+        cost_ledger.record(
+            "openrouter", model="google/gemini-2.5-flash", input_tokens=1000,
+            output_tokens=500, cost_dollars=cost_ledger.llm_cost_dollars("google/gemini-2.5-flash", 1000, 500),
+            latency_ms=812.4, cached_tokens=200,
+        )
+        cost_ledger.record("tectonic", latency_ms=95.0, outcome="ok")
+        cost_ledger.record("mathpix_pdf", cost_dollars=0.01, pages=2)
+
+    _in_context(calls)
+    await cost_ledger.flush()
+
+    assert [len(batch) for batch in requests] == [2, 1]
+    llm = requests[0][0]
+    assert llm["user_id"] == "user-1"
+    assert llm["feature"] == "reconstruct"
+    assert llm["cost_dollars"] == pytest.approx(0.00045)
+    assert llm["latency_ms"] == 812
+    assert llm["metadata"] == {"document_id": "doc-1", "cached_tokens": 200}
+    assert requests[1][0]["metadata"]["pages"] == 2
+    assert not cost_ledger._buffer
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_for_the_next_tick(posts):
+    requests, fail = posts
+
+    def calls():
+        cost_ledger.set_context("user-1", "answer_key")
+        for i in range(3):
+            cost_ledger.record("openrouter", model="m", input_tokens=i)
+
+    _in_context(calls)
+    fail[0] = True
+    await cost_ledger.flush()
+    assert len(cost_ledger._buffer) == 3
+
+    fail[0] = False
+    await cost_ledger.flush()
+    assert [r["input_tokens"] for r in requests[0]] == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_are_dropped_without_blocking_the_rest(posts):
+    requests, _ = posts
+
+    def calls(user_id: str, tokens: int):
+        cost_ledger.set_context(user_id, "answer_key")
+        cost_ledger.record("openrouter", model="m", input_tokens=tokens)
+
+    for user_id, tokens in (("user-1", 0), ("deleted-user", 1), ("user-1", 2)):
+        _in_context(calls, user_id, tokens)
+    await cost_ledger.flush()
+
+    assert [[r["input_tokens"] for r in rows] for rows in requests] == [[0], [2]]
+    assert not cost_ledger._buffer
+
+
+def test_requeue_into_a_full_buffer_drops_the_oldest_rows(monkeypatch):
+    monkeypatch.setattr(cost_ledger, "_buffer", cost_ledger.deque([{"n": 3}, {"n": 4}], maxlen=3))
+    cost_ledger._requeue([{"n": 0}, {"n": 1}, {"n": 2}])
+    assert [r["n"] for r in cost_ledger._buffer] == [2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_records_from_worker_threads_keep_the_callers_context(posts):
+    requests, _ = posts
+
+    async def task():
+        cost_ledger.set_context("user-2", "reconstruct")
+        await asyncio.to_thread(cost_ledger.record, "tectonic", latency_ms=10)
+
+    await asyncio.create_task(task())
+    await cost_ledger.flush()
+    assert requests[0][0]["user_id"] == "user-2"
@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.routers import health
 
 client = TestClient(app)
 
@@ -11,3 +12,10 @@ def test_health():
     data = response.json()
     assert data["status"] == "ok"
     assert data["service"] == "reef-server"
+
+
+def test_health_reports_failed_compiler_as_degraded(monkeypatch):
+    monkeypatch.setattr(health, "compiler_health", lambda: {"status": "failed", "error": "tectonic not found"})
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"
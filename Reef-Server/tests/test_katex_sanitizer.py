@@ -0,0 +1,85 @@
+import pytest
+
+from app.services.katex_sanitizer import sanitize_for_katex
+
+# Outputs of the previous sanitizer (one re.sub per rule), which the
+# single-pass rewrite must reproduce
+GOLDEN = [
+    ("x^{2}+2 x+1=0", "x^{2}+2 x+1=0"),
+    (r"\frac{d}{d x}\left(x^{2}\right)=2 x", r"\frac{d}{d x}\left(x^{2}\right)=2 x"),
+    (r"\int_{0}^{1} x^{2} d x=\frac{1}{3}", r"\int_{0}^{1} x^{2} d x=\frac{1}{3}"),
+    (r"\sum\limits_{n=1}^{\infty} \frac{1}{n^{2}}=\frac{\pi^{2}}{6}", r"\sum_{n=1}^{\infty} \frac{1}{n^{2}}=\frac{\pi^{2}}{6}"),
+    (r"\prod\limits_{i=1}^{n} a_{i} \quad \int\limits_{a}^{b} f", r"\prod_{i=1}^{n} a_{i} \quad \int_{a}^{b} f"),
+    (r"\displaystyle \lim _{x \rightarrow 0} \frac{\sin x}{x}=1", r"\lim _{x \rightarrow 0} \frac{\sin x}{x}=1"),
+    ('  \\displaystyle\n x+y  ', "x+y"),
+    (r"x \displaystyle y", r"x \displaystyle y"),
+    (r"\begin{aligned} x &=1 \\ y &=2 \tag{1} \end{aligned}", r"\begin{aligned} x &=1 \\ y &=2  \end{aligned}"),
+    (r"E=m c^{2} \tag{3.1}", "E=m c^{2}"),
+    (r"\newcommand{\vect}{\mathbf} \vect{v}", r"\vect{v}"),
+    (r"a \hspace{1cm} b", r"a \kern{1cm} b"),
+    (r"\mathrlap{x} \mathllap{y} \mathclap{z}", "x y z"),
+    (r"\left( x+\left[ y \right) ", "( x+[ y )"),
+    (r"\left. \frac{d f}{d x} \right|_{x=0}", r"\left. \frac{d f}{d x} \right|_{x=0}"),
+    (r"\left\{ x \right\}", r"\left\{ x \right\}"),
+    (r"\left( a \right) \left[ b", "( a ) [ b"),
+    (r"\leftarrow \rightarrow \left| x \right|", r"\leftarrow \rightarrow \left| x \right|"),
+    (r"\ce{H2O} + \ce{NaCl}", r"\text{H2O} + \text{NaCl}"),
+    (r"\bcancel{x} \xcancel{y} \cancel{z}", r"\cancel{x} \cancel{y} \cancel{z}"),
+    (r"\mbox{if } x>0", r"\text{if } x>0"),
+    (r"\textrm{for all} \textsl{x} \textsc{y} \textup{z}", r"\text{for all} \text{x} \text{y} \text{z}"),
+    (r"\ensuremath{x^2}", "x^2"),
+    (r"\rm{d} x \quad {\rm e}^{x} \quad \rm x", r"\mathrm{d} x \quad { e}^{x} \quad  x"),
+    (r"\rm_1 \rm2 \rm", r"\rm_1 \rm2"),
+    (r"\boldmath x \unboldmath", "x"),
+    (r"\vcenter{x}", "x"),
+    (r"\scalebox{0.5}{x} \resizebox{1cm}{!}{y} \adjustbox{max width=1cm}{z}", "x y z"),
+    (r"\intertext{and} y", r"\text{and} y"),
+    ('\\begin{tikzpicture}\n\\draw (0,0) -- (1,1);\n\\end{tikzpicture} after', "[diagram] after"),
+    (r"\begin{pgfpicture}x\end{pgfpicture}", "[diagram]"),
+    (r"\includegraphics[width=2cm]{fig.png} and \includegraphics{a.pdf}", "[image] and [image]"),
+    (r"\href{http://x.org}{link} \url{http://y.org}", r"link \text{http://y.org}"),
+    (r"\\tag{1} \\left( x", r"\ \( x"),
+    (r"\text{hello} \mathrm{d} x", r"\text{hello} \mathrm{d} x"),
+    (r"\mbox{a", r"\mbox{a"),
+    (r"\hspace*{1cm}", r"\hspace*{1cm}"),
+    ("", ""),
+    ('   \n  ', ""),
+    (r"y=\left\{\begin{array}{ll}x & x \geq 0 \\ -x & x<0\end{array}\right.", r"y=\left\{\begin{array}{ll}x & x \geq 0 \\ -x & x<0\end{array}."),
+    (r"\begin{array}{c}\mbox{first} \\ \mbox{second}\end{array}", r"\begin{array}{c}\text{first} \\ \text{second}\end{array}"),
+    (r"\mathbf{F}=m \mathbf{a} \quad \vec{v}=\frac{d \vec{x}}{d t}", r"\mathbf{F}=m \mathbf{a} \quad \vec{v}=\frac{d \vec{x}}{d t}"),
+    (r"\sqrt{b^{2}-4 a c} \rm \, \mathrm{m/s}", r"\sqrt{b^{2}-4 a c}  \, \mathrm{m/s}"),
+    (r"f(x)=\left\{\begin{array}{ll} \mbox{x} & \left( 1 \right) \end{array}\right.", r"f(x)=\left\{\begin{array}{ll} \text{x} & ( 1 ) \end{array}."),
+    (r"\sum_{k} \bigcup\limits_{i} A_i \bigoplus\limits_{j} \coprod\limits \bigcap\limits \bigotimes\limits", r"\sum_{k} \bigcup_{i} A_i \bigoplus_{j} \coprod \bigcap \bigotimes"),
+    (r"\tag{a}\displaystyle x", "x"),
+    (r"\unboldmath{x}", "{x}"),
+    (r"\mbox{a}\ce{b}\url{c}", r"\text{a}\text{b}\text{c}"),
+]
+
+
+@pytest.mark.parametrize(("latex", "expected"), GOLDEN)
+def test_matches_golden_output(latex, expected):
+    assert sanitize_for_katex(latex) == expected
+
+
+@pytest.mark.parametrize(("latex", "expected"), [
+    (r"\ensuremath{\frac{a}{b}}", r"\frac{a}{b}"),
+    (r"\tag{\text{1}} x", "x"),
+    (r"\def\R{\mathbb{R}} x", "x"),
+    (r"\scalebox{0.5}{\frac{a}{b}}", r"\frac{a}{b}"),
+    (r"\href{http://x.org}{\textbf{link}}", r"\textbf{link}"),
+    (r"\mbox{a \ensuremath{x^{2}} b}", r"\text{a x^{2} b}"),
+])
+def test_nested_braces_are_kept(latex, expected):
+    assert sanitize_for_katex(latex) == expected
+
+
+def test_unbalanced_argument_ends_at_first_closing_brace():
+    assert sanitize_for_katex(r"\ensuremath{a{b} c") == "a{b c"
+
+
+def test_large_deeply_nested_input():
+    latex = r"\mbox{" * 500 + "x" + "}" * 500
+    assert sanitize_for_katex(latex).count(r"\text{") == 64
+    page = r"\sum\limits_{i=1}^{n} \mbox{if } \left( x_{i} \right) \\ " * 150
+    out = sanitize_for_katex(page)
+    assert r"\limits" not in out and r"\mbox" not in out
@@ -0,0 +1,81 @@
+import subprocess
+
+import pytest
+
+from app.services import latex_compiler
+from app.services.latex_compiler import LaTeXCompiler
+
+
+@pytest.fixture
+def tectonic(monkeypatch):
+    """Fake tectonic: records every invocation, writes a stub PDF for compiles."""
+    calls: list[list[str]] = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        if cmd[1] == "--version":
+            return subprocess.CompletedProcess(cmd, 0, stdout="Tectonic 0.15.0\n", stderr="")
+        outdir = cmd[cmd.index("--outdir") + 1]
+        with open(f"{outdir}/question.pdf", "wb") as f:
+            f.write(b"%PDF-1.7 stub")
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+    monkeypatch.setattr(latex_compiler.subprocess, "run", fake_run)
+    monkeypatch.setattr(latex_compiler, "_compiler", None)
+    return calls
+
+
+def test_construction_runs_nothing(tectonic):
+    LaTeXCompiler()
+    assert tectonic == []
+
+
+def test_validate_checks_and_warms_once(tectonic):
+    compiler = latex_compiler.get_compiler()
+    compiler.validate()
+    compiler.validate()
+    assert len(tectonic) == 2
+    assert tectonic[0][1] == "--version"
+    assert tectonic[1][1].endswith("question.tex")
+    assert latex_compiler.get_compiler() is compiler
+    health = latex_compiler.compiler_health()
+    assert health["status"] == "ok"
+    assert health["version"] == "Tectonic 0.15.0"
+
+
+def test_missing_tectonic_is_reported_and_reraised(monkeypatch):
+    def missing(cmd, **kwargs):
+        raise FileNotFoundError(cmd[0])
+
+    monkeypatch.setattr(latex_compiler.subprocess, "run", missing)
+    monkeypatch.setattr(latex_compiler, "_compiler", None)
+    compiler = latex_compiler.get_compiler()
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="tectonic not found"):
+            compiler.validate()
+    health = latex_compiler.compiler_health()
+    assert health["status"] == "failed" and health["failures"] == 1  # second call within backoff
+
+
+def test_failed_validation_is_retried_after_backoff(tectonic, monkeypatch):
+    real_run = latex_compiler.subprocess.run
+    outage = {"left": 1}
+
+    def flaky(cmd, **kwargs):
+        if outage["left"] and cmd[1] != "--version":
+            outage["left"] -= 1
+            raise subprocess.TimeoutExpired(cmd, 120)
+        return real_run(cmd, **kwargs)
+
+    monkeypatch.setattr(latex_compiler.subprocess, "run", flaky)
+    compiler = latex_compiler.get_compiler()
+    with pytest.raises(RuntimeError):
+        compiler.validate()
+    with pytest.raises(RuntimeError):
+        compiler.validate()  # within the backoff: not retried
+    assert len(tectonic) == 1
+
+    compiler.retry_at = 0.0  # backoff elapsed
+    compiler.validate()
+    health = latex_compiler.compiler_health()
+    assert health["status"] == "ok" and health["error"] is None and health["failures"] == 0
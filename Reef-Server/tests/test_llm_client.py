@@ -0,0 +1,17 @@
+from app.models.answer_key import QuestionAnswer
+from app.services.llm_client import _strict_schema, json_schema, schema_instruction
+
+
+def test_json_schema_and_strict_schema_are_built_once():
+    schema = json_schema(QuestionAnswer)
+    assert json_schema(QuestionAnswer) is schema
+    strict = _strict_schema(schema)
+    assert _strict_schema(schema) is strict
+    assert strict["additionalProperties"] is False
+    assert "additionalProperties" not in schema  # source left untouched
+
+
+def test_schema_instruction_is_stable():
+    text = schema_instruction(QuestionAnswer)
+    assert text is schema_instruction(QuestionAnswer)
+    assert '"question_number"' in text
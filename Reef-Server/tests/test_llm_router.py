@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.services import llm_router
+from app.services.llm_client import LLMClient, LLMResult
+from app.services.llm_router import LLMRouter, get_stats
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """Per-model behaviour: a latency in seconds, or an exception to raise."""
+    behaviour: dict[str, object] = {}
+    calls: list[str] = []
+    cancelled: list[str] = []
+
+    async def fake_generate(self, prompt, **kwargs):
+        calls.append(self.model)
+        outcome = behaviour[self.model]
+        if isinstance(outcome, Exception):
+            raise outcome
+        try:
+            await asyncio.sleep(outcome)
+        except asyncio.CancelledError:
+            cancelled.append(self.model)
+            raise
+        return LLMResult(content=f"from {self.model}")
+
+    monkeypatch.setattr(LLMClient, "generate", fake_generate)
+    monkeypatch.setattr(llm_router, "_stats", {})
+    return behaviour, calls, cancelled
+
+
+def _router(route: str) -> LLMRouter:
+    return LLMRouter(route, ["primary", "secondary"], api_key="test")
+
+
+@pytest.mark.asyncio
+async def test_fails_over_to_next_model(fake_models):
+    behaviour, calls, _ = fake_models
+    behaviour.update(primary=RuntimeError("boom"), secondary=0)
+
+    result = await _router("failover").generate("hi")
+    assert result.model == "secondary"
+    assert calls == ["primary", "secondary"]
+    assert get_stats("failover", "primary").error_rate > 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_response_counts_as_failure(fake_models):
+    behaviour, _, _ = fake_models
+    behaviour.update(primary=0, secondary=0)
+
+    result = await _router("validate").generate(
+        "hi", validate=lambda r: r.content == "from secondary",
+    )
+    assert result.model == "secondary"
+
+
+@pytest.mark.asyncio
+async def test_hedges_after_learned_p95_and_cancels_loser(fake_models):
+    behaviour, calls, cancelled = fake_models
+    stats = get_stats("hedge", "primary")
+    for _ in range(llm_router.MIN_SAMPLES):
+        stats.record(0.01, ok=True)
+    behaviour.update(primary=1.0, secondary=0.01)
+
+    result = await asyncio.wait_for(_router("hedge").generate("hi"), 0.5)
+    assert result.model == "secondary"
+    assert calls == ["primary", "secondary"]
+    await asyncio.sleep(0)
+    assert cancelled == ["primary"]
+    # The cancelled call is kept as a lower bound past the old p95
+    assert len(stats.latencies) == llm_router.MIN_SAMPLES + 1
+    assert max(stats.latencies) >= 0.01
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_model_is_tried_last(fake_models):
+    behaviour, calls, _ = fake_models
+    behaviour.update(primary=0, secondary=0)
+    stats = get_stats("health", "primary")
+    for _ in range(10):
+        stats.record(None, ok=False)
+
+    result = await _router("health").generate("hi")
+    assert result.model == "secondary"
+    assert calls == ["secondary"]
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_model_recovers_as_errors_decay(fake_models):
+    behaviour, calls, _ = fake_models
+    behaviour.update(primary=0, secondary=0)
+    stats = get_stats("recover", "primary")
+    for _ in range(10):
+        stats.record(None, ok=False)
+    assert not stats.healthy
+
+    stats.updated_at -= 2 * llm_router.ERROR_HALF_LIFE_SECONDS  # idle through the outage
+    assert stats.healthy
+    result = await _router("recover").generate("hi")
+    assert result.model == "primary"
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.services.memory_budget import MB, JobMemory, MemoryBudget
+
+
+def test_job_tracks_current_and_peak_by_buffer():
+    job = JobMemory("d1")
+    job.hold("figures", 10 * MB)
+    job.hold("figures_base64", 14 * MB)
+    job.release("figures_base64")
+    job.hold("question_pdfs", 3 * MB)
+
+    assert job.current == 13 * MB
+    assert job.peak == 24 * MB
+    summary = job.summary()
+    assert summary["peak_mb"] == 24.0
+    assert summary["peak_by_buffer_mb"]["figures_base64"] == 14.0
+
+
+@pytest.mark.asyncio
+async def test_jobs_over_budget_wait_in_order():
+    budget = MemoryBudget(budget=250 * MB, default_estimate=100 * MB)
+    first, second, third = JobMemory("a"), JobMemory("b"), JobMemory("c")
+    await budget.acquire(first)
+    await budget.acquire(second)
+    assert budget.would_defer()
+
+    admitted: list[str] = []
+
+    async def _run(job):
+        await budget.acquire(job)
+        admitted.append(job.document_id)
+
+    waiter = asyncio.create_task(_run(third))
+    await asyncio.sleep(0)
+    assert budget.waiting == 1 and not admitted
+
+    await budget.release(first)
+    await waiter
+    assert admitted == ["c"]
+    assert budget.reserved == 200 * MB
+
+
+@pytest.mark.asyncio
+async def test_lone_oversized_job_is_admitted_and_grows_reservation():
+    budget = MemoryBudget(budget=50 * MB, default_estimate=100 * MB)
+    job = JobMemory("big")
+    await budget.acquire(job)
+    job.hold("figures", 150 * MB)
+    assert budget.reserved == 150 * MB
+
+    await budget.release(job)
+    assert budget.reserved == 0
+    # Measured peaks raise the projection for later jobs
+    assert budget.projected() == 150 * MB
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    budget = MemoryBudget(budget=100 * MB, default_estimate=100 * MB)
+    running, queued = JobMemory("a"), JobMemory("b")
+    await budget.acquire(running)
+    waiter = asyncio.create_task(budget.acquire(queued))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert budget.waiting == 0
+    assert queued.reserved == 0
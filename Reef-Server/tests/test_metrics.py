@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import metrics
+from app.services.metrics import Counter, Gauge, Histogram, render
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry, so test metrics don't show up in the app's /metrics."""
+    fresh: list = []
+    monkeypatch.setattr(metrics, "_registry", fresh)
+    return fresh
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    h = Histogram("test_latency_seconds", "Test histogram.", ("route",), buckets=(0.1, 1))
+    h.labels("/a").observe(0.05)
+    h.labels("/a").observe(0.5)
+    h.labels("/a").observe(5)
+
+    text = render()
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="/a"} 3' in text
+
+
+def test_counter_sums_across_threads(registry):
+    import threading
+
+    c = Counter("test_events_total", "Test counter.")
+    threads = [threading.Thread(target=lambda: [c.inc() for _ in range(1000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    c.inc()
+    assert c.labels().value == 4001
+
+
+def test_gauge_with_failing_callback_is_left_out(registry):
+    def unavailable() -> float:
+        raise AttributeError("_work_queue")
+
+    Gauge("test_broken_gauge", "Test gauge.", unavailable)
+    Gauge("test_gauge", "Test gauge.", lambda: 3)
+    text = render()
+    assert "test_gauge 3" in text
+    assert not any(line.startswith("test_broken_gauge ") for line in text.splitlines())
+
+
+def test_metrics_endpoint_records_requests():
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE reef_http_request_duration_seconds histogram" in body
+    assert 'route="/health",method="GET",status="200"' in body
+    assert "reef_documents_in_flight 0" in body
+    assert "test_latency_seconds" not in body
@@ -0,0 +1,69 @@
+from app.models import Part, Question, QuestionBatch
+from app.services.mmd_chunker import merge_batches, split_mmd
+from app.services.token_estimator import estimate_tokens
+
+
+def _problem(n: int, words: int = 60) -> str:
+    body = " ".join(f"word{n}x{i}" for i in range(words))
+    return f"{n}. Compute $\\int_0^{n} x^2 \\, dx$ and {body}.\n\n"
+
+
+def test_estimate_tokens_counts_symbols_separately():
+    assert estimate_tokens("hello world") == 4
+    # every backslash, brace and caret is its own token
+    assert estimate_tokens(r"\frac{a}{b}^2") > len(r"\frac{a}{b}^2") // 4
+
+
+def test_small_document_is_one_chunk():
+    mmd = "Course header\n\n" + _problem(1) + _problem(2)
+    assert split_mmd(mmd, max_tokens=10_000) == [mmd]
+
+
+def test_chunks_cut_only_at_problem_boundaries_and_fit_budget():
+    mmd = "Homework 3\n\n" + "".join(_problem(n) for n in range(1, 21))
+    budget = estimate_tokens(_problem(1)) * 4
+    chunks = split_mmd(mmd, max_tokens=budget)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk) <= budget
+    for chunk in chunks[1:]:
+        first_line = chunk.splitlines()[0]
+        assert first_line.split(".")[0].isdigit()
+    # every problem appears, each chunk after the first repeats one segment
+    for n in range(1, 21):
+        assert any(f"\n{n}. Compute" in "\n" + c for c in chunks)
+
+
+def test_oversized_problem_stays_whole():
+    mmd = _problem(1, words=10) + _problem(2, words=2000) + _problem(3, words=10)
+    chunks = split_mmd(mmd, max_tokens=500)
+    assert any(chunk.startswith("2. Compute") and chunk.count("word2x") == 2000 for chunk in chunks)
+
+
+def _q(text: str, parts: list[str] = ()) -> Question:
+    return Question(
+        number=1, text=text, parts=[Part(label=chr(97 + i), text=p) for i, p in enumerate(parts)],
+    )
+
+
+def test_merge_drops_truncated_copy_at_seam_and_renumbers():
+    stem = "A ball is thrown upward with speed 20 m/s from a cliff of height 45 m."
+    first = QuestionBatch(questions=[_q("Find the derivative of sin(x)cos(x)."), _q(stem, ["Find the max height."])])
+    second = QuestionBatch(questions=[
+        _q(stem, ["Find the max height.", "Find the time to reach the ground."]),
+        _q("Evaluate the integral of e^x from 0 to 1."),
+    ])
+    merged = merge_batches([first, second])
+
+    assert [q.number for q in merged.questions] == [1, 2, 3]
+    assert len(merged.questions[1].parts) == 2  # the complete copy won
+    assert merged.questions[2].text.startswith("Evaluate")
+
+
+def test_merge_keeps_distinct_short_questions():
+    first = QuestionBatch(questions=[_q("Prove it.")])
+    second = QuestionBatch(questions=[_q("Prove it again."), _q("Show that n^2 is even.")])
+    merged = merge_batches([first, second])
+    # a short stem only merges with an identical one at the seam
+    assert [q.text for q in merged.questions] == ["Prove it.", "Prove it again.", "Show that n^2 is even."]
@@ -0,0 +1,46 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from app.services import lazy_imports, prewarm
+
+
+def test_lazy_module_imports_on_first_use(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    monkeypatch.setattr(lazy_imports, "_registry", {})
+    colorsys = lazy_imports.lazy_module("colorsys")
+    assert "colorsys" not in sys.modules
+
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys" in sys.modules
+    assert "rgb_to_hsv" in vars(colorsys)  # later lookups skip __getattr__
+
+
+def test_app_startup_does_not_import_heavy_modules():
+    code = (
+        "import sys, app.main; "
+        "print(','.join(m for m in ('openai', 'fitz', 'numpy', 'circle_fit') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+@pytest.mark.asyncio
+async def test_prewarm_runs_steps_concurrently_and_reports_outcomes(monkeypatch):
+    async def slow():
+        await asyncio.sleep(0.05)
+
+    async def broken():
+        raise RuntimeError("no tectonic")
+
+    async def stuck():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(prewarm, "_steps", {"a": slow, "b": slow, "broken": broken, "stuck": stuck})
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    outcomes = await prewarm.prewarm(timeout=0.2)
+    assert loop.time() - started < 0.5
+    assert outcomes == {"a": "ok", "b": "ok", "broken": "failed", "stuck": "timeout"}
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import progress
+
+
+@pytest.fixture
+def patches(monkeypatch, mock_http):
+    sent: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(settings, "supabase_service_role_key", "service-key")
+    monkeypatch.setattr(settings, "status_flush_interval", 0.05)
+    mock_http(handler)
+    return sent
+
+
+@pytest.mark.asyncio
+async def test_progress_burst_is_coalesced(patches):
+    await progress.update_document_status("doc-1", status="processing")
+    for i in range(10):
+        await progress.update_progress("doc-1", f"step {i}")
+    assert patches == []  # nothing sent inline
+
+    await asyncio.sleep(0.1)
+    assert patches == [{"status": "processing", "status_message": "step 9"}]
+    await asyncio.sleep(0.06)
+    assert "doc-1" not in progress._writers
+
+
+@pytest.mark.asyncio
+async def test_critical_status_flushes_immediately_with_pending_fields(patches):
+    await progress.update_progress("doc-2", "Almost there, wrapping up...")
+    await progress.update_document_status("doc-2", status="completed", status_message=None)
+
+    assert patches == [{"status_message": None, "status": "completed"}]
+    await asyncio.sleep(0.1)
+    assert len(patches) == 1
+
+
+@pytest.mark.asyncio
+async def test_flushes_are_rate_limited_per_document(patches):
+    await progress.update_progress("doc-3", "a")
+    await asyncio.sleep(0.01)
+    assert patches == [{"status_message": "a"}]  # leading edge goes out right away
+
+    await progress.update_progress("doc-3", "b")
+    await progress.update_progress("doc-3", "c")
+    await asyncio.sleep(0.01)
+    assert len(patches) == 1  # still inside the interval
+
+    await asyncio.sleep(0.06)
+    assert patches == [{"status_message": "a"}, {"status_message": "c"}]
@@ -0,0 +1,73 @@
+from app.services import question_index
+from app.services.question_index import MinHashIndex, normalize, signature
+
+
+def _key(text: str) -> tuple:
+    norm = normalize(text)
+    return signature(norm), (question_index.math_tokens(norm), ())
+
+
+def test_normalize_ignores_numbering_spacing_and_latex_spelling():
+    a = normalize(r"3. Find $\dfrac{dy}{dx}$ if  $y = x^2 \, + 1$.")
+    b = normalize(r"Problem 7: find \(\frac{dy}{dx}\) if \(y = x^{2} + 1\).")
+    assert a == b
+
+
+def test_index_returns_near_duplicate_with_matching_guard():
+    index = MinHashIndex("test", capacity=8)
+    text = (
+        "A block of mass 5 kg slides down a frictionless incline at 30 degrees to the horizontal, "
+        "starting from rest at the top. Find its acceleration along the incline."
+    )
+    index.add(*_key(text), payload="answer-1")
+
+    reworded = (
+        "3.  A block of mass 5 kg slides down a frictionless incline at 30 degrees to the horizontal, "
+        "starting from rest at the top.\nFind the acceleration along the incline."
+    )
+    match = index.query(*_key(reworded), threshold=0.8, label="q")
+    assert match is not None and match.payload == "answer-1"
+
+
+def test_index_rejects_different_numbers():
+    index = MinHashIndex("test", capacity=8)
+    text = "A block of mass 5 kg slides down a frictionless incline at 30 degrees. Find its acceleration."
+    index.add(*_key(text), payload="answer-1")
+
+    changed = text.replace("5 kg", "6 kg")
+    assert index.query(*_key(changed), threshold=0.8, label="q") is None
+
+
+def test_normalize_keeps_grouping():
+    assert normalize(r"$e^{x+1}$") != normalize(r"$e^{x}+1$")
+    assert normalize(r"$e^{x}+1$") == normalize(r"$e^x + 1$")
+
+
+def test_index_rejects_near_duplicates_that_differ_in_math():
+    text = r"Differentiate $f(x) = \sin(3x^2 + 1) \cdot e^{x+1}$ with respect to $x$ and simplify."
+    for changed in (text.replace(r"\sin", r"\cos"), text.replace("e^{x+1}", "e^{x}+1")):
+        index = MinHashIndex("test", capacity=8)
+        index.add(*_key(text), payload="answer-1")
+        assert index.query(*_key(changed), threshold=0.5, label="q") is None
+
+
+def test_index_overwrites_oldest_entry_when_full():
+    index = MinHashIndex("test", capacity=2)
+    texts = [f"Question about topic {name} with enough words to shingle" for name in ("alpha", "beta", "gamma")]
+    for i, text in enumerate(texts):
+        index.add(*_key(text), payload=i)
+
+    assert index.size == 2
+    assert index.query(*_key(texts[0]), threshold=0.95, label="q") is None
+    assert index.query(*_key(texts[2]), threshold=0.95, label="q").payload == 2
+
+
+def test_document_reuse_renames_figures():
+    batch = {"questions": [{"number": 1, "text": "See figure", "figures": ["old.png"], "parts": []}]}
+    mmd = "1. Find the tension in the rope. ![](old.png)"
+    question_index.add_document(mmd, {"old.png": b"figure-bytes"}, batch)
+
+    reused = question_index.find_similar_document(
+        "1. Find the tension in the rope.  ![](new.png)", {"new.png": b"figure-bytes"}, "doc-2",
+    )
+    assert reused == {"questions": [{"number": 1, "text": "See figure", "figures": ["new.png"], "parts": []}]}
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    AdaptiveRateLimiter,
+    estimate_request_tokens,
+)
+
+
+@pytest.mark.asyncio
+async def test_acquire_is_immediate_while_budget_remains():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=60, tokens_per_minute=10_000)
+    started = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire(100)
+    assert time.monotonic() - started < 0.05
+    assert limiter.tokens.level == pytest.approx(9_500, abs=5)
+
+
+@pytest.mark.asyncio
+async def test_empty_bucket_waits_for_refill():
+    # 600 rpm refills one request every 0.1 s
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=600, tokens_per_minute=1_000_000)
+    limiter.requests.level = 0
+    started = time.monotonic()
+    await limiter.acquire(10)
+    assert 0.07 < time.monotonic() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_jump_ahead_of_queued_background_calls():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=600, tokens_per_minute=1_000_000)
+    limiter.requests.level = 0
+    order: list[str] = []
+
+    async def call(name, priority):
+        await limiter.acquire(10, priority)
+        order.append(name)
+
+    background = [asyncio.create_task(call(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(2)]
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(call("ui", PRIORITY_INTERACTIVE))
+    await asyncio.gather(*background, interactive)
+
+    assert order == ["ui", "bg0", "bg1"]
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=60, tokens_per_minute=1_000_000)
+    limiter.requests.level = 0
+    waiter = asyncio.create_task(limiter.acquire(10))
+    await asyncio.sleep(0.01)
+    assert limiter.queued == 1
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert limiter.queued == 0
+
+
+def test_headers_set_capacity_and_level():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=300, tokens_per_minute=1_000_000)
+    limiter.on_success({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "7",
+        "x-ratelimit-limit-tokens": "50000",
+        "x-ratelimit-remaining-tokens": "1200",
+    })
+    assert limiter.requests.capacity == 100
+    assert limiter.requests.level == 7
+    assert limiter.tokens.capacity == 50_000
+    assert limiter.tokens.level == 1_200
+
+
+def test_rate_limited_pauses_and_halves_rate_then_recovers():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=300, tokens_per_minute=1_000_000)
+    limiter.on_rate_limited({"retry-after": "3"})
+    assert limiter.scale == 0.5
+    assert limiter.paused_until - time.monotonic() == pytest.approx(3, abs=0.1)
+    assert limiter._wait_time(10, time.monotonic()) > 2.5
+
+    for _ in range(20):
+        limiter.on_success(None)
+    assert limiter.scale == 1.0
+
+
+def test_settle_charges_the_estimate_difference():
+    limiter = AdaptiveRateLimiter("m", requests_per_minute=300, tokens_per_minute=10_000)
+    limiter.settle(estimated_tokens=1_000, actual_tokens=3_000)
+    assert limiter.tokens.level == 8_000
+
+
+def test_estimate_request_tokens_counts_text_and_images():
+    assert estimate_request_tokens("x" * 400, system_prompt="y" * 400) == 200
+    assert estimate_request_tokens("", images=[b"a", b"b"]) == 2_000
@@ -0,0 +1,59 @@
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import storage
+from app.services.tracing import PipelineTrace, span, start_trace
+
+
+@pytest.fixture
+def bucket(monkeypatch, mock_http):
+    objects: dict[str, bytes] = {}
+    uploads: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        key = request.url.path.removeprefix("/storage/v1/object/")
+        if request.method == "GET":
+            return httpx.Response(200, content=objects[key])
+        uploads.append(request)
+        objects[key] = await request.aread()
+        return httpx.Response(200)
+
+    monkeypatch.setattr(settings, "supabase_url", "http://supabase.test")
+    monkeypatch.setattr(storage, "CHUNK_SIZE", 1024)
+    mock_http(handler)
+    return objects, uploads
+
+
+@pytest.mark.asyncio
+async def test_download_streams_to_file(bucket, tmp_path):
+    objects, _ = bucket
+    data = bytes(range(256)) * 50
+    objects["documents/u1/d1/original.pdf"] = data
+
+    dest = tmp_path / "original.pdf"
+    size = await storage.download_document_pdf_file("u1", "d1", dest)
+    assert size == len(data)
+    assert dest.read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_upload_streams_file_with_length(bucket, tmp_path):
+    objects, uploads = bucket
+    data = b"%PDF-1.7\n" + b"x" * 5000
+    src = tmp_path / "output.pdf"
+    src.write_bytes(data)
+
+    await storage.upload_document_pdf_file("u1", "d1", src)
+    assert objects["documents/u1/d1/output.pdf"] == data
+    assert uploads[0].headers["content-length"] == str(len(data))
+    assert uploads[0].headers["x-upsert"] == "true"
+
+
+def test_trace_records_peak_rss_and_stage():
+    trace = start_trace()
+    with span("merge"):
+        pass
+    assert isinstance(trace, PipelineTrace)
+    assert trace.peak_rss_bytes > 0
+    assert trace.summary()["peak_rss_stage"] == "merge"
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.routers import transcribe
+from app.services import strokes_sessions
+from app.services.strokes_sessions import StrokesSessionPool
+
+
+@pytest.fixture
+def mathpix(monkeypatch, mock_http):
+    """Fake Mathpix: counts created sessions, rejects tokens listed in ``revoked``."""
+    state = {"created": 0, "strokes": [], "revoked": set()}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v3/app-tokens":
+            await asyncio.sleep(0.01)
+            state["created"] += 1
+            n = state["created"]
+            return httpx.Response(200, json={"app_token": f"token-{n}", "strokes_session_id": f"session-{n}"})
+        token = request.headers["app_token"]
+        if token in state["revoked"]:
+            return httpx.Response(401, json={"error": "expired"})
+        state["strokes"].append(token)
+        count = len(json.loads(request.content)["strokes"]["strokes"]["x"])
+        return httpx.Response(200, json={"latex_styled": f"x_{count}"})
+
+    monkeypatch.setattr(settings, "mathpix_app_id", "app-id")
+    monkeypatch.setattr(settings, "mathpix_app_key", "app-key")
+    monkeypatch.setattr(settings, "mathpix_api_base", "http://mathpix.test")
+    mock_http(handler)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_active_session_is_reused(mathpix):
+    pool = StrokesSessionPool(spares=0, lifetime=300)
+    first = await pool.acquire("u1")
+    second = await pool.acquire("u1")
+    other = await pool.acquire("u2")
+
+    assert first is second and first.requests == 2
+    assert other.session_id != first.session_id
+    assert mathpix["created"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_requests_share_one_session(mathpix):
+    pool = StrokesSessionPool(spares=0, lifetime=300)
+    sessions = await asyncio.gather(*(pool.acquire("u1") for _ in range(5)))
+    assert len({s.session_id for s in sessions}) == 1
+    assert mathpix["created"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expiring_session_is_replaced_from_spares(mathpix):
+    pool = StrokesSessionPool(spares=2, lifetime=300)
+    await pool.fill()
+    assert pool.stats()["spares"] == 2 and mathpix["created"] == 2
+
+    first = await pool.acquire("u1")
+    assert mathpix["created"] == 2  # came from a spare
+    first.expires_at -= 290  # within EXPIRY_MARGIN_SECONDS
+    second = await pool.acquire("u1")
+    assert second is not first
+    assert second.session_id in {"session-1", "session-2"}
+
+    await asyncio.sleep(0.05)  # background refill
+    assert pool.stats()["spares"] == 2
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_spares_are_refreshed_before_they_expire(mathpix):
+    pool = StrokesSessionPool(spares=2, lifetime=strokes_sessions.EXPIRY_MARGIN_SECONDS + 0.1)
+    await pool.fill()
+    assert mathpix["created"] == 2
+
+    await asyncio.sleep(0.15)  # both spares past the margin; the timer refilled them
+    assert mathpix["created"] == 4 and pool.stats()["spares"] == 2
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_rejected_pooled_session_is_replaced_once(mathpix, monkeypatch):
+    pool = StrokesSessionPool(spares=0, lifetime=300)
+    monkeypatch.setattr(transcribe, "pool", pool)
+    session = await pool.acquire("u1")
+    mathpix["revoked"].add(session.app_token)
+
+    latex = await transcribe._transcribe("u1", [{"x": [0, 1], "y": [0, 1]}], None)
+    assert latex == "x_1"
+    assert mathpix["strokes"] == ["token-2"]
+    assert (await pool.acquire("u1")).app_token == "token-2"
+
+
+def test_module_pool_uses_settings():
+    assert strokes_sessions.pool.spares_target == settings.strokes_session_spares
+    assert strokes_sessions.pool.lifetime == settings.strokes_session_seconds
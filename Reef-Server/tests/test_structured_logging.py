@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import queue
+
+import pytest
+
+from app.services.structured_logging import (
+    JSONFormatter,
+    SamplingFilter,
+    _ContextQueueHandler,
+    bind,
+    bind_fields,
+)
+from app.services.tracing import span
+
+
+def _record(msg="hello %s", args=("world",), level=logging.INFO, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("app.test", level, __file__, 10, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def _enqueue(record: logging.LogRecord) -> logging.LogRecord:
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    _ContextQueueHandler(q).handle(record)
+    return q.get_nowait()
+
+
+def test_queue_handler_attaches_bound_fields_without_formatting():
+    formatted = []
+
+    class Lazy:
+        def __str__(self):
+            formatted.append(True)
+            return "value"
+
+    with bind(document_id="doc-1", user_id="user-1"):
+        queued = _enqueue(_record("x=%s", (Lazy(),)))
+
+    assert formatted == []  # message built later, on the listener thread
+    entry = json.loads(JSONFormatter().format(queued))
+    assert formatted == [True]
+    assert entry["msg"] == "x=value"
+    assert entry["document_id"] == "doc-1"
+    assert entry["user_id"] == "user-1"
+    assert entry["level"] == "INFO"
+
+
+def test_bind_is_scoped_and_explicit_extra_wins():
+    with bind(stage="ocr"):
+        with bind(stage="parse"):
+            assert _enqueue(_record()).stage == "parse"
+        assert _enqueue(_record(stage="custom")).stage == "custom"
+    assert not hasattr(_enqueue(_record()), "stage")
+
+
+@pytest.mark.asyncio
+async def test_task_fields_and_span_stage():
+    async def pipeline():
+        bind_fields(document_id="doc-9")
+        with span("compile.attempt"):
+            return _enqueue(_record())
+
+    record = await asyncio.create_task(pipeline())
+    assert record.document_id == "doc-9"
+    assert record.stage == "compile"
+    assert not hasattr(_enqueue(_record()), "document_id")  # task-local
+
+
+def test_sampling_keeps_every_nth_record_per_call_site():
+    sampler = SamplingFilter()
+    kept = [sampler.filter(_record(sample=5)) for _ in range(20)]
+    assert sum(kept) == 4
+    assert all(sampler.filter(_record()) for _ in range(5))
+    assert all(sampler.filter(_record(level=logging.WARNING, sample=5)) for _ in range(5))
+
+
+def test_sample_hint_is_not_emitted():
+    entry = json.loads(JSONFormatter().format(_record(sample=5)))
+    assert "sample" not in entry
@@ -0,0 +1,88 @@
+import contextvars
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import tracing
+from app.services.tracing import PipelineTrace, SpanRecord
+
+
+def _trace(*spans: tuple) -> PipelineTrace:
+    """A trace of ``(name, start, end, attributes)`` spans."""
+    trace = PipelineTrace()
+    for name, start, end, *attributes in spans:
+        trace.spans.append(SpanRecord(name, start, end, attributes[0] if attributes else {}))
+    return trace
+
+
+def test_stage_seconds_is_wall_extent_of_overlapping_spans():
+    trace = _trace(
+        ("ocr.submit", 0.0, 1.0),
+        ("ocr.poll", 1.0, 4.0),
+        ("compile.question", 5.0, 8.0, {"question": "1"}),
+        ("compile.question", 6.0, 7.0, {"question": "2"}),
+    )
+    assert trace.stage_seconds() == {"ocr": 4.0, "compile": 3.0}
+
+
+def test_summary_totals_spans_and_splits_compile_from_fix_per_question():
+    trace = _trace(
+        ("compile.question", 0.0, 2.0, {"question": "1"}),
+        ("compile.fix", 2.0, 2.5, {"question": "1"}),
+        ("compile.question", 2.5, 3.5, {"question": "1"}),
+        ("compile.question", 0.0, 1.0, {"question": "2"}),
+        ("parse.llm", 0.0, 1.0, {"question": "1"}),  # not a compile span
+    )
+    trace.spans[1].error = "RuntimeError"
+    summary = trace.summary()
+
+    assert summary["questions"] == {
+        "1": {"attempts": 2, "compile_seconds": 3.0, "fix_seconds": 0.5},
+        "2": {"attempts": 1, "compile_seconds": 1.0, "fix_seconds": 0.0},
+    }
+    assert summary["spans"]["compile.question"] == {"count": 3, "total": 4.0, "max": 2.0, "errors": 0}
+    assert summary["spans"]["compile.fix"]["errors"] == 1
+    assert summary["stages"] == {"compile": 3.5, "parse": 1.0}
+
+
+def test_columns_cover_every_stage_column():
+    cols = _trace(("download.pdf", 0.0, 0.25), ("upload.pdf", 1.0, 1.5)).columns()
+    assert {k for k in cols if k.endswith("_seconds")} == {f"{s}_seconds" for s in tracing.STAGE_COLUMNS}
+    assert cols["download_seconds"] == 0.25 and cols["upload_seconds"] == 0.5
+    assert cols["ocr_seconds"] == 0.0
+    assert cols["stage_timings"]["stages"] == {"download": 0.25, "upload": 0.5}
+
+
+class _RecordingTracer:
+    def __init__(self):
+        self.exceptions: list[BaseException] = []
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        """Like OTel's default ``record_exception=True``: records what propagates out."""
+        try:
+            yield tracing._NoopSpan()
+        except BaseException as e:
+            self.exceptions.append(e)
+            raise
+
+
+def test_span_records_error_on_trace_and_tracer(monkeypatch):
+    tracer = _RecordingTracer()
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+
+    def run() -> PipelineTrace:
+        trace = tracing.start_trace()
+        with tracing.span("merge.pages", pages=3) as s:
+            s.set_attribute("bytes", 10)
+        with pytest.raises(ValueError):
+            with tracing.span("upload.pdf"):
+                raise ValueError("storage down")
+        return trace
+
+    trace = contextvars.copy_context().run(run)  # keep the trace out of other tests
+    merge, upload = trace.spans
+    assert merge.error is None and merge.attributes == {"pages": 3, "bytes": 10}
+    assert upload.error == "ValueError" and upload.end >= upload.start
+    assert [str(e) for e in tracer.exceptions] == ["storage down"]  # recorded once
+    assert trace.summary()["spans"]["upload.pdf"]["errors"] == 1
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from app.services.transcription_coordinator import TranscriptionCoordinator
+
+CANVAS = ("u1", "doc-1", "Q1a")
+
+
+def _run(calls: list[str], value: str, seconds: float = 0.0):
+    async def run() -> str:
+        calls.append(value)
+        await asyncio.sleep(seconds)
+        return value
+    return run
+
+
+@pytest.mark.asyncio
+async def test_burst_is_debounced_into_one_run():
+    coordinator = TranscriptionCoordinator(debounce=0.05, max_wait=1.0)
+    calls: list[str] = []
+
+    async def submit(i: int) -> str:
+        await asyncio.sleep(i * 0.01)
+        return await coordinator.submit(CANVAS, _run(calls, f"strokes-{i}"))
+
+    results = await asyncio.gather(*(submit(i) for i in range(5)))
+    assert calls == ["strokes-4"]
+    assert results == ["strokes-4"] * 5
+    assert coordinator.stats() == {"canvases": 0, "requests": 5, "runs": 1, "superseded": 0}
+
+
+@pytest.mark.asyncio
+async def test_newer_request_cancels_run_in_flight():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=1.0)
+    calls: list[str] = []
+    cancelled = asyncio.Event()
+
+    async def slow() -> str:
+        calls.append("old")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "old"
+
+    first = asyncio.create_task(coordinator.submit(CANVAS, slow))
+    await asyncio.sleep(0.05)
+    second = await coordinator.submit(CANVAS, _run(calls, "new"))
+
+    assert cancelled.is_set()
+    assert second == "new" and await first == "new"
+    assert calls == ["old", "new"]
+    assert coordinator.superseded == 1
+
+
+@pytest.mark.asyncio
+async def test_canvases_are_independent():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=1.0)
+    calls: list[str] = []
+    results = await asyncio.gather(
+        coordinator.submit(CANVAS, _run(calls, "a")),
+        coordinator.submit(("u1", "doc-1", "Q1b"), _run(calls, "b")),
+    )
+    assert results == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=1.0)
+
+    async def broken() -> str:
+        raise RuntimeError("mathpix down")
+
+    results = await asyncio.gather(
+        coordinator.submit(CANVAS, broken), coordinator.submit(CANVAS, broken), return_exceptions=True,
+    )
+    assert [str(r) for r in results] == ["mathpix down"] * 2
+
+
+@pytest.mark.asyncio
+async def test_long_running_run_is_kept_after_max_wait():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=0.05)
+    calls: list[str] = []
+    first = asyncio.create_task(coordinator.submit(CANVAS, _run(calls, "old", 0.1)))
+    await asyncio.sleep(0.07)  # in flight and past max_wait
+    second = await coordinator.submit(CANVAS, _run(calls, "new"))
+
+    assert await first == "old" and second == "new"
+    assert calls == ["old", "new"] and coordinator.superseded == 0
+
+
+@pytest.mark.asyncio
+async def test_run_queued_behind_kept_run_never_overlaps_it():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=0.05)
+    calls: list[str] = []
+    running = []
+    overlaps = []
+
+    def tracked(value: str, seconds: float):
+        async def run() -> str:
+            overlaps.append(len(running))
+            running.append(value)
+            calls.append(value)
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                running.remove(value)
+            return value
+        return run
+
+    r1 = asyncio.create_task(coordinator.submit(CANVAS, tracked("r1", 0.15)))
+    await asyncio.sleep(0.07)  # r1 in flight past max_wait: kept
+    r2 = asyncio.create_task(coordinator.submit(CANVAS, tracked("r2", 0)))
+    await asyncio.sleep(0.02)  # r2 started, queued behind r1
+    r3 = await coordinator.submit(CANVAS, tracked("r3", 0))  # cancels r2
+
+    assert await r1 == "r1" and await r2 == "r3" and r3 == "r3"
+    assert calls == ["r1", "r3"] and overlaps == [0, 0]
+    assert coordinator.superseded == 1 and coordinator.stats()["canvases"] == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_request_stops_its_run():
+    coordinator = TranscriptionCoordinator(debounce=0.01, max_wait=1.0)
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow() -> str:
+        started.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "x"
+
+    request = asyncio.create_task(coordinator.submit(CANVAS, slow))
+    await started.wait()
+    request.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert coordinator.stats()["canvases"] == 0